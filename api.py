@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import hmac
+import json
+import re
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+import config
+import federation
+import heartbeat
+import migrations
+import occupancy
+import services
+import snapshot
+import sweeper
+from db import Database
+
+# Local HTTP/JSON API for kiosks and PC agents. Runs the same service
+# functions as the Streamlit pages; blocking SQLite calls are handed to
+# worker threads so one slow request never stalls the event loop.
+
+MAX_BODY = 64 * 1024
+
+ROUTES = []
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def route(method, pattern, admin=False):
+    # admin: True, or a function of the request body telling whether this
+    # request needs the admin token
+    def decorator(handler):
+        ROUTES.append((method, re.compile(f'^{pattern}$'), handler, admin))
+        return handler
+    return decorator
+
+
+def _check_admin(headers):
+    if not config.API_ADMIN_TOKEN:
+        raise HTTPError(HTTPStatus.FORBIDDEN, 'admin routes are disabled: set CYBER_CAFE_API_ADMIN_TOKEN')
+    expected = f'Bearer {config.API_ADMIN_TOKEN}'
+    if not hmac.compare_digest(headers.get('authorization', '').encode(), expected.encode()):
+        raise HTTPError(HTTPStatus.UNAUTHORIZED, 'admin token required')
+
+
+def _require(body, *fields):
+    missing = [f for f in fields if f not in body]
+    if missing:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"missing field(s): {', '.join(missing)}")
+    return [body[f] for f in fields]
+
+
+@route('GET', '/computers')
+def list_computers(db, body, query):
+    return services.computer_status(db)
+
+
+@route('GET', '/computers/available')
+def list_available_computers(db, body, query):
+    # ?user_id= also lists the PCs held for that customer's reservation
+    user_id = query.get('user_id')
+    return services.available_computers(db, int(user_id) if user_id else None)
+
+
+@route('GET', '/computers/free')
+def list_free_computers(db, body, query):
+    # ?start=...&end=... (UTC, end exclusive): PCs that can be reserved for that window
+    start, end = query.get('start'), query.get('end')
+    if not start or not end:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'start and end are required')
+    return services.free_computers(db, start, end)
+
+
+@route('GET', '/floor')
+def floor_changes(db, body, query):
+    # Poll with ?since=<version from the previous response> to get only the
+    # cards that changed; omit it for the full floor.
+    state = services.floor_state(db)
+    if 'since' not in query:
+        version, cards = state.snapshot()
+        return {'version': version, 'computers': cards, 'removed': []}
+    version, changed, removed = state.changes_since(int(query['since']))
+    return {'version': version, 'computers': changed, 'removed': removed}
+
+
+@route('POST', '/computers/(?P<computer_id>[0-9]+)/maintenance')
+def create_maintenance(db, body, query, computer_id):
+    description, technician = _require(body, 'description', 'technician')
+    if services.get_computer(db, int(computer_id)) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, 'computer not found')
+    log_id = services.schedule_maintenance(db, int(computer_id), description, technician)
+    return HTTPStatus.CREATED, {'id': log_id}
+
+
+@route('POST', '/computers/(?P<computer_id>[0-9]+)/heartbeat')
+def computer_heartbeat(db, body, query, computer_id):
+    # Agents ping every few seconds; the ping is queued and written in the
+    # next batch, so a 202 means accepted, not yet stored.
+    cpu, ram, logged_in = _require(body, 'cpu', 'ram', 'logged_in')
+    if not isinstance(logged_in, bool):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'logged_in must be true or false')
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (cpu, ram)):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'cpu and ram must be numbers')
+    heartbeat.get(db).submit(int(computer_id), float(cpu), float(ram), logged_in)
+    return HTTPStatus.ACCEPTED, {'queued': True}
+
+
+@route('GET', '/computers/health')
+def list_computer_health(db, body, query):
+    return services.computer_health(db)
+
+
+@route('GET', '/computers/(?P<computer_id>[0-9]+)/telemetry')
+def computer_telemetry(db, body, query, computer_id):
+    return services.computer_telemetry(db, int(computer_id), min(int(query.get('minutes', 60)), 24 * 60))
+
+
+@route('GET', '/inventory')
+def list_inventory(db, body, query):
+    # ?low=1 lists only the items at or below their reorder level
+    if query.get('low'):
+        return services.low_stock(db)
+    return services.inventory_items(db)
+
+
+@route('POST', '/sales')
+def create_sale(db, body, query):
+    # {"items": [{"item_id", "quantity"}, ...], "session_id"?, "sold_by"?}
+    (items,) = _require(body, 'items')
+    if not isinstance(items, list) or not items or not all(
+        isinstance(item, dict)
+        and all(isinstance(item.get(key), int) and not isinstance(item.get(key), bool)
+                for key in ('item_id', 'quantity'))
+        for item in items
+    ):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'items must be a non-empty list of {"item_id", "quantity"} integers')
+    lines = [(item['item_id'], item['quantity']) for item in items]
+    session_id, sold_by = body.get('session_id'), body.get('sold_by')
+    total = services.sell_items(db, lines, int(session_id) if session_id is not None else None,
+                                int(sold_by) if sold_by is not None else None)
+    return HTTPStatus.CREATED, {'total': total}
+
+
+@route('POST', '/inventory/(?P<item_id>[0-9]+)/restock')
+def restock_item(db, body, query, item_id):
+    (quantity,) = _require(body, 'quantity')
+    if int(quantity) <= 0:
+        raise ValueError('quantity must be positive')
+    services.restock(db, int(item_id), int(quantity))
+    return {'id': int(item_id)}
+
+
+@route('GET', '/maintenance')
+def list_maintenance(db, body, query):
+    # Follow 'next' from the response as ?before= for older entries.
+    computer_id = query.get('computer_id')
+    return services.maintenance_page(
+        db,
+        limit=min(int(query.get('limit', 10)), 500),
+        before=query.get('before'),
+        computer_id=int(computer_id) if computer_id else None,
+        technician=query.get('technician'),
+        start=query.get('start'),
+        end=query.get('end'),
+    )
+
+
+@route('GET', '/users/search', admin=True)
+def search_users(db, body, query):
+    # Prefix search, cheap enough to call on every keystroke: ?q=jo%20smi.
+    # Admin only, like the Customers page: results carry emails.
+    return services.search_customers(db, query.get('q', ''), min(int(query.get('limit', 20)), 100))
+
+
+@route('GET', '/users/(?P<user_id>[0-9]+)/history', admin=True)
+def user_history(db, body, query, user_id):
+    # Follow 'next' from the response as ?before= for older sessions.
+    if services.get_user(db, int(user_id)) is None:
+        raise HTTPError(HTTPStatus.NOT_FOUND, 'user not found')
+    return services.customer_sessions(
+        db, int(user_id), limit=min(int(query.get('limit', 20)), 500), before=query.get('before'),
+    )
+
+
+@route('GET', '/users/(?P<user_id>[0-9]+)/sessions')
+def list_active_sessions(db, body, query, user_id):
+    return services.active_sessions(db, int(user_id))
+
+
+@route('POST', '/sessions')
+def create_session(db, body, query):
+    # Optional "hours": how long the customer paid for
+    user_id, computer_id = _require(body, 'user_id', 'computer_id')
+    hours = body.get('hours')
+    session_id = services.start_session(db, int(user_id), int(computer_id),
+                                        float(hours) if hours is not None else None)
+    return HTTPStatus.CREATED, {'id': session_id}
+
+
+@route('POST', '/sessions/end', admin=lambda body: body.get('all') is True)
+def close_sessions(db, body, query):
+    # Closing-time run: {"session_ids": [...]} closes those; {"all": true}
+    # closes every open session and needs the admin token.
+    if body.get('all') is True:
+        return services.end_sessions(db, None)
+    session_ids = body.get('session_ids')
+    if not isinstance(session_ids, list) or not session_ids:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'session_ids must be a non-empty list, or send {"all": true}')
+    return services.end_sessions(db, [int(session_id) for session_id in session_ids])
+
+
+@route('GET', '/sessions/swept', admin=True)
+def list_swept_sessions(db, body, query):
+    return services.swept_sessions(db, min(int(query.get('limit', 20)), 500))
+
+
+@route('POST', '/sessions/(?P<session_id>[0-9]+)/end')
+def close_session(db, body, query, session_id):
+    duration, cost = services.end_session(db, int(session_id))
+    items = services.session_items(db, int(session_id))
+    items_total = sum(item['amount'] for item in items)
+    return {'id': int(session_id), 'duration': duration, 'cost': cost,
+            'items': items, 'items_total': items_total, 'total_due': cost + items_total}
+
+
+@route('GET', '/reservations')
+def list_reservations(db, body, query):
+    user_id = query.get('user_id')
+    return services.upcoming_reservations(db, int(user_id) if user_id else None)
+
+
+@route('POST', '/reservations')
+def create_reservation(db, body, query):
+    # {"user_id", "computer_ids": [...], "start", "end"}; a group booking is all or nothing
+    user_id, computer_ids, start, end = _require(body, 'user_id', 'computer_ids', 'start', 'end')
+    ids = services.create_reservation(db, int(user_id), [int(c) for c in computer_ids], start, end)
+    return HTTPStatus.CREATED, {'ids': ids}
+
+
+@route('POST', '/reservations/(?P<reservation_id>[0-9]+)/cancel')
+def cancel_reservation(db, body, query, reservation_id):
+    user_id = body.get('user_id')
+    services.cancel_reservation(db, int(reservation_id), int(user_id) if user_id is not None else None)
+    return {'id': int(reservation_id), 'status': 'cancelled'}
+
+
+@route('GET', '/dashboard')
+def dashboard(db, body, query):
+    # ?scope=all merges every branch in CYBER_CAFE_BRANCHES
+    if query.get('scope') == 'all':
+        return federation.dashboard_metrics()
+    analytics = snapshot.get(db)
+    metrics = services.dashboard_metrics(analytics.database())
+    # The floor counts are for running the room now, not history: read them live
+    metrics['available_computers'], metrics['maintenance_count'] = services.floor_counts(db)
+    metrics['snapshot_age'] = analytics.age()
+    return metrics
+
+
+@route('GET', '/trends')
+def trends(db, body, query):
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD (exclusive)&granularity=hour|day|week|month
+    start, end = query.get('start'), query.get('end')
+    if not start or not end:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'start and end are required')
+    analytics = snapshot.get(db)
+    reader = analytics.database()
+    result = services.usage_trends(reader, start, end, query.get('granularity', 'day'))
+    result['computers'] = services.computer_usage(reader, start, end)
+    result['snapshot_age'] = analytics.age()
+    return result
+
+
+@route('GET', '/occupancy')
+def occupancy_report(db, body, query):
+    # 7 x 24 grids, Monday first; ?computer_id= for a single PC
+    computer_id = query.get('computer_id')
+    analytics = snapshot.get(db)
+    model = occupancy.get(db.path)
+    model.refresh(analytics.database())
+    result = model.report(int(computer_id) if computer_id else None)
+    result['snapshot_age'] = analytics.age()
+    return result
+
+
+async def dispatch(db, method, target, raw_body, headers=None):
+    url = urlsplit(target)
+    allowed = False
+    for route_method, pattern, handler, admin in ROUTES:
+        match = pattern.match(url.path)
+        if not match:
+            continue
+        if route_method != method:
+            allowed = True
+            continue
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            if not isinstance(body, dict):
+                raise ValueError('body must be a JSON object')
+            query = dict(parse_qsl(url.query))
+            if admin is True or (admin and admin(body)):
+                _check_admin(headers or {})
+            result = await asyncio.to_thread(handler, db, body, query, **match.groupdict())
+        except HTTPError as e:
+            return e.status, {'error': str(e)}
+        except services.SessionConflict as e:
+            return HTTPStatus.CONFLICT, {'error': str(e), 'retryable': True}
+        except (services.ReservationConflict, services.OutOfStock, services.SessionNotOpen) as e:
+            return HTTPStatus.CONFLICT, {'error': str(e), 'retryable': False}
+        except ValueError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+        if isinstance(result, tuple):
+            return result
+        return HTTPStatus.OK, result
+    if allowed:
+        return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'method not allowed'}
+    return HTTPStatus.NOT_FOUND, {'error': 'not found'}
+
+
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'request body too large')
+    body = await reader.readexactly(length) if length else b''
+    keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+    return method, target, headers, body, keep_alive
+
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload, default=str).encode()
+    head = (
+        f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+        'Content-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        '\r\n'
+    )
+    return head.encode('latin-1') + body
+
+
+async def handle_connection(db, reader, writer):
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except HTTPError as e:
+                writer.write(_response(e.status, {'error': str(e)}, False))
+                break
+            except ValueError:
+                writer.write(_response(HTTPStatus.BAD_REQUEST, {'error': 'malformed request'}, False))
+                break
+            if request is None:
+                break
+            method, target, headers, body, keep_alive = request
+            status, payload = await dispatch(db, method, target, body, headers)
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(db, host=config.API_HOST, port=config.API_PORT):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(db, reader, writer), host, port
+    )
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the cyber cafe HTTP/JSON API.')
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--host', default=config.API_HOST)
+    parser.add_argument('--port', type=int, default=config.API_PORT)
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    migrations.migrate(db)
+    sweeper.get(db).start()
+    print(f'Serving on http://{args.host}:{args.port}')
+    try:
+        asyncio.run(serve(db, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        heartbeat.stop_all()
+        snapshot.stop_all()
+        sweeper.stop_all()
+        db.close()
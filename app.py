@@ -1,10 +1,23 @@
 import streamlit as st
+import functools
+import json
+import os
 import sqlite3
-from datetime import datetime, timedelta
-import pandas as pd
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 from streamlit_option_menu import option_menu
-import plotly.express as px
-import plotly.graph_objects as go
+
+# pandas, plotly and pyarrow are imported inside the pages that use them, so
+# the login page and a kiosk restart don't pay for loading them.
+import cache
+import config
+import instrumentation
+import migrations
+import services
+import snapshot
+import sweeper
+from db import Database
 
 
 # Page configuration
@@ -120,91 +133,39 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Initialize the database
+# Shared connection pool, created once per Streamlit server process
+@st.cache_resource
+def get_db():
+    instrumentation.install()
+    return Database(config.DB_PATH)
+
+# Initialize the database, once per server process rather than on every rerun
+@st.cache_resource(show_spinner=False)
 def init_db():
-    conn = sqlite3.connect('cyber_cafe.db')
-    cursor = conn.cursor()
-
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT DEFAULT 'user',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Create computers table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS computers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            status TEXT DEFAULT 'available',
-            specifications TEXT,
-            last_maintenance TIMESTAMP,
-            hourly_rate REAL DEFAULT 30.0
-        )
-    ''')
-
-    # Create sessions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            computer_id INTEGER,
-            start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            end_time TIMESTAMP,
-            duration INTEGER,
-            cost REAL,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (computer_id) REFERENCES computers (id)
-        )
-    ''')
-
-    # Create maintenance_logs table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS maintenance_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            computer_id INTEGER,
-            maintenance_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            description TEXT,
-            technician TEXT,
-            FOREIGN KEY (computer_id) REFERENCES computers (id)
-        )
-    ''')
-
-    # Create inventory table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS inventory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            item_name TEXT NOT NULL,
-            quantity INTEGER DEFAULT 0,
-            price_per_item REAL,
-            category TEXT,
-            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Insert sample computers if none exist
-    cursor.execute('SELECT COUNT(*) FROM computers')
-    if cursor.fetchone()[0] == 0:
-        sample_computers = [
-            ('PC-01', 'available', 'Intel i5, 16GB RAM, RTX 3060', datetime.now(), 30.0),
-            ('PC-02', 'available', 'Intel i7, 32GB RAM, RTX 3070', datetime.now(), 35.0),
-            ('PC-03', 'available', 'AMD Ryzen 7, 16GB RAM, RX 6700', datetime.now(), 30.0)
-        ]
-        cursor.executemany('''
-            INSERT INTO computers (name, status, specifications, last_maintenance, hourly_rate)
-            VALUES (?, ?, ?, ?, ?)
-        ''', sample_computers)
-
-    conn.commit()
-    conn.close()
+    db = get_db()
+    migrations.migrate(db)
+
+    with db.transaction() as cursor:
+        # Insert sample computers if none exist
+        cursor.execute('SELECT COUNT(*) FROM computers')
+        if cursor.fetchone()[0] == 0:
+            sample_computers = [
+                ('PC-01', 'available', 'Intel i5, 16GB RAM, RTX 3060', datetime.now(), 30.0),
+                ('PC-02', 'available', 'Intel i7, 32GB RAM, RTX 3070', datetime.now(), 35.0),
+                ('PC-03', 'available', 'AMD Ryzen 7, 16GB RAM, RX 6700', datetime.now(), 30.0)
+            ]
+            cursor.executemany('''
+                INSERT INTO computers (name, status, specifications, last_maintenance, hourly_rate)
+                VALUES (?, ?, ?, ?, ?)
+            ''', sample_computers)
+
+# Closes forgotten sessions while the app is up; one per server process
+@st.cache_resource(show_spinner=False)
+def start_sweeper():
+    sweeper.get(get_db()).start()
 
 # Authentication functions
+@instrumentation.page
 def register_user():
     st.subheader("📝 Register New User")
     with st.form("register_form"):
@@ -223,18 +184,14 @@ def register_user():
                 st.error("Passwords do not match!")
                 return
             
-            conn = sqlite3.connect('cyber_cafe.db')
-            cursor = conn.cursor()
             try:
-                cursor.execute('INSERT INTO users (name, email, password) VALUES (?, ?, ?)',
-                             (name, email, password))
-                conn.commit()
+                get_db().execute('INSERT INTO users (name, email, password) VALUES (?, ?, ?)',
+                                 (name, email, password))
                 st.success("Registration successful! Please login.")
             except sqlite3.IntegrityError:
                 st.error("Email already exists!")
-            finally:
-                conn.close()
 
+@instrumentation.page
 def login_user():
     st.subheader("🔐 User Login")
     with st.form("login_form"):
@@ -243,56 +200,47 @@ def login_user():
         submit = st.form_submit_button("Login")
         
         if submit:
-            conn = sqlite3.connect('cyber_cafe.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE email = ? AND password = ?',
-                         (email, password))
-            user = cursor.fetchone()
-            conn.close()
+            user = services.authenticate(get_db(), email, password)
             
             if user:
-                st.session_state['user'] = {
-                    'id': user[0],
-                    'name': user[1],
-                    'email': user[2],
-                    'role': user[4]
-                }
-                st.success(f"Welcome back, {user[1]}!")
+                st.session_state['user'] = user
+                st.success(f"Welcome back, {user['name']}!")
                 st.experimental_rerun()
             else:
                 st.error("Invalid credentials!")
 
 # Session management functions
+@instrumentation.page
 def start_session():
     st.subheader("🎮 Start New Session")
     
-    conn = sqlite3.connect('cyber_cafe.db')
-    cursor = conn.cursor()
+    db = get_db()
     
-    # Get available computers
-    cursor.execute('SELECT id, name, specifications, hourly_rate FROM computers WHERE status = "available"')
-    available_computers = cursor.fetchall()
+    # Get available computers, including any held for this user's reservation
+    available_computers = services.available_computers(db, st.session_state['user']['id'])
     
     if not available_computers:
         st.warning("No computers available at the moment.")
-        conn.close()
         return
     
     with st.form("start_session_form"):
         # Create a more detailed computer selection
-        computer_options = {f"{pc[1]} (₹{pc[3]}/hr) - {pc[2]}": pc[0] for pc in available_computers}
+        computer_options = {f"{pc['name']} (₹{pc['hourly_rate']}/hr) - {pc['specifications']}": pc['id'] for pc in available_computers}
         selected_computer = st.selectbox(
             "Select Computer",
             options=list(computer_options.keys())
         )
         
         hours = st.number_input("Estimated Hours", min_value=0.5, max_value=12.0, value=1.0, step=0.5)
+        # Only prepaid time becomes the session's booked end; otherwise the
+        # hours are an estimate and the session stays open until ended.
+        prepaid = st.checkbox("Prepaid: close the session automatically when these hours run out")
         
         col1, col2 = st.columns(2)
         with col1:
             start_button = st.form_submit_button("Start Session")
         with col2:
-            estimated_cost = hours * next(pc[3] for pc in available_computers if pc[0] == computer_options[selected_computer])
+            estimated_cost = hours * next(pc['hourly_rate'] for pc in available_computers if pc['id'] == computer_options[selected_computer])
             st.write(f"Estimated Cost: ₹{estimated_cost:.2f}")
         
         if start_button:
@@ -300,162 +248,385 @@ def start_session():
             user_id = st.session_state['user']['id']
             
             try:
-                # Start new session
-                cursor.execute('''
-                    INSERT INTO sessions (user_id, computer_id, start_time)
-                    VALUES (?, ?, CURRENT_TIMESTAMP)
-                ''', (user_id, computer_id))
-                
-                # Update computer status
-                cursor.execute('UPDATE computers SET status = "in-use" WHERE id = ?',
-                             (computer_id,))
-                
-                conn.commit()
+                services.start_session(db, user_id, computer_id, hours if prepaid else None)
                 st.success("Session started successfully!")
                 
                 # Show session details
+                duration = (f"Paid Duration: {hours} hours (closed automatically after that)"
+                            if prepaid else f"Estimated Duration: {hours} hours")
                 st.info(f"""
                     Session Details:
                     - Computer: {selected_computer.split(' (')[0]}
                     - Start Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-                    - Estimated Duration: {hours} hours
+                    - {duration}
                     - Estimated Cost: ₹{estimated_cost:.2f}
                 """)
                 
+            except services.SessionConflict as e:
+                st.warning(f"{e} Please try again.")
+            except services.ReservationConflict as e:
+                st.warning(str(e))
             except sqlite3.Error as e:
                 st.error(f"Error starting session: {e}")
-    
-    conn.close()
 
+@instrumentation.page
 def end_session():
     st.subheader("⏹️ End Active Session")
     
-    conn = sqlite3.connect('cyber_cafe.db')
-    cursor = conn.cursor()
+    db = get_db()
     
     # Get active sessions for the current user
-    cursor.execute('''
-        SELECT 
-            s.id,
-            c.name,
-            s.start_time,
-            c.hourly_rate
-        FROM sessions s
-        JOIN computers c ON s.computer_id = c.id
-        WHERE s.user_id = ? AND s.end_time IS NULL
-    ''', (st.session_state['user']['id'],))
-    
-    active_sessions = cursor.fetchall()
+    active_sessions = services.active_sessions(db, st.session_state['user']['id'])
     
     if not active_sessions:
         st.info("No active sessions found.")
-        conn.close()
         return
     
     for session in active_sessions:
-        session_id, computer_name, start_time, hourly_rate = session
-        start_time = datetime.fromisoformat(start_time)
-        duration = (datetime.now() - start_time).total_seconds() / 3600  # hours
+        session_id = session['id']
+        computer_name = session['computer_name']
+        hourly_rate = session['hourly_rate']
+        duration = session['duration']  # hours, computed in SQL
         cost = duration * hourly_rate
         
         st.markdown(f"""
             <div class="custom-div">
                 <h4>{computer_name}</h4>
-                <p>Started: {start_time.strftime('%Y-%m-%d %H:%M:%S')}</p>
+                <p>Started: {session['start_time']}</p>
                 <p>Duration: {duration:.2f} hours</p>
                 <p>Cost: ₹{cost:.2f}</p>
             </div>
         """, unsafe_allow_html=True)
         
+        items = services.session_items(db, session_id)
+        items_total = sum(item['amount'] for item in items)
+        if items:
+            st.caption("Desk items: " + ", ".join(f"{i['quantity']} × {i['item_name']}" for i in items)
+                       + f" · ₹{items_total:.2f}")
+        
         if st.button(f"End Session {session_id}"):
             try:
-                # Update session
-                cursor.execute('''
-                    UPDATE sessions 
-                    SET end_time = CURRENT_TIMESTAMP,
-                        duration = ?,
-                        cost = ?
-                    WHERE id = ?
-                ''', (duration, cost, session_id))
-                
-                # Update computer status
-                cursor.execute('''
-                    UPDATE computers 
-                    SET status = "available" 
-                    WHERE id = (
-                        SELECT computer_id 
-                        FROM sessions 
-                        WHERE id = ?
-                    )
-                ''', (session_id,))
-                
-                conn.commit()
+                duration, cost = services.end_session(db, session_id)
                 st.success(f"""
                     Session ended successfully!
                     Final Duration: {duration:.2f} hours
-                    Total Cost: ₹{cost:.2f}
+                    Total Cost: ₹{cost + items_total:.2f}
                 """)
                 st.experimental_rerun()
                 
+            except (services.SessionConflict, services.SessionNotOpen) as e:
+                st.warning(str(e))
             except sqlite3.Error as e:
                 st.error(f"Error ending session: {e}")
+
+# Reservations are stored in UTC like every other timestamp; the page takes
+# and shows local time.
+def local_time(timestamp):
+    utc = datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
+    return utc.astimezone().strftime('%a %d %b %H:%M')
+
+def reserve_computers(labels, user_id, start, end):
+    computer_ids = [labels[label] for label in st.session_state.get('reservation_selection', [])]
+    try:
+        ids = services.create_reservation(get_db(), user_id, computer_ids, start, end)
+        st.session_state['reservation_message'] = ('success', f"Reserved {len(ids)} computer(s).")
+        st.session_state['reservation_selection'] = []
+    except (services.ReservationConflict, services.SessionConflict, ValueError) as e:
+        st.session_state['reservation_message'] = ('warning', str(e))
+
+def cancel_booking(reservation_id, user_id):
+    try:
+        services.cancel_reservation(get_db(), reservation_id, user_id)
+        st.session_state['reservation_message'] = ('success', "Reservation cancelled.")
+    except services.ReservationConflict as e:
+        st.session_state['reservation_message'] = ('warning', str(e))
+
+@instrumentation.page
+def show_reservations():
+    st.subheader("📅 Reservations")
+    
+    db = get_db()
+    user = st.session_state['user']
+    is_admin = user['role'] == 'admin'
+    
+    if 'reservation_message' in st.session_state:
+        kind, text = st.session_state.pop('reservation_message')
+        getattr(st, kind)(text)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        day = st.date_input("Date", datetime.now().date(), min_value=datetime.now().date())
+    with col2:
+        at = st.time_input("From", datetime(2000, 1, 1, 18).time(), step=1800)
+    with col3:
+        hours = st.number_input("Hours", min_value=0.5, max_value=12.0, value=2.0, step=0.5)
+    start = datetime.combine(day, at).astimezone(timezone.utc)
+    end = start + timedelta(hours=hours)
     
-    conn.close()
+    free = services.free_computers(db, start, end)
+    labels = {f"{pc['name']} (₹{pc['hourly_rate']}/hr) - {pc['specifications']}": pc['id'] for pc in free}
+    # Keep only picks still free for the window now shown
+    st.session_state['reservation_selection'] = [
+        label for label in st.session_state.get('reservation_selection', []) if label in labels
+    ]
+    if not free:
+        st.warning("No computers are free for that time.")
+    else:
+        chosen = st.multiselect(f"{len(free)} computers free", list(labels.keys()), key='reservation_selection')
+        st.button("Reserve", type="primary", disabled=not chosen,
+                  on_click=reserve_computers, args=(labels, user['id'], start, end))
+    
+    st.markdown("#### Upcoming reservations")
+    upcoming = services.upcoming_reservations(db, None if is_admin else user['id'])
+    if not upcoming:
+        st.info("No upcoming reservations.")
+    for r in upcoming:
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            who = f" · {r['user_name']}" if is_admin else ""
+            st.write(f"**{r['computer_name']}** · {local_time(r['start_time'])} – {local_time(r['end_time'])}{who}")
+        with col2:
+            st.button("Cancel", key=f"cancel_reservation_{r['id']}", on_click=cancel_booking,
+                      args=(r['id'], None if is_admin else user['id']))
 
 # Computer management functions
+@functools.lru_cache(maxsize=1024)
+def status_card_html(name, status, specifications, last_maintenance, current_user, session_start, agent=''):
+    # Cached, so every argument must be hashable: the agent line comes in
+    # already rendered by health_html()
+    status_color = {
+        'available': 'green',
+        'in-use': 'orange',
+        'maintenance': 'red'
+    }.get(status, 'grey')
+    
+    return f"""
+        <div class="status-card" style="border-left: 5px solid {status_color}">
+            <h3>{name}</h3>
+            <p><strong>Status:</strong> {status.title()}</p>
+            <p><strong>Specs:</strong> {specifications}</p>
+            <p><strong>Last Maintenance:</strong> {last_maintenance}</p>
+            {f'<p><strong>Current User:</strong> {current_user}</p>' if current_user else ''}
+            {f'<p><strong>Session Start:</strong> {session_start}</p>' if session_start else ''}
+            {agent}
+        </div>
+    """
+
+def health_html(health):
+    line = (f"<p><strong>Agent:</strong> {health['health'].title()} · CPU {health['cpu']:.0f}% · "
+            f"RAM {health['ram']:.0f}% · seen {health['age_seconds']:.0f}s ago</p>")
+    if health['warning']:
+        line += f"<p style='color: red'>⚠ {health['warning']}</p>"
+    return line
+
+# Compact floor grid: every tile goes to the browser in one HTML payload and
+# the filtering and paging happen there, so a 200-PC floor is one element
+# for Streamlit to render and diff instead of hundreds. The payload only
+# changes when a card or an agent's health does, and the filters are kept
+# in sessionStorage so they survive the refresh when it does.
+FLOOR_GRID_HTML = """
+<style>
+  body { margin: 0; font-family: sans-serif; color: #f0f0f0; }
+  .bar { display: flex; gap: 8px; align-items: center; flex-wrap: wrap; margin-bottom: 8px; }
+  .bar select, .bar input, .bar button {
+    background: #1a1a1a; color: #f0f0f0; border: 1px solid #00ff9d55; border-radius: 4px; padding: 4px 8px;
+  }
+  .bar button:disabled { opacity: 0.4; }
+  .count { color: #00ffff; font-size: 0.85rem; }
+  .grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(118px, 1fr)); gap: 6px; }
+  .tile {
+    background: linear-gradient(145deg, #1a1a1a, #2a2a2a); border-radius: 6px;
+    border-left: 5px solid grey; padding: 6px 8px; font-size: 0.78rem; line-height: 1.35;
+  }
+  .tile.available { border-left-color: green; }
+  .tile.in-use { border-left-color: orange; }
+  .tile.maintenance { border-left-color: red; }
+  .name { color: #00ffff; font-weight: bold; }
+  .dot { display: inline-block; width: 8px; height: 8px; border-radius: 50%; margin-left: 4px; background: grey; }
+  .dot.online { background: #00ff9d; }
+  .dot.stale { background: orange; }
+  .dot.offline { background: red; }
+  .muted { color: #aaa; }
+</style>
+<div class="bar">
+  <select id="status"><option value="">All statuses</option><option>available</option><option>in-use</option><option>maintenance</option></select>
+  <select id="zone"><option value="">All zones</option></select>
+  <input id="search" placeholder="PC or user">
+  <button id="prev">&lsaquo;</button><span class="count" id="count"></span><button id="next">&rsaquo;</button>
+</div>
+<div class="grid" id="grid"></div>
+<script>
+const tiles = __TILES__;
+const pageSize = __PAGE_SIZE__;
+const $ = (id) => document.getElementById(id);
+let state = {status: '', zone: '', search: '', page: 0};
+try { state = Object.assign(state, JSON.parse(sessionStorage.getItem('floorGrid') || '{}')); } catch (e) {}
+
+for (const zone of [...new Set(tiles.map((t) => t.zone))].sort()) {
+  const option = document.createElement('option');
+  option.textContent = zone;
+  $('zone').appendChild(option);
+}
+$('status').value = state.status;
+$('zone').value = state.zone;
+$('search').value = state.search;
+
+function line(text, cls) {
+  const div = document.createElement('div');
+  div.textContent = text;
+  if (cls) div.className = cls;
+  return div;
+}
+
+function render() {
+  try { sessionStorage.setItem('floorGrid', JSON.stringify(state)); } catch (e) {}
+  const needle = state.search.toLowerCase();
+  const shown = tiles.filter((t) =>
+    (!state.status || t.status === state.status) &&
+    (!state.zone || t.zone === state.zone) &&
+    (!needle || t.name.toLowerCase().includes(needle) || (t.user || '').toLowerCase().includes(needle)));
+  const pages = Math.max(1, Math.ceil(shown.length / pageSize));
+  state.page = Math.min(state.page, pages - 1);
+  $('count').textContent = `${shown.length} of ${tiles.length} PCs · page ${state.page + 1}/${pages}`;
+  $('prev').disabled = state.page === 0;
+  $('next').disabled = state.page >= pages - 1;
+
+  const grid = $('grid');
+  grid.replaceChildren();
+  for (const t of shown.slice(state.page * pageSize, (state.page + 1) * pageSize)) {
+    const tile = document.createElement('div');
+    tile.className = `tile ${t.status}`;
+    tile.title = [t.specs, t.since && `Session since ${t.since}`, t.maintained && `Last maintenance ${t.maintained}`,
+                  t.warning && `⚠ ${t.warning}`].filter(Boolean).join('\\n');
+    const name = line(`${t.name} `, 'name');
+    const dot = document.createElement('span');
+    dot.className = `dot ${t.health}`;
+    dot.title = `Agent: ${t.health}`;
+    name.appendChild(dot);
+    if (t.warning) name.appendChild(document.createTextNode(' ⚠'));
+    tile.appendChild(name);
+    tile.appendChild(line(`${t.zone} · ${t.status}`, 'muted'));
+    if (t.user) tile.appendChild(line(t.user));
+    grid.appendChild(tile);
+  }
+}
+
+$('status').onchange = (e) => { state.status = e.target.value; state.page = 0; render(); };
+$('zone').onchange = (e) => { state.zone = e.target.value; state.page = 0; render(); };
+$('search').oninput = (e) => { state.search = e.target.value; state.page = 0; render(); };
+$('prev').onclick = () => { state.page -= 1; render(); };
+$('next').onclick = () => { state.page += 1; render(); };
+render();
+</script>
+"""
+
+def floor_grid_html(computers, health):
+    tiles = []
+    for c in computers:
+        h = health.get(c['id'])
+        tiles.append({
+            'id': c['id'],
+            'name': c['name'],
+            'zone': c['zone'] or 'Unassigned',
+            'status': c['status'],
+            'user': c['current_user'],
+            'since': c['session_start'],
+            'specs': c['specifications'],
+            'maintained': c['last_maintenance'],
+            # Health state only, not the ping age or load: those change on
+            # every refresh and would rebuild the grid each time
+            'health': h['health'] if h else 'unknown',
+            'warning': h['warning'] if h else None,
+        })
+    return (FLOOR_GRID_HTML
+            .replace('__PAGE_SIZE__', str(config.FLOOR_GRID_PAGE_SIZE))
+            .replace('__TILES__', json.dumps(tiles).replace('</', '<\\/')))
+
+def queue_maintenance(choices):
+    label = st.session_state.get('floor_action_pc')
+    if label in choices:
+        st.session_state['maintenance_computer_id'] = choices[label]
+        st.session_state['show_maintenance_form'] = True
+
+@instrumentation.page
 def show_computer_status():
     st.subheader("💻 Computer Status")
+    show_floor()
+
+# Re-runs on its own every few seconds; each viewer only pulls the cards that
+# changed since its last refresh, and unchanged cards keep identical markup.
+@st.fragment(run_every=config.FLOOR_REFRESH_SECONDS)
+@instrumentation.page
+def show_floor():
+    state = services.floor_state(get_db())
     
-    conn = sqlite3.connect('cyber_cafe.db')
-    cursor = conn.cursor()
-    
-    # Get all computers with their current status
-    cursor.execute('''
-        SELECT 
-            c.id,
-            c.name,
-            c.status,
-            c.specifications,
-            c.last_maintenance,
-            CASE 
-                WHEN s.id IS NOT NULL THEN u.name 
-                ELSE NULL 
-            END as current_user,
-            s.start_time
-        FROM computers c
-        LEFT JOIN sessions s ON c.id = s.computer_id AND s.end_time IS NULL
-        LEFT JOIN users u ON s.user_id = u.id
-    ''')
-    computers = cursor.fetchall()
+    if 'floor_cards' not in st.session_state:
+        version, cards = state.snapshot()
+        st.session_state['floor_cards'] = {card['id']: card for card in cards}
+    else:
+        version, changed, removed = state.changes_since(st.session_state['floor_version'])
+        for card in changed:
+            st.session_state['floor_cards'][card['id']] = card
+        for computer_id in removed:
+            st.session_state['floor_cards'].pop(computer_id, None)
+    st.session_state['floor_version'] = version
+    computers = sorted(st.session_state['floor_cards'].values(), key=lambda c: c['id'])
+    # Agent pings are not part of the floor state: they change every few
+    # seconds whether or not anything happened, so they are read fresh here.
+    health = services.computer_health(get_db())
+    if health:
+        counts = Counter(h['health'] for h in health.values())
+        warnings = sum(1 for h in health.values() if h['warning'])
+        st.caption(f"Agents: {counts['online']} online · {counts['stale']} stale · "
+                   f"{counts['offline']} offline · {len(computers) - len(health)} never reported"
+                   + (f" · ⚠ {warnings} need attention" if warnings else ""))
     
-    # Display computers in a grid
-    cols = st.columns(3)
-    for idx, computer in enumerate(computers):
-        with cols[idx % 3]:
-            status_color = {
-                'available': 'green',
-                'in-use': 'orange',
-                'maintenance': 'red'
-            }.get(computer[2], 'grey')
-            
-            st.markdown(f"""
-                <div class="status-card" style="border-left: 5px solid {status_color}">
-                    <h3>{computer[1]}</h3>
-                    <p><strong>Status:</strong> {computer[2].title()}</p>
-                    <p><strong>Specs:</strong> {computer[3]}</p>
-                    <p><strong>Last Maintenance:</strong> {computer[4]}</p>
-                    {f'<p><strong>Current User:</strong> {computer[5]}</p>' if computer[5] else ''}
-                    {f'<p><strong>Session Start:</strong> {computer[6]}</p>' if computer[6] else ''}
-                </div>
-            """, unsafe_allow_html=True)
-            
-            if computer[2] != 'maintenance':
-                if st.button(f"Schedule Maintenance {computer[0]}", key=f"maint_{computer[0]}"):
-                    st.session_state['maintenance_computer_id'] = computer[0]
-                    st.session_state['show_maintenance_form'] = True
+    compact = st.toggle("Compact grid", value=len(computers) > config.FLOOR_GRID_THRESHOLD, key='floor_compact')
+    if compact:
+        with instrumentation.span('computers.render'):
+            rows = -(-min(len(computers), config.FLOOR_GRID_PAGE_SIZE) // 6)
+            st.iframe(floor_grid_html(computers, health), height=min(60 + rows * 78, 900))
+        
+        # One picker for the whole floor instead of a button per computer
+        choices = {
+            f"{c['name']} · {c['zone'] or 'Unassigned'}": c['id']
+            for c in computers if c['status'] != 'maintenance'
+        }
+        if st.session_state.get('floor_action_pc') not in choices:
+            st.session_state['floor_action_pc'] = None
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.selectbox("Computer", list(choices.keys()), key='floor_action_pc',
+                         placeholder="Pick a computer", label_visibility="collapsed")
+        with col2:
+            st.button("Schedule Maintenance", key='floor_action_maintenance',
+                      disabled=st.session_state['floor_action_pc'] is None,
+                      on_click=queue_maintenance, args=(choices,))
+        if st.session_state.get('show_maintenance_form'):
+            st.caption("A maintenance form is waiting on the Maintenance page.")
+        return
     
-    conn.close()
+    # Display computers in a grid
+    with instrumentation.span('computers.render'):
+        cols = st.columns(3)
+        for idx, computer in enumerate(computers):
+            with cols[idx % 3]:
+                st.markdown(status_card_html(
+                    computer['name'],
+                    computer['status'],
+                    computer['specifications'],
+                    computer['last_maintenance'],
+                    computer['current_user'],
+                    computer['session_start'],
+                    health_html(health[computer['id']]) if computer['id'] in health else '',
+                ), unsafe_allow_html=True)
+                
+                if computer['status'] != 'maintenance':
+                    if st.button(f"Schedule Maintenance {computer['id']}", key=f"maint_{computer['id']}"):
+                        st.session_state['maintenance_computer_id'] = computer['id']
+                        st.session_state['show_maintenance_form'] = True
 
+@instrumentation.page
 def manage_maintenance():
     st.subheader("🔧 Maintenance Management")
     
@@ -465,17 +636,15 @@ def manage_maintenance():
         show_maintenance_history()
 
 def schedule_maintenance(computer_id):
-    conn = sqlite3.connect('cyber_cafe.db')
-    cursor = conn.cursor()
+    db = get_db()
     
     # Get computer details
-    cursor.execute('SELECT name, specifications FROM computers WHERE id = ?', (computer_id,))
-    computer = cursor.fetchone()
+    computer = services.get_computer(db, computer_id)
     
     st.markdown(f"""
         <div class="custom-div">
-            <h3>Schedule Maintenance for {computer[0]}</h3>
-            <p>{computer[1]}</p>
+            <h3>Schedule Maintenance for {computer['name']}</h3>
+            <p>{computer['specifications']}</p>
         </div>
     """, unsafe_allow_html=True)
     
@@ -505,177 +674,684 @@ def schedule_maintenance(computer_id):
         
         if st.form_submit_button("Schedule"):
             try:
-                # Add maintenance log
-                cursor.execute('''
-                    INSERT INTO maintenance_logs 
-                    (computer_id, description, technician)
-                    VALUES (?, ?, ?)
-                ''', (computer_id, f"{maintenance_type}: {description}", technician))
-                
-                # Update computer status
-                cursor.execute('''
-                    UPDATE computers 
-                    SET status = 'maintenance',
-                        last_maintenance = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (computer_id,))
-                
-                conn.commit()
+                services.schedule_maintenance(db, computer_id, f"{maintenance_type}: {description}", technician)
                 st.success("Maintenance scheduled successfully!")
                 st.session_state['show_maintenance_form'] = False
                 st.experimental_rerun()
                 
             except sqlite3.Error as e:
                 st.error(f"Error scheduling maintenance: {e}")
-    
-    conn.close()
 
 def show_maintenance_history():
     st.subheader("Maintenance History")
+    db = get_db()
     
-    conn = sqlite3.connect('cyber_cafe.db')
-    cursor = conn.cursor()
+    computers = {pc['name']: pc['id'] for pc in services.computer_status(db)}
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        computer = st.selectbox("Computer", ["All"] + list(computers.keys()))
+    with col2:
+        technician = st.text_input("Technician").strip()
+    with col3:
+        dates = st.date_input("Date range", value=(), format="YYYY-MM-DD")
     
-    cursor.execute('''
-        SELECT 
-            c.name,
-            m.maintenance_date,
-            m.description,
-            m.technician
-        FROM maintenance_logs m
-        JOIN computers c ON m.computer_id = c.id
-        ORDER BY m.maintenance_date DESC
-        LIMIT 10
-    ''')
+    filters = {
+        'computer_id': computers.get(computer),
+        'technician': technician or None,
+        'start': dates[0].isoformat() if len(dates) > 0 else None,
+        'end': (dates[1] + timedelta(days=1)).isoformat() if len(dates) > 1 else None,
+    }
+    # Cursors of the pages seen so far; start over whenever a filter changes.
+    if st.session_state.get('maintenance_filters') != filters:
+        st.session_state['maintenance_filters'] = filters
+        st.session_state['maintenance_cursors'] = [None]
+    cursors = st.session_state['maintenance_cursors']
     
-    maintenance_history = cursor.fetchall()
+    page = services.maintenance_page(db, limit=10, before=cursors[-1], **filters)
+    maintenance_history = page['records']
     
     if maintenance_history:
         for record in maintenance_history:
             st.markdown(f"""
                 <div class="custom-div">
-                    <h4>{record[0]}</h4>
-                    <p>📅 {record[1]}</p>
-                    <p>👨‍🔧 {record[3]}</p>
-                    <p>{record[2]}</p>
+                    <h4>{record['computer_name']}</h4>
+                    <p>📅 {record['maintenance_date']}</p>
+                    <p>👨‍🔧 {record['technician']}</p>
+                    <p>{record['description']}</p>
                 </div>
             """, unsafe_allow_html=True)
     else:
         st.info("No maintenance history available")
     
-    conn.close()
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        st.button("← Newer", disabled=len(cursors) == 1, on_click=cursors.pop)
+    with col2:
+        st.button("Older →", disabled=page['next'] is None, on_click=cursors.append, args=(page['next'],))
+    with col3:
+        st.caption(f"Page {len(cursors)}")
 
 # Dashboard functions
+# Reports read the analytics snapshot rather than the live database. The
+# snapshot version only keys the caches: each new copy makes the next view
+# reload, while writes in between no longer do.
+def get_analytics():
+    return snapshot.get(get_db())
+
+def snapshot_caption(analytics):
+    age = analytics.age()
+    when = f"{age:.0f}s" if age < 120 else f"{age / 60:.0f} min"
+    return f"Figures from the analytics snapshot taken {when} ago."
+
+@st.cache_data(ttl=config.DASHBOARD_CACHE_TTL, max_entries=4, show_spinner=False)
+def load_dashboard_metrics(version):
+    return services.dashboard_metrics(get_analytics().database())
+
+PERIODS = {'hour': 'Hourly', 'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly'}
+
+@st.cache_resource(ttl=config.DASHBOARD_CACHE_TTL, max_entries=16, show_spinner=False)
+def load_trend_figures(version, start, end, granularity):
+    db = get_analytics().database()
+    trends = services.usage_trends(db, start, end, granularity)
+    usage_dist = services.computer_usage(db, start, end)
+    return trends, build_dashboard_figures(trends['points'], usage_dist, PERIODS[trends['granularity']])
+
+# Other branches' writes don't bump this process's generation, so the
+# head-office view relies on the TTL alone.
+@st.cache_resource(ttl=config.DASHBOARD_CACHE_TTL, max_entries=1, show_spinner=False)
+def load_federated_dashboard():
+    import federation
+    
+    with instrumentation.span('dashboard.federated'):
+        metrics = federation.dashboard_metrics()
+    return metrics, build_dashboard_figures(metrics['usage_data'], metrics['usage_dist'])
+
+def build_dashboard_figures(usage_data, usage_dist, period="Daily"):
+    import pandas as pd
+    import plotly.express as px
+    import plotly.graph_objects as go
+    
+    figures = {}
+    
+    if usage_data:
+        with instrumentation.span('dashboard.dataframe'):
+            df = pd.DataFrame(usage_data, columns=['date', 'session_count', 'revenue'])
+        with instrumentation.span('dashboard.figures'):
+            figures['sessions'] = px.line(df, x='date', y='session_count', title=f'{period} Sessions')
+            figures['revenue'] = px.line(df, x='date', y='revenue', title=f'{period} Revenue')
+    
+    if usage_dist:
+        with instrumentation.span('dashboard.figures'):
+            fig = go.Figure(data=[
+                go.Bar(
+                    x=[u[0] for u in usage_dist],
+                    y=[u[1] for u in usage_dist]
+                )
+            ])
+            fig.update_layout(title='Sessions per Computer')
+        figures['usage_dist'] = fig
+    
+    return figures
+
+# The model keeps its sums between snapshots and only folds in what changed,
+# so a new version costs a few new sessions rather than a full recount.
+@st.cache_resource(ttl=config.DASHBOARD_CACHE_TTL, max_entries=8, show_spinner=False)
+def load_occupancy_figures(version, computer_id):
+    import occupancy
+    
+    model = occupancy.get(get_db().path)
+    with instrumentation.span('dashboard.occupancy'):
+        model.refresh(get_analytics().database())
+        report = model.report(computer_id)
+    return report, build_occupancy_figures(report, computer_id is None)
+
+def build_occupancy_figures(report, all_computers):
+    import plotly.graph_objects as go
+    
+    hours = [f"{hour:02d}:00" for hour in range(24)]
+    # Average PCs in use alongside the share when looking at the whole floor
+    hover = "%{y} %{x}: %{z:.0%}" + (" · %{customdata:.1f} PCs" if all_computers else "") + "<extra></extra>"
+    
+    def heatmap(occupancy, busy, title):
+        fig = go.Figure(data=go.Heatmap(
+            z=occupancy, customdata=busy, x=hours, y=report['days'],
+            zmin=0, zmax=1, colorscale='YlOrRd', hovertemplate=hover,
+        ))
+        fig.update_layout(title=title, yaxis_autorange='reversed')
+        return fig
+    
+    with instrumentation.span('dashboard.figures'):
+        figures = {'heatmap': heatmap(report['occupancy'], report['busy'], f"Average occupancy since {report['since']}")}
+        forecast = report['forecast']
+        if forecast:
+            figures['forecast'] = heatmap(
+                forecast['occupancy'], forecast['busy'], f"Forecast for the week of {forecast['week_of']}"
+            )
+    return figures
+
+def show_occupancy(version):
+    st.subheader("Occupancy by Hour of Week")
+    computers = {pc['name']: pc['id'] for pc in services.computer_status(get_analytics().database())}
+    choice = st.selectbox("Computers", ["All computers", *computers], key='occupancy_computer')
+    report, figures = load_occupancy_figures(version, computers.get(choice))
+    peak = report['peak']
+    if choice == "All computers":
+        st.caption(f"Busiest hour: {peak['day']} {peak['hour']:02d}:00, "
+                   f"{peak['busy']:.1f} of {report['computers']} PCs in use on average.")
+    else:
+        st.caption(f"Busiest hour: {peak['day']} {peak['hour']:02d}:00, in use {peak['occupancy']:.0%} of the time.")
+    
+    tab1, tab2 = st.tabs([f"Last {report['weeks']} weeks", "Next week"])
+    with tab1:
+        st.plotly_chart(figures['heatmap'], use_container_width=True)
+    with tab2:
+        if 'forecast' in figures:
+            st.caption(f"Each hour averages the last {report['forecast']['from_weeks']} full weeks, "
+                       "the most recent weighted highest.")
+            st.plotly_chart(figures['forecast'], use_container_width=True)
+        else:
+            st.info("A forecast needs at least one full week of sessions.")
+
+@instrumentation.page
 def show_dashboard():
     st.subheader("📊 Dashboard")
     
-    conn = sqlite3.connect('cyber_cafe.db')
-    cursor = conn.cursor()
+    scope = "This branch"
+    if config.BRANCHES and st.session_state['user']['role'] == 'admin':
+        scope = st.radio("Scope", ["This branch", "All branches"], horizontal=True)
+    
+    figures = None
+    if scope == "All branches":
+        metrics, figures = load_federated_dashboard()
+        show_branch_status(metrics['branches'])
+    else:
+        analytics = get_analytics()
+        analytics.database()
+        version = analytics.version
+        metrics = load_dashboard_metrics(version)
+        # Staff run the floor from these two, so they come from the live database
+        metrics['available_computers'], metrics['maintenance_count'] = services.floor_counts(get_db())
+        st.caption(f"{snapshot_caption(analytics)} Computer counts are live.")
     
-    # Get key metrics
+    # Key metrics
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        cursor.execute('SELECT COUNT(*) FROM sessions WHERE DATE(start_time) = DATE("now")')
-        today_sessions = cursor.fetchone()[0]
         st.markdown(f"""
             <div class="metric-card">
                 <h3>Today's Sessions</h3>
-                <h2>{today_sessions}</h2>
+                <h2>{metrics['today_sessions']}</h2>
             </div>
         """, unsafe_allow_html=True)
     
     with col2:
-        cursor.execute('SELECT COUNT(*) FROM computers WHERE status = "available"')
-        available_computers = cursor.fetchone()[0]
         st.markdown(f"""
             <div class="metric-card">
                 <h3>Available Computers</h3>
-                <h2>{available_computers}</h2>
+                <h2>{metrics['available_computers']}</h2>
             </div>
         """, unsafe_allow_html=True)
     
     with col3:
-        cursor.execute('SELECT COUNT(*) FROM computers WHERE status = "maintenance"')
-        maintenance_count = cursor.fetchone()[0]
         st.markdown(f"""
             <div class="metric-card">
                 <h3>In Maintenance</h3>
-                <h2>{maintenance_count}</h2>
+                <h2>{metrics['maintenance_count']}</h2>
             </div>
         """, unsafe_allow_html=True)
     
     with col4:
-        cursor.execute('SELECT SUM(cost) FROM sessions WHERE DATE(start_time) = DATE("now")')
-        today_revenue = cursor.fetchone()[0] or 0
         st.markdown(f"""
             <div class="metric-card">
                 <h3>Today's Revenue</h3>
-                <h2>₹{today_revenue:.2f}</h2>
+                <h2>₹{metrics['today_revenue']:.2f}</h2>
             </div>
         """, unsafe_allow_html=True)
     
     # Usage trends
     st.subheader("Usage Trends")
-    cursor.execute('''
-        SELECT 
-            DATE(start_time) as date,
-            COUNT(*) as session_count,
-            SUM(cost) as daily_revenue
-        FROM sessions
-        WHERE start_time >= DATE('now', '-30 days')
-        GROUP BY DATE(start_time)
-        ORDER BY date
-    ''')
-    usage_data = cursor.fetchall()
+    if figures is None:
+        today = datetime.now().date()
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            dates = st.date_input("Date range", (today - timedelta(days=29), today), max_value=today)
+        with col2:
+            granularity = st.selectbox("Granularity", ["Hour", "Day", "Week", "Month"], index=1).lower()
+        if len(dates) != 2:
+            st.info("Pick an end date.")
+            return
+        trends, figures = load_trend_figures(
+            version, dates[0].isoformat(), (dates[1] + timedelta(days=1)).isoformat(), granularity
+        )
+        if trends['granularity'] != granularity:
+            st.caption(f"Showing {PERIODS[trends['granularity']].lower()} points: this range has too many {granularity}s to plot.")
+        if trends['stride'] > 1:
+            st.caption(f"Each point sums {trends['stride']} {trends['granularity']}s.")
+    else:
+        st.caption("Last 30 days, all branches.")
     
-    if usage_data:
-        df = pd.DataFrame(usage_data, columns=['date', 'session_count', 'daily_revenue'])
-        
+    if 'sessions' in figures:
         tab1, tab2 = st.tabs(["Sessions", "Revenue"])
         
         with tab1:
-            fig = px.line(df, x='date', y='session_count', title='Daily Sessions')
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(figures['sessions'], use_container_width=True)
         
         with tab2:
-            fig = px.line(df, x='date', y='daily_revenue', title='Daily Revenue')
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(figures['revenue'], use_container_width=True)
     
     # Computer usage distribution
     st.subheader("Computer Usage Distribution")
-    cursor.execute('''
-        SELECT 
-            c.name,
-            COUNT(s.id) as session_count
-        FROM computers c
-        LEFT JOIN sessions s ON c.id = s.computer_id
-        GROUP BY c.id, c.name
-    ''')
-    usage_dist = cursor.fetchall()
+    if 'usage_dist' in figures:
+        st.plotly_chart(figures['usage_dist'], use_container_width=True)
     
-    if usage_dist:
-        fig = go.Figure(data=[
-            go.Bar(
-                x=[u[0] for u in usage_dist],
-                y=[u[1] for u in usage_dist]
-            )
-        ])
-        fig.update_layout(title='Sessions per Computer')
-        st.plotly_chart(fig, use_container_width=True)
+    if scope == "This branch":
+        show_occupancy(version)
+
+def show_branch_status(branches):
+    missing = [b for b in branches if b['status'] != 'ok']
+    if missing:
+        st.warning("Not included: " + "; ".join(f"{b['branch']} ({b['error']})" for b in missing))
+    with st.expander(f"Branches ({len(branches) - len(missing)}/{len(branches)} answered)"):
+        for b in branches:
+            if b['status'] == 'ok':
+                st.write(f"**{b['branch']}** · {b['today_sessions']} sessions · ₹{b['today_revenue']:.2f} today · {b['ms']:.0f} ms")
+            else:
+                st.write(f"**{b['branch']}** · {b['status']}")
+
+# Admin functions
+def run_billing(labels, selected_only):
+    # Button callback: runs before the page renders, so the list below
+    # already reflects the closed sessions.
+    chosen = st.session_state.get('billing_selection', [])
+    session_ids = [labels[label] for label in chosen if label in labels] if selected_only else None
+    try:
+        st.session_state['last_bill'] = services.end_sessions(get_db(), session_ids)
+        st.session_state['billing_selection'] = []
+    except services.SessionConflict as e:
+        st.session_state['billing_error'] = str(e)
+    except sqlite3.Error as e:
+        st.session_state['billing_error'] = f"Error closing sessions: {e}"
+
+@instrumentation.page
+def close_sessions():
+    st.subheader("🧾 End-of-Day Billing")
+    
+    if st.session_state['user']['role'] != 'admin':
+        st.error("Admins only.")
+        return
+    
+    if 'billing_error' in st.session_state:
+        st.warning(st.session_state.pop('billing_error'))
+    bill = st.session_state.get('last_bill')
+    if bill:
+        show_bill(bill)
+    
+    swept = services.swept_sessions(get_db())
+    if swept:
+        with st.expander(f"Closed automatically ({len(swept)} most recent)"):
+            for b in swept:
+                st.write(f"**{b['computer_name']}** · {b['user_name'] or 'unknown'} · {b['reason'].replace('_', ' ')} · "
+                         f"{b['start_time']} – {b['end_time']} · {b['duration']:.2f} h · ₹{b['cost']:.2f}")
+    
+    open_sessions = services.active_sessions(get_db())
+    if not open_sessions:
+        st.info("No open sessions.")
+        return
+    
+    labels = {
+        f"{s['computer_name']} · {s['user_name'] or 'unknown'} · since {s['start_time']}": s['id']
+        for s in sorted(open_sessions, key=lambda s: s['computer_name'])
+    }
+    st.write(f"{len(open_sessions)} open sessions")
+    chosen = st.multiselect(
+        "Sessions to close",
+        list(labels.keys()),
+        key='billing_selection',
+        placeholder="Pick sessions, or close all below"
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("Close selected", disabled=not chosen, on_click=run_billing, args=(labels, True))
+    with col2:
+        st.button("Close all open sessions", type="primary", on_click=run_billing, args=(labels, False))
+
+def show_bill(bill):
+    import pandas as pd
+    
+    st.success(f"Closed {bill['count']} sessions at {bill['closed_at']}")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Sessions", bill['count'])
+    col2.metric("Hours", f"{bill['total_hours']:.2f}")
+    col3.metric("Items", f"₹{bill['total_items']:.2f}")
+    col4.metric("Total due", f"₹{bill['total_due']:.2f}")
+    
+    df = pd.DataFrame(bill['sessions'], columns=[
+        'session_id', 'computer_name', 'user_name', 'start_time', 'end_time',
+        'duration', 'hourly_rate', 'cost', 'items_total',
+    ])
+    st.dataframe(df.round({'duration': 2, 'cost': 2, 'items_total': 2}), use_container_width=True, hide_index=True)
+    st.download_button(
+        "Download bill (CSV)",
+        df.to_csv(index=False),
+        file_name=f"bill_{bill['closed_at'].replace(' ', '_').replace(':', '')}.csv",
+        mime="text/csv",
+    )
+
+# Desk point of sale. The catalogue is cached per write generation, the cart
+# lives in session state, and the counter is a fragment, so ringing up an
+# item reruns only the counter and touches the database only when charging.
+@st.cache_data(ttl=config.DASHBOARD_CACHE_TTL, max_entries=4, show_spinner=False)
+def load_inventory(generation):
+    db = get_db()
+    return services.inventory_items(db), services.low_stock(db)
+
+def add_to_cart(item_id):
+    cart = st.session_state.setdefault('cart', {})
+    cart[item_id] = cart.get(item_id, 0) + 1
+
+def remove_from_cart(item_id):
+    cart = st.session_state.setdefault('cart', {})
+    cart[item_id] -= 1
+    if not cart[item_id]:
+        del cart[item_id]
+
+def charge_cart(session_labels):
+    label = st.session_state.get('cart_session')
+    try:
+        total = services.sell_items(get_db(), list(st.session_state.get('cart', {}).items()),
+                                    session_labels.get(label), st.session_state['user']['id'])
+        st.session_state['cart'] = {}
+        where = f" to {label}" if session_labels.get(label) else ""
+        st.session_state['pos_message'] = ('success', f"Charged ₹{total:.2f}{where}.")
+    except (services.OutOfStock, services.SessionConflict, services.SessionNotOpen, ValueError) as e:
+        st.session_state['pos_message'] = ('warning', str(e))
+
+def restock_item(labels):
+    try:
+        services.restock(get_db(), labels[st.session_state['restock_item']], st.session_state['restock_quantity'])
+        st.session_state['pos_message'] = ('success', f"Restocked {st.session_state['restock_item']}.")
+    except ValueError as e:
+        st.session_state['pos_message'] = ('warning', str(e))
+
+@instrumentation.page
+def show_pos():
+    st.subheader("🛒 Desk Sales")
+    
+    if st.session_state['user']['role'] != 'admin':
+        st.error("Admins only.")
+        return
+    pos_counter()
+
+@st.fragment
+def pos_counter():
+    if 'pos_message' in st.session_state:
+        kind, text = st.session_state.pop('pos_message')
+        getattr(st, kind)(text)
+    
+    items, low = load_inventory(cache.generation())
+    by_id = {item['id']: item for item in items}
+    cart = st.session_state.setdefault('cart', {})
+    if low:
+        st.warning("Low stock: " + ", ".join(f"{i['item_name']} ({i['quantity']} left)" for i in low))
+    
+    left, right = st.columns([3, 2])
+    with left:
+        search = st.text_input("Find item", placeholder="Name or category").strip().lower()
+        shown = [i for i in items if search in i['item_name'].lower() or search in (i['category'] or '').lower()]
+        cols = st.columns(3)
+        for idx, item in enumerate(shown):
+            left_in_stock = item['quantity'] - cart.get(item['id'], 0)
+            with cols[idx % 3]:
+                st.button(
+                    f"{item['item_name']} · ₹{item['price_per_item'] or 0:.2f} · {left_in_stock} left",
+                    key=f"pos_item_{item['id']}",
+                    disabled=left_in_stock <= 0,
+                    on_click=add_to_cart,
+                    args=(item['id'],),
+                    use_container_width=True,
+                )
+    
+    with right:
+        st.markdown("#### Cart")
+        total = 0.0
+        for item_id, quantity in list(cart.items()):
+            item = by_id.get(item_id)
+            if item is None:
+                continue
+            amount = quantity * (item['price_per_item'] or 0)
+            total += amount
+            col1, col2 = st.columns([4, 1])
+            col1.write(f"{quantity} × {item['item_name']} · ₹{amount:.2f}")
+            col2.button("−", key=f"pos_remove_{item_id}", on_click=remove_from_cart, args=(item_id,))
+        st.write(f"**Total: ₹{total:.2f}**")
+        
+        session_labels = {"Walk-in (pay now)": None}
+        session_labels.update({
+            f"{s['computer_name']} · {s['user_name'] or 'unknown'}": s['id']
+            for s in sorted(services.active_sessions(get_db()), key=lambda s: s['computer_name'])
+        })
+        st.selectbox("Bill to", list(session_labels.keys()), key='cart_session')
+        st.button("Charge", type="primary", disabled=not cart, on_click=charge_cart, args=(session_labels,))
+    
+    with st.expander("Restock"):
+        labels = {item['item_name']: item['id'] for item in items}
+        if labels:
+            st.selectbox("Item", list(labels.keys()), key='restock_item')
+            st.number_input("Quantity", min_value=1, value=10, step=1, key='restock_quantity')
+            st.button("Restock", on_click=restock_item, args=(labels,))
+
+@instrumentation.page
+def show_customers():
+    st.subheader("👥 Customers")
+    
+    if st.session_state['user']['role'] != 'admin':
+        st.error("Admins only.")
+        return
+    customer_lookup()
+
+# A fragment with a live search box: each pause in typing reruns only this
+# part of the page, and each rerun is one FTS lookup.
+@st.fragment
+def customer_lookup():
+    db = get_db()
+    text = st.text_input(
+        "Search customers", type="search", placeholder="Name or email", live="200ms", key='customer_query'
+    )
+    if not text.strip():
+        st.caption("Start typing a name or email.")
+        return
+    
+    matches = services.search_customers(db, text)
+    if not matches:
+        st.info("No customers match.")
+        return
+    
+    event = st.dataframe(
+        [
+            {
+                'Name': c['name'],
+                'Email': c['email'],
+                'Role': c['role'],
+                'Member since': c['created_at'][:10] if c['created_at'] else '',
+                'Last visit': local_time(c['last_visit']) if c['last_visit'] else '—',
+            }
+            for c in matches
+        ],
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key=f"customer_matches_{text}",
+    )
+    rows = event.selection.rows
+    if rows:
+        customer = matches[rows[0]]
+    elif len(matches) == 1:
+        customer = matches[0]
+    else:
+        st.caption(f"{len(matches)} matches. Select one to see their sessions.")
+        return
+    
+    # Cursors of the history pages seen so far, reset for each customer.
+    if st.session_state.get('history_customer') != customer['id']:
+        st.session_state['history_customer'] = customer['id']
+        st.session_state['history_cursors'] = [None]
+    cursors = st.session_state['history_cursors']
+    history = services.customer_sessions(db, customer['id'], limit=10, before=cursors[-1])
+    totals = history['totals']
+    
+    st.markdown(f"#### {customer['name']} · {customer['email']}")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Sessions", totals['sessions'])
+    col2.metric("Total Spent", f"₹{totals['spent']:.2f}")
+    col3.metric("First Visit", totals['first_visit'][:10] if totals['first_visit'] else "—")
+    
+    if history['records']:
+        st.dataframe(
+            [
+                {
+                    'Computer': h['computer_name'],
+                    'Started': local_time(h['start_time']),
+                    'Ended': local_time(h['end_time']) if h['end_time'] else 'open',
+                    'Hours': round(h['duration'], 2) if h['duration'] is not None else None,
+                    'Cost (₹)': round(h['cost'], 2) if h['cost'] is not None else None,
+                    'Closed by': (h['reason'] or 'desk').replace('_', ' ') if h['end_time'] else '',
+                }
+                for h in history['records']
+            ],
+            hide_index=True,
+        )
+    else:
+        st.info("No sessions yet.")
+    
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        st.button("← Newer", key='history_newer', disabled=len(cursors) == 1, on_click=cursors.pop)
+    with col2:
+        st.button("Older →", key='history_older', disabled=history['next'] is None,
+                  on_click=cursors.append, args=(history['next'],))
+    with col3:
+        st.caption(f"Page {len(cursors)}")
+
+@instrumentation.page
+def show_performance():
+    st.subheader("⏱️ Performance")
+    
+    if st.session_state['user']['role'] != 'admin':
+        st.error("Admins only.")
+        return
+    
+    import pandas as pd
     
-    conn.close()
+    window = instrumentation.WINDOW_SLOTS * instrumentation.SLOT_SECONDS // 60
+    st.caption(f"Rolling {window}-minute window. Percentiles are histogram bucket upper bounds.")
+    
+    stats = pd.DataFrame(instrumentation.summary())
+    tab1, tab2, tab3, tab4 = st.tabs(["Pages", "Spans", "Queries", "Slow Queries"])
+    for tab, kind in ((tab1, 'page'), (tab2, 'span'), (tab3, 'query')):
+        with tab:
+            rows = stats[stats['kind'] == kind].drop(columns='kind') if not stats.empty else stats
+            if rows.empty:
+                st.info("Nothing recorded yet.")
+            else:
+                st.dataframe(rows.round(2), use_container_width=True, hide_index=True)
+    
+    with tab4:
+        if not instrumentation.slow_queries:
+            st.info(f"No statements slower than {config.SLOW_QUERY_MS:.0f} ms.")
+        for slow in list(instrumentation.slow_queries):
+            at = datetime.fromtimestamp(slow['at']).strftime('%Y-%m-%d %H:%M:%S')
+            with st.expander(f"{slow['ms']:.1f} ms · {at} · {slow['sql'][:80]}"):
+                st.code(slow['sql'], language='sql')
+                st.text("\n".join(slow['plan']))
+    
+    st.download_button(
+        "Download Prometheus metrics",
+        instrumentation.prometheus_text(),
+        file_name="cyber_cafe_metrics.prom",
+        mime="text/plain",
+    )
+    if config.METRICS_PATH:
+        st.caption(f"Also written every {config.METRICS_EXPORT_SECONDS:.0f}s to {config.METRICS_PATH}")
+
+@instrumentation.page
+def show_export():
+    st.subheader("📤 Export")
+    
+    if st.session_state['user']['role'] != 'admin':
+        st.error("Admins only.")
+        return
+    
+    import export
+    
+    analytics = get_analytics()
+    analytics.database()
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.caption(f"{snapshot_caption(analytics)} Exports read this copy.")
+    with col2:
+        st.button("Refresh snapshot", on_click=analytics.refresh)
+    
+    computers = {pc['name']: pc['id'] for pc in services.computer_status(get_db())}
+    formats = ["CSV", "Parquet"] if export.pq is not None else ["CSV"]
+    
+    with st.form("export_form"):
+        kind = st.radio("Data", ["Sessions", "Daily revenue"], horizontal=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            start_date = st.date_input("From", datetime.now().date() - timedelta(days=30))
+        with col2:
+            end_date = st.date_input("To (inclusive)", datetime.now().date())
+        selected = st.multiselect("Computers", list(computers.keys()), placeholder="All computers")
+        fmt = st.radio("Format", formats, horizontal=True)
+        submitted = st.form_submit_button("Export")
+    
+    if export.pq is None:
+        st.caption("Install pyarrow to enable Parquet exports.")
+    
+    if submitted:
+        if end_date < start_date:
+            st.error("The end date is before the start date.")
+            return
+        name = 'sessions' if kind == "Sessions" else 'revenue'
+        extension = fmt.lower()
+        # Rows stream straight into a temporary file; only the finished file
+        # is handed to the browser.
+        fd, path = tempfile.mkstemp(suffix=f'.{extension}')
+        os.close(fd)
+        try:
+            with st.spinner("Exporting..."), instrumentation.span('export.write'):
+                count = export.export(
+                    analytics.database(), name, path, extension,
+                    start=start_date.isoformat(),
+                    end=(end_date + timedelta(days=1)).isoformat(),
+                    computer_ids=[computers[pc] for pc in selected],
+                )
+            with open(path, 'rb') as f:
+                st.download_button(
+                    f"Download {count} rows",
+                    f,
+                    file_name=f"{name}_{start_date}_{end_date}.{extension}",
+                    mime="text/csv" if extension == 'csv' else "application/octet-stream",
+                )
+        except sqlite3.Error as e:
+            st.error(f"Error exporting data: {e}")
+        finally:
+            os.remove(path)
 
 # Initialize database
 init_db()
+start_sweeper()
 
 # Main menu
 if 'user' not in st.session_state:
-    selected = option_menu(
-        menu_title=None,
-        options=["Login", "Register"],
-        icons=["box-arrow-in-right", "person-plus"],
-        orientation="horizontal"
+    # A native widget: Streamlit loads pyarrow and pandas for any custom
+    # component such as option_menu, which kiosks would pay for on every restart.
+    selected = st.radio(
+        "Menu",
+        ["Login", "Register"],
+        horizontal=True,
+        label_visibility="collapsed"
     )
     
     if selected == "Login":
@@ -683,10 +1359,16 @@ if 'user' not in st.session_state:
     else:
         register_user()
 else:
+    options = ["Dashboard", "Start Session", "End Session", "Reservations", "Computers", "Maintenance"]
+    icons = ["graph-up", "play-circle", "stop-circle", "calendar-event", "pc-display", "tools"]
+    if st.session_state['user']['role'] == 'admin':
+        options += ["Desk Sales", "Customers", "Billing", "Performance", "Export"]
+        icons += ["cart", "people", "receipt", "speedometer2", "download"]
+    
     selected = option_menu(
         menu_title=None,
-        options=["Dashboard", "Start Session", "End Session", "Computers", "Maintenance", "Logout"],
-        icons=["graph-up", "play-circle", "stop-circle", "pc-display", "tools", "box-arrow-right"],
+        options=options + ["Logout"],
+        icons=icons + ["box-arrow-right"],
         orientation="horizontal"
     )
     
@@ -696,10 +1378,22 @@ else:
         start_session()
     elif selected == "End Session":
         end_session()
+    elif selected == "Reservations":
+        show_reservations()
     elif selected == "Computers":
         show_computer_status()
     elif selected == "Maintenance":
         manage_maintenance()
+    elif selected == "Desk Sales":
+        show_pos()
+    elif selected == "Customers":
+        show_customers()
+    elif selected == "Billing":
+        close_sessions()
+    elif selected == "Performance":
+        show_performance()
+    elif selected == "Export":
+        show_export()
     elif selected == "Logout":
         st.session_state.clear()
         st.experimental_rerun()
\ No newline at end of file
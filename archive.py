@@ -0,0 +1,300 @@
+import argparse
+import glob
+import os
+import re
+import sqlite3
+from datetime import date
+
+import config
+import migrations
+from db import Database
+
+# Closed sessions older than ARCHIVE_AFTER_DAYS move out of the hot database
+# into one SQLite file per start month (sessions_YYYY_MM.db), in a directory
+# of the database's own (see archive_dir()). The dashboard
+# rollups already count them, so only raw-session range queries need the
+# archive; they go through iter_query()/query(), which ATTACH the partitions
+# covering the requested range and UNION them with the hot table.
+
+COLUMNS = 'id, user_id, computer_id, start_time, end_time, duration, cost, start_at, end_at'
+
+# SQLite attaches at most 10 databases per connection by default; keep one
+# spare so a caller's own connection could still attach something.
+MAX_ATTACHED = 9
+
+_PARTITION = re.compile(r'sessions_(\d{4})_(\d{2})\.db$')
+
+
+def archive_dir(db_path):
+    """Default partition directory of a database file: '<name>.archive' in ARCHIVE_DIR, or next to it."""
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(config.ARCHIVE_DIR or os.path.dirname(os.path.abspath(db_path)), f'{name}.archive')
+
+
+def directory_of(db):
+    """Partition directory a Database reads and writes."""
+    return db.archive_dir or archive_dir(db.path)
+
+
+def partition_path(month, directory):
+    """Path of the archive file for a 'YYYY-MM' month."""
+    year, mon = month.split('-')
+    return os.path.join(directory, f'sessions_{year}_{mon}.db')
+
+
+def _month_bounds(month):
+    year, mon = (int(part) for part in month.split('-'))
+    start = date(year, mon, 1)
+    end = date(year + mon // 12, mon % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def partitions(directory, start=None, end=None):
+    """Archive files in `directory` whose month overlaps [start, end), oldest first.
+
+    start and end are ISO date or timestamp strings; None leaves that side open.
+    """
+    found = []
+    for path in glob.glob(os.path.join(directory, 'sessions_*.db')):
+        match = _PARTITION.search(path)
+        if not match:
+            continue
+        month_start, month_end = _month_bounds(f'{match[1]}-{match[2]}')
+        if start is not None and month_end <= start[:10]:
+            continue
+        if end is not None and month_start >= end:
+            continue
+        found.append((month_start, path))
+    return [path for _, path in sorted(found)]
+
+
+def _upgrade(conn, schema):
+    # Files written before the epoch columns existed: add and fill them, and
+    # drop the text index that idx_sessions_start_at replaces. Returns False
+    # on current files.
+    columns = [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info(sessions)')]
+    if 'start_at' in columns:
+        return False
+    conn.execute(f'ALTER TABLE {schema}.sessions ADD COLUMN start_at INTEGER')
+    conn.execute(f'ALTER TABLE {schema}.sessions ADD COLUMN end_at INTEGER')
+    conn.execute(f'''
+        UPDATE {schema}.sessions
+        SET start_at = CAST(STRFTIME('%s', start_time) AS INTEGER),
+            end_at = CAST(STRFTIME('%s', end_time) AS INTEGER)
+    ''')
+    conn.execute(f'DROP INDEX IF EXISTS {schema}.idx_sessions_start_time')
+    return True
+
+
+def _upgrade_file(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        # Taken before the column check, so two processes opening the same
+        # old file don't both alter it
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            upgraded = _upgrade(conn, 'main')
+            if upgraded:
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start_at ON sessions (start_at, cost)')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return upgraded
+    finally:
+        conn.close()
+
+
+# Files this process has already seen with the epoch columns
+_current = set()
+
+
+def _ensure_current(paths):
+    # Files from older releases are upgraded the first time they are opened
+    # here, each in its own transaction, rather than by the schema migration
+    # of the database they belong to.
+    for path in paths:
+        if path not in _current:
+            _upgrade_file(path)
+            _current.add(path)
+
+
+def upgrade_partitions(directory):
+    """Give archive files from older releases the start_at/end_at columns; returns how many changed."""
+    upgraded = 0
+    for path in partitions(directory):
+        upgraded += _upgrade_file(path)
+        _current.add(path)
+    return upgraded
+
+
+def _archive_batch(db, path, month_start, month_end, batch_size):
+    if os.path.exists(path):
+        _ensure_current([path])
+    with db.connection() as conn:
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS archive.sessions (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    computer_id INTEGER,
+                    start_time TIMESTAMP,
+                    end_time TIMESTAMP,
+                    duration INTEGER,
+                    cost REAL,
+                    start_at INTEGER,
+                    end_at INTEGER
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS archive.idx_sessions_start_at
+                ON sessions (start_at, cost)
+            ''')
+
+            # Main runs in WAL mode, so a transaction spanning both files is
+            # not atomic as a whole. Copy first, then delete only rows the
+            # archive already holds: a crash in between just repeats the copy.
+            conn.execute('BEGIN IMMEDIATE')
+            copied = conn.execute(f'''
+                INSERT OR IGNORE INTO archive.sessions ({COLUMNS})
+                SELECT {COLUMNS} FROM main.sessions
+                WHERE start_at >= CAST(STRFTIME('%s', ?) AS INTEGER)
+                  AND start_at < CAST(STRFTIME('%s', ?) AS INTEGER)
+                  AND end_time IS NOT NULL
+                ORDER BY start_at
+                LIMIT ?
+            ''', (month_start, month_end, batch_size)).rowcount
+            conn.commit()
+
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = conn.execute('''
+                DELETE FROM main.sessions
+                WHERE start_at >= CAST(STRFTIME('%s', ?) AS INTEGER)
+                  AND start_at < CAST(STRFTIME('%s', ?) AS INTEGER)
+                  AND end_time IS NOT NULL AND id IN (SELECT id FROM archive.sessions)
+            ''', (month_start, month_end)).rowcount
+            conn.commit()
+            return copied, deleted
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute('DETACH DATABASE archive')
+
+
+def archive_sessions(db, older_than_days=None, batch_size=None, directory=None):
+    """Move closed sessions that started before the cutoff into monthly files.
+
+    Runs in batches of `batch_size` rows, each committed on its own, so the
+    job can be stopped at any point and simply run again. Returns the number
+    of rows removed from the hot database.
+    """
+    older_than_days = config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    directory = directory or directory_of(db)
+    os.makedirs(directory, exist_ok=True)
+
+    cutoff = db.query_one("SELECT DATETIME('now', ?)", (f'-{int(older_than_days)} days',))[0]
+    moved = 0
+    while True:
+        oldest = db.query_one('''
+            SELECT start_time FROM sessions
+            WHERE start_at < CAST(STRFTIME('%s', ?) AS INTEGER) AND end_time IS NOT NULL
+            ORDER BY start_at
+            LIMIT 1
+        ''', (cutoff,))
+        if oldest is None:
+            return moved
+        month = oldest[0][:7]
+        month_start, month_end = _month_bounds(month)
+        _, deleted = _archive_batch(
+            db, partition_path(month, directory), month_start, min(month_end, cutoff), batch_size
+        )
+        if not deleted:
+            return moved
+        moved += deleted
+
+
+def iter_query(db, sql, params=(), start=None, end=None, include_hot=True,
+               directory=None, batch_size=1000, group_size=MAX_ATTACHED):
+    """Run `sql` over hot and archived sessions, yielding rows.
+
+    `sql` names the session source as ``{sessions}``; only the archive files
+    overlapping [start, end) are attached. Partitions are processed oldest
+    first in groups of `group_size` (the hot table goes with the last group),
+    so an aggregate query yields one set of rows per group: use merge() to
+    combine them. With group_size=1 each file is queried on its own, which
+    lets ORDER BY start_at walk that file's index instead of sorting.
+    """
+    paths = partitions(directory or directory_of(db), start, end)
+    _ensure_current(paths)
+    groups = [paths[i:i + group_size] for i in range(0, len(paths), group_size)]
+    if include_hot:
+        if not groups or group_size == 1:
+            groups.append([])
+
+    for index, group in enumerate(groups):
+        last = index == len(groups) - 1
+        sources = [f'SELECT {COLUMNS} FROM main.sessions'] if include_hot and last else []
+        with db.connection() as conn:
+            aliases = []
+            try:
+                for n, path in enumerate(group):
+                    conn.execute(f'ATTACH DATABASE ? AS part{n}', (path,))
+                    aliases.append(f'part{n}')
+                sources += [f'SELECT {COLUMNS} FROM {alias}.sessions' for alias in aliases]
+                cursor = conn.execute(sql.format(sessions=f"({' UNION ALL '.join(sources)})"), params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                for alias in aliases:
+                    conn.execute(f'DETACH DATABASE {alias}')
+
+
+def scan(directory, sql, params=(), start=None, end=None):
+    """Run `sql` against each archive file on its own connection, yielding rows.
+
+    For callers without a Database, such as migrations, whose open write
+    transaction rules out ATTACH. `sql` reads the file's own ``sessions``
+    table; aggregate rows come once per file, so use merge().
+    """
+    for path in partitions(directory, start, end):
+        conn = sqlite3.connect(path)
+        try:
+            yield from conn.execute(sql, params)
+        finally:
+            conn.close()
+
+
+def query(db, sql, params=(), start=None, end=None, include_hot=True, directory=None):
+    return list(iter_query(db, sql, params, start, end, include_hot, directory))
+
+
+def merge(rows, key_columns=1):
+    """Sum the value columns of rows that share the same leading key columns."""
+    merged = {}
+    for row in rows:
+        key, values = tuple(row[:key_columns]), row[key_columns:]
+        if key in merged:
+            merged[key] = [(a or 0) + (b or 0) for a, b in zip(merged[key], values)]
+        else:
+            merged[key] = list(values)
+    return [key + tuple(values) for key, values in sorted(merged.items())]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move old closed sessions into monthly archive files.')
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--older-than-days', type=int, default=config.ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--batch-size', type=int, default=config.ARCHIVE_BATCH_SIZE)
+    parser.add_argument('--dir', help="default: '<database name>.archive' in ARCHIVE_DIR or next to the database")
+    args = parser.parse_args()
+
+    db = Database(args.db, archive_dir=args.dir)
+    migrations.migrate(db)
+    moved = archive_sessions(db, args.older_than_days, args.batch_size)
+    print(f'{args.db}: archived {moved} sessions into {directory_of(db)}')
+    db.close()
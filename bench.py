@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import seed
+import services
+from db import Database
+
+# Times the query path behind every page against seeded databases of growing
+# size and prints one JSON document, so results can be diffed across releases:
+#
+#     python bench.py --sizes 10k,1m,10m --output bench.json
+#
+# Generated databases are kept in --workdir and reused on the next run.
+
+DEFAULT_SIZES = '10k,1m,10m'
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def _elapsed_ms(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def _time(fn, repeat):
+    return _summary([_elapsed_ms(fn) for _ in range(repeat)])
+
+
+def _session_cycle(db):
+    """Return (start, end) callables that book and release free computers."""
+    user_id = db.query_one('SELECT MAX(id) FROM users')[0]
+    pending = []
+
+    def start():
+        computer = services.available_computers(db)[0]
+        pending.append(services.start_session(db, user_id, computer['id']))
+
+    def end():
+        services.end_session(db, pending.pop())
+
+    return start, end
+
+
+def benchmark_database(path, repeat):
+    db = Database(path)
+    user = db.query_one('SELECT email, password FROM users ORDER BY id DESC LIMIT 1')
+    busy_user = db.query_one('SELECT user_id FROM sessions WHERE end_time IS NULL LIMIT 1')
+    start, end = _session_cycle(db)
+
+    results = {
+        'login_user': _time(lambda: services.authenticate(db, user[0], user[1]), repeat),
+        'show_computer_status': _time(lambda: services.computer_status(db), repeat),
+        'show_maintenance_history': _time(lambda: services.maintenance_history(db), repeat),
+        'show_dashboard': _time(lambda: services.dashboard_metrics(db), repeat),
+        'end_session_list': _time(lambda: services.active_sessions(db, busy_user[0] if busy_user else 0), repeat),
+    }
+    # Start and end alternate so every start finds a free computer and every
+    # end has a session to close.
+    start_samples, end_samples = [], []
+    for _ in range(repeat):
+        start_samples.append(_elapsed_ms(start))
+        end_samples.append(_elapsed_ms(end))
+    results['start_session'] = _summary(start_samples)
+    results['end_session'] = _summary(end_samples)
+    db.close()
+    return results
+
+
+def prepare(workdir, sessions, force=False):
+    path = os.path.join(workdir, f'bench_{sessions}.db')
+    if force or not os.path.exists(path):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        started = time.perf_counter()
+        seed.generate(
+            path,
+            users=max(1000, sessions // 100),
+            computers=200,
+            sessions=sessions,
+            years=max(1.0, min(10.0, sessions / 1_000_000)),
+            maintenance=max(500, sessions // 100),
+            inventory=200,
+        )
+        print(f'generated {path} in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    return path
+
+
+def run(sizes, workdir, repeat, regenerate=False):
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': {},
+    }
+    for sessions in sizes:
+        path = prepare(workdir, sessions, regenerate)
+        report['results'][str(sessions)] = benchmark_database(path, repeat)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark page query paths at several data sizes.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'comma-separated session counts (default: {DEFAULT_SIZES})')
+    parser.add_argument('--workdir', default='bench_data')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--regenerate', action='store_true', help='rebuild cached databases')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    sizes = [seed.parse_count(size) for size in args.sizes.split(',')]
+    report = run(sizes, args.workdir, args.repeat, args.regenerate)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
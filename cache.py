@@ -0,0 +1,19 @@
+import threading
+
+# Process-wide write generation. Write paths call bump() after they commit;
+# cached readers take generation() as part of their cache key, so any commit
+# makes older entries unreachable while the TTL still bounds staleness from
+# writers in other processes.
+_lock = threading.Lock()
+_generation = 0
+
+
+def generation():
+    return _generation
+
+
+def bump():
+    global _generation
+    with _lock:
+        _generation += 1
+        return _generation
@@ -0,0 +1,91 @@
+import os
+import time
+
+# Database settings
+DB_PATH = os.environ.get('CYBER_CAFE_DB', 'cyber_cafe.db')
+DB_POOL_SIZE = int(os.environ.get('CYBER_CAFE_DB_POOL_SIZE', '8'))
+DB_BUSY_TIMEOUT = float(os.environ.get('CYBER_CAFE_DB_BUSY_TIMEOUT', '10'))
+
+# Seconds cached dashboard metrics and figures stay valid without a write
+DASHBOARD_CACHE_TTL = float(os.environ.get('CYBER_CAFE_DASHBOARD_CACHE_TTL', '60'))
+# Most points a dashboard trend chart gets; longer ranges merge neighbouring buckets
+TREND_MAX_POINTS = int(os.environ.get('CYBER_CAFE_TREND_MAX_POINTS', '1000'))
+
+# Occupancy heatmap: average PCs in use per hour of the week over the last
+# OCCUPANCY_WEEKS weeks, and next week's forecast from the last
+# OCCUPANCY_FORECAST_WEEKS of them. Hours are the cafe's local time,
+# OCCUPANCY_UTC_OFFSET_MINUTES ahead of UTC (default: this server's offset).
+OCCUPANCY_WEEKS = int(os.environ.get('CYBER_CAFE_OCCUPANCY_WEEKS', '12'))
+OCCUPANCY_FORECAST_WEEKS = int(os.environ.get('CYBER_CAFE_OCCUPANCY_FORECAST_WEEKS', '4'))
+OCCUPANCY_UTC_OFFSET_MINUTES = int(os.environ.get(
+    'CYBER_CAFE_OCCUPANCY_UTC_OFFSET_MINUTES', str(time.localtime().tm_gmtoff // 60)
+))
+
+# Analytics snapshot: a read-only copy of the database that the dashboard and
+# exports read, refreshed after SNAPSHOT_REFRESH_WRITES writes (but at most
+# every SNAPSHOT_MIN_INTERVAL_SECONDS) or once it is SNAPSHOT_MAX_AGE_SECONDS
+# old. The copy is '<database name>.analytics.db' in SNAPSHOT_DIR ('' puts it
+# next to the database).
+SNAPSHOT_DIR = os.environ.get('CYBER_CAFE_SNAPSHOT_DIR', '')
+SNAPSHOT_REFRESH_WRITES = int(os.environ.get('CYBER_CAFE_SNAPSHOT_REFRESH_WRITES', '200'))
+SNAPSHOT_MIN_INTERVAL_SECONDS = float(os.environ.get('CYBER_CAFE_SNAPSHOT_MIN_INTERVAL_SECONDS', '30'))
+SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get('CYBER_CAFE_SNAPSHOT_MAX_AGE_SECONDS', '300'))
+
+# Local HTTP/JSON API for kiosks and PC agents
+API_HOST = os.environ.get('CYBER_CAFE_API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('CYBER_CAFE_API_PORT', '8502'))
+# Admin-only routes (the ones the app keeps to admins) need the header
+# 'Authorization: Bearer <token>'; with no token set they are refused.
+API_ADMIN_TOKEN = os.environ.get('CYBER_CAFE_API_ADMIN_TOKEN', '')
+
+# Live floor map: how often the Computers page polls the in-memory floor
+# state, and how often that state is fully reloaded from the database
+FLOOR_REFRESH_SECONDS = float(os.environ.get('CYBER_CAFE_FLOOR_REFRESH_SECONDS', '5'))
+FLOOR_RESYNC_SECONDS = float(os.environ.get('CYBER_CAFE_FLOOR_RESYNC_SECONDS', '60'))
+# Floors with more computers than this open in the compact grid, which shows
+# FLOOR_GRID_PAGE_SIZE tiles per page
+FLOOR_GRID_THRESHOLD = int(os.environ.get('CYBER_CAFE_FLOOR_GRID_THRESHOLD', '30'))
+FLOOR_GRID_PAGE_SIZE = int(os.environ.get('CYBER_CAFE_FLOOR_GRID_PAGE_SIZE', '60'))
+
+# PC agent heartbeats: pings are queued in memory and written every
+# HEARTBEAT_FLUSH_SECONDS; a PC silent for HEARTBEAT_STALE_SECONDS is shown as
+# stale, and after HEARTBEAT_OFFLINE_SECONDS as offline
+HEARTBEAT_FLUSH_SECONDS = float(os.environ.get('CYBER_CAFE_HEARTBEAT_FLUSH_SECONDS', '1'))
+HEARTBEAT_STALE_SECONDS = float(os.environ.get('CYBER_CAFE_HEARTBEAT_STALE_SECONDS', '30'))
+HEARTBEAT_OFFLINE_SECONDS = float(os.environ.get('CYBER_CAFE_HEARTBEAT_OFFLINE_SECONDS', '120'))
+TELEMETRY_RETENTION_DAYS = int(os.environ.get('CYBER_CAFE_TELEMETRY_RETENTION_DAYS', '7'))
+
+# Idle-session sweeper, run every SWEEP_INTERVAL_SECONDS (0 disables it in
+# the app and API). It closes a session when the PC's agent has reported no
+# one logged in for SWEEP_IDLE_MINUTES, SWEEP_GRACE_MINUTES after its booked
+# time ran out, or once it is SESSION_MAX_HOURS long.
+SWEEP_INTERVAL_SECONDS = float(os.environ.get('CYBER_CAFE_SWEEP_INTERVAL_SECONDS', '60'))
+SWEEP_IDLE_MINUTES = float(os.environ.get('CYBER_CAFE_SWEEP_IDLE_MINUTES', '20'))
+SWEEP_GRACE_MINUTES = float(os.environ.get('CYBER_CAFE_SWEEP_GRACE_MINUTES', '10'))
+SESSION_MAX_HOURS = float(os.environ.get('CYBER_CAFE_SESSION_MAX_HOURS', '12'))
+
+# Reservations: a booked PC is held for its customer from this many minutes
+# before the slot starts until this many minutes after; a no-show then forfeits it
+RESERVATION_HOLD_MINUTES = int(os.environ.get('CYBER_CAFE_RESERVATION_HOLD_MINUTES', '15'))
+
+# Instrumentation: statements slower than this get their query plan captured,
+# and the Prometheus text export is rewritten at most this often ('' disables)
+SLOW_QUERY_MS = float(os.environ.get('CYBER_CAFE_SLOW_QUERY_MS', '50'))
+METRICS_PATH = os.environ.get('CYBER_CAFE_METRICS_PATH', 'cyber_cafe_metrics.prom')
+METRICS_EXPORT_SECONDS = float(os.environ.get('CYBER_CAFE_METRICS_EXPORT_SECONDS', '15'))
+
+# Archiving: closed sessions older than this move to monthly files in a
+# '<database name>.archive' directory under ARCHIVE_DIR ('' puts it next to
+# the database), so every database keeps its own.
+ARCHIVE_DIR = os.environ.get('CYBER_CAFE_ARCHIVE_DIR', '')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('CYBER_CAFE_ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('CYBER_CAFE_ARCHIVE_BATCH_SIZE', '5000'))
+
+# Branches for the head-office dashboard, as 'Name=path/to/branch.db' pairs
+# separated by commas; empty means this install is a single branch. A branch
+# that takes longer than BRANCH_TIMEOUT seconds is reported as unavailable.
+BRANCHES = dict(
+    map(str.strip, entry.split('=', 1))
+    for entry in os.environ.get('CYBER_CAFE_BRANCHES', '').split(',') if '=' in entry
+)
+BRANCH_TIMEOUT = float(os.environ.get('CYBER_CAFE_BRANCH_TIMEOUT', '3'))
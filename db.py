@@ -0,0 +1,163 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import config
+
+# Applied to every new connection. WAL lets readers run alongside a writer,
+# synchronous=NORMAL is durable enough under WAL and avoids an fsync per commit.
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 134217728',
+)
+# For read_only pools, which must not change the file's journal mode.
+READ_ONLY_PRAGMAS = (
+    'PRAGMA query_only = ON',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 134217728',
+)
+
+
+class _ObservedCursor(sqlite3.Cursor):
+    """Cursor handed out by transaction(); reports each statement it runs."""
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        super().execute(sql, params)
+        self.db._observe(self.connection, sql, params, time.perf_counter() - start, self.rowcount)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        self.db._observe(self.connection, sql, (), time.perf_counter() - start, self.rowcount)
+        return self
+
+
+class Database:
+    """Thread-safe pool of SQLite connections to a single database file.
+
+    Connections run in autocommit mode, so plain reads never hold a lock.
+    Writes go through ``transaction()``, which takes the write lock up front
+    with BEGIN IMMEDIATE and waits up to ``busy_timeout`` seconds for it.
+
+    Callables in ``Database.observers`` are called after every statement as
+    ``observer(db, conn, sql, params, seconds, rows)``.
+
+    With ``read_only`` the file is opened with mode=ro, for copies such as the
+    analytics snapshot that only ever serve reads.
+
+    ``archive_dir`` is where this database's archived sessions live; None
+    means archive.archive_dir(path). A copy passes its source's.
+    """
+
+    observers = []
+
+    def __init__(self, path=config.DB_PATH, pool_size=config.DB_POOL_SIZE,
+                 busy_timeout=config.DB_BUSY_TIMEOUT, read_only=False, archive_dir=None):
+        self.path = path
+        self.archive_dir = archive_dir
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.read_only = read_only
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            f'file:{quote(os.path.abspath(self.path))}?mode=ro' if self.read_only else self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            uri=self.read_only,
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}')
+        for pragma in READ_ONLY_PRAGMAS if self.read_only else PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.pool_size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.busy_timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('connection pool exhausted') from None
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor inside a write transaction, committing on success."""
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.cursor(_ObservedCursor)
+            cursor.db = self
+            try:
+                yield cursor
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _observe(self, conn, sql, params, seconds, rows):
+        for observer in self.observers:
+            observer(self, conn, sql, params, seconds, rows)
+
+    def query(self, sql, params=()):
+        with self.connection() as conn:
+            start = time.perf_counter()
+            rows = conn.execute(sql, params).fetchall()
+            self._observe(conn, sql, params, time.perf_counter() - start, len(rows))
+            return rows
+
+    def query_one(self, sql, params=()):
+        with self.connection() as conn:
+            start = time.perf_counter()
+            row = conn.execute(sql, params).fetchone()
+            self._observe(conn, sql, params, time.perf_counter() - start, int(row is not None))
+            return row
+
+    def execute(self, sql, params=()):
+        with self.transaction() as cursor:
+            cursor.execute(sql, params)
+            return cursor
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._opened -= 1
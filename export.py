@@ -0,0 +1,183 @@
+import argparse
+import csv
+import itertools
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+import archive
+import config
+import migrations
+import snapshot
+from db import Database
+
+# Streaming exports for accounting. Rows come out of SQLite in fetchmany
+# batches through archive.iter_query(), so hot and archived months are both
+# covered, and each writer flushes one batch at a time: memory stays flat
+# whatever the size of the sessions table.
+
+BATCH_SIZE = 5000
+
+# (column, Parquet type) per export; CSV only uses the names.
+SESSION_COLUMNS = [
+    ('session_id', 'int64'), ('start_time', 'string'), ('end_time', 'string'),
+    ('duration_hours', 'float64'), ('cost', 'float64'),
+    ('user_id', 'int64'), ('user_name', 'string'), ('user_email', 'string'),
+    ('computer_id', 'int64'), ('computer_name', 'string'), ('hourly_rate', 'float64'),
+]
+REVENUE_COLUMNS = [('day', 'string'), ('session_count', 'int64'), ('revenue', 'float64')]
+
+EXPORTS = {'sessions': SESSION_COLUMNS, 'revenue': REVENUE_COLUMNS}
+FORMATS = ('csv', 'parquet')
+
+
+def _filters(start, end, computer_ids):
+    clauses, params = [], []
+    if start:
+        clauses.append("s.start_at >= CAST(STRFTIME('%s', ?) AS INTEGER)")
+        params.append(start)
+    if end:
+        clauses.append("s.start_at < CAST(STRFTIME('%s', ?) AS INTEGER)")
+        params.append(end)
+    if computer_ids:
+        clauses.append(f"s.computer_id IN ({', '.join('?' * len(computer_ids))})")
+        params.extend(computer_ids)
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), params
+
+
+def _iter(db, sql, params, start, end, batch_size):
+    # One partition per query so ORDER BY start_at follows each file's
+    # index; partitions come oldest first and the hot table last.
+    return archive.iter_query(db, sql, params, start, end, batch_size=batch_size, group_size=1)
+
+
+def iter_sessions(db, start=None, end=None, computer_ids=None, batch_size=BATCH_SIZE):
+    """Yield session rows (see SESSION_COLUMNS) in start-time order.
+
+    start and end are ISO dates or timestamps bounding start_time as [start, end).
+    """
+    where, params = _filters(start, end, computer_ids)
+    sql = f'''
+        SELECT s.id, s.start_time, s.end_time, s.duration, s.cost,
+               s.user_id, u.name, u.email,
+               s.computer_id, c.name, c.hourly_rate
+        FROM {{sessions}} s
+        LEFT JOIN users u ON u.id = s.user_id
+        LEFT JOIN computers c ON c.id = s.computer_id
+        {where}
+        ORDER BY s.start_at
+    '''
+    return _iter(db, sql, params, start, end, batch_size)
+
+
+def iter_revenue(db, start=None, end=None, computer_ids=None, batch_size=BATCH_SIZE):
+    """Yield (day, session_count, revenue) rows, one per day with sessions.
+
+    Counted by start day like daily_stats; open sessions count but add no
+    revenue. Rows are grouped in Python over the start_at index order, so a
+    day split between the archive and the hot table still comes out once.
+    """
+    where, params = _filters(start, end, computer_ids)
+    sql = f'''
+        SELECT s.start_time, s.cost
+        FROM {{sessions}} s
+        {where}
+        ORDER BY s.start_at
+    '''
+    rows = _iter(db, sql, params, start, end, batch_size)
+    for day, group in itertools.groupby(rows, key=lambda row: row[0][:10]):
+        count = revenue = 0
+        for _, cost in group:
+            count += 1
+            revenue += cost or 0
+        yield day, count, round(revenue, 2)
+
+
+def _batches(rows, size):
+    iterator = iter(rows)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def write_csv(rows, columns, path):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        for batch in _batches(rows, BATCH_SIZE):
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def write_parquet(rows, columns, path, batch_size=BATCH_SIZE):
+    if pq is None:
+        raise RuntimeError('Parquet export needs pyarrow: pip install pyarrow')
+    # An explicit schema keeps every row group identical, even when a batch
+    # holds only NULLs in a column (e.g. end_time of open sessions).
+    schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in _batches(rows, batch_size):
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(batch)
+    return count
+
+
+def export(db, kind, path, fmt=None, start=None, end=None, computer_ids=None):
+    """Write the `kind` export ('sessions' or 'revenue') to `path`; return the row count.
+
+    The format defaults to the file extension. The file is written under a
+    temporary name and renamed on success, so a failed export leaves nothing behind.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f'unknown export {kind!r}; expected one of {", ".join(EXPORTS)}')
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower() or 'csv'
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown format {fmt!r}; expected one of {", ".join(FORMATS)}')
+
+    rows = (iter_sessions if kind == 'sessions' else iter_revenue)(db, start, end, computer_ids)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        if fmt == 'csv':
+            count = write_csv(rows, EXPORTS[kind], tmp)
+        else:
+            count = write_parquet(rows, EXPORTS[kind], tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream sessions or daily revenue to CSV or Parquet.')
+    parser.add_argument('kind', choices=list(EXPORTS))
+    parser.add_argument('output', help='file to write; .csv or .parquet picks the format')
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--format', choices=FORMATS, help='override the format implied by the extension')
+    parser.add_argument('--start', help='first start date/time to include (YYYY-MM-DD[ HH:MM:SS])')
+    parser.add_argument('--end', help='start date/time to stop before (exclusive)')
+    parser.add_argument('--computer', type=int, action='append', dest='computers',
+                        help='computer id to include; repeat for several (default: all)')
+    parser.add_argument('--live', action='store_true',
+                        help='read the live database instead of the analytics snapshot')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    migrations.migrate(db)
+    if args.live:
+        source, note = db, 'live database'
+    else:
+        analytics = snapshot.get(db)
+        source = analytics.database()
+        note = f'snapshot taken {analytics.age():.0f}s ago'
+    count = export(source, args.kind, args.output, args.format, args.start, args.end, args.computers)
+    print(f'{args.output}: {count} {args.kind} rows ({note})')
+    snapshot.stop_all()
+    db.close()
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import config
+import services
+from db import Database
+
+# Head-office view over several branches. Each branch keeps writing to its
+# own database; reads here fan out to every branch in a thread pool and the
+# results are merged. A branch that misses the timeout is reported and left
+# out of the totals instead of holding up the others.
+
+_lock = threading.Lock()
+_databases = {}
+# Branch path -> future still running from an earlier call. A stuck branch
+# keeps at most one worker busy rather than one per dashboard view.
+_inflight = {}
+_executor = None
+
+
+def _database(path):
+    with _lock:
+        if path not in _databases:
+            _databases[path] = Database(path, pool_size=2)
+        return _databases[path]
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(config.BRANCHES)),
+                                           thread_name_prefix='branch')
+        return _executor
+
+
+def _timed(fn, db):
+    start = time.perf_counter()
+    result = fn(db)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def fan_out(fn, branches=None, timeout=None):
+    """Call fn(db) for every branch concurrently.
+
+    Returns {name: {'status': 'ok' | 'timeout' | 'busy' | 'error', 'ms', 'result', 'error'}}.
+    """
+    branches = config.BRANCHES if branches is None else branches
+    timeout = config.BRANCH_TIMEOUT if timeout is None else timeout
+    pool = _pool()
+
+    futures, outcome = {}, {}
+    for name, path in branches.items():
+        if not os.path.exists(path):
+            # Connecting would create an empty database file in its place
+            outcome[name] = {'status': 'error', 'error': f'{path} not found'}
+            continue
+        db = _database(path)
+        with _lock:
+            running = _inflight.get(path)
+            if running is not None and not running.done():
+                outcome[name] = {'status': 'busy', 'error': 'still answering an earlier request'}
+                continue
+            futures[name] = _inflight[path] = pool.submit(_timed, fn, db)
+
+    wait(futures.values(), timeout=timeout)
+    for name, future in futures.items():
+        if not future.done():
+            outcome[name] = {'status': 'timeout', 'error': f'no answer within {timeout:g}s'}
+        elif future.exception() is not None:
+            outcome[name] = {'status': 'error', 'error': str(future.exception())}
+        else:
+            result, ms = future.result()
+            outcome[name] = {'status': 'ok', 'ms': ms, 'result': result}
+    return outcome
+
+
+def dashboard_metrics(branches=None, timeout=None):
+    """services.dashboard_metrics() summed over all branches that answered in time.
+
+    Daily trends are merged by date; per-computer usage is keyed
+    'Branch / PC' since computer names repeat across branches. 'branches'
+    lists each branch's status and its own today figures.
+    """
+    outcome = fan_out(services.dashboard_metrics, branches, timeout)
+    merged = {
+        'today_sessions': 0,
+        'today_revenue': 0.0,
+        'available_computers': 0,
+        'maintenance_count': 0,
+        'usage_data': [],
+        'usage_dist': [],
+        'branches': [],
+    }
+    days = {}
+    for name in sorted(outcome):
+        branch = outcome[name]
+        metrics = branch.get('result')
+        merged['branches'].append({
+            'branch': name,
+            'status': branch['status'],
+            'ms': branch.get('ms'),
+            'error': branch.get('error'),
+            'today_sessions': metrics['today_sessions'] if metrics else None,
+            'today_revenue': metrics['today_revenue'] if metrics else None,
+        })
+        if metrics is None:
+            continue
+        for key in ('today_sessions', 'today_revenue', 'available_computers', 'maintenance_count'):
+            merged[key] += metrics[key]
+        for day, count, revenue in metrics['usage_data']:
+            total = days.setdefault(day, [0, 0.0])
+            total[0] += count
+            total[1] += revenue
+        merged['usage_dist'] += [[f'{name} / {pc}', count] for pc, count in metrics['usage_dist']]
+    merged['usage_data'] = [[day, count, revenue] for day, (count, revenue) in sorted(days.items())]
+    return merged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the merged dashboard metrics of all branches.')
+    parser.add_argument('branches', nargs='*', metavar='NAME=PATH',
+                        help='branches to query (default: CYBER_CAFE_BRANCHES)')
+    parser.add_argument('--timeout', type=float, default=config.BRANCH_TIMEOUT)
+    args = parser.parse_args()
+
+    branches = dict(entry.split('=', 1) for entry in args.branches) if args.branches else None
+    metrics = dashboard_metrics(branches, args.timeout)
+    print(json.dumps(metrics, indent=2))
@@ -0,0 +1,73 @@
+import threading
+import time
+
+# In-process model of the cafe floor: computer id -> card (status, current
+# user, session start, ...). It is loaded from the database once, then kept
+# current by the write paths in services, which call apply() after commit.
+# Every change stamps the card with a new version so viewers can ask for
+# only what changed since the version they last rendered.
+
+
+class FloorState:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cards = {}
+        self._card_versions = {}
+        self.version = 0
+        self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def load(self, cards):
+        """Replace the whole floor, versioning only the cards that changed."""
+        with self._lock:
+            fresh = {card['id']: card for card in cards}
+            for computer_id in self._cards.keys() - fresh.keys():
+                self.version += 1
+                del self._cards[computer_id]
+                self._card_versions[computer_id] = self.version
+            for computer_id, card in fresh.items():
+                if self._cards.get(computer_id) != card:
+                    self.version += 1
+                    self._cards[computer_id] = card
+                    self._card_versions[computer_id] = self.version
+            self.loaded_at = time.monotonic()
+
+    def apply(self, card):
+        with self._lock:
+            if self._cards.get(card['id']) == card:
+                return
+            self.version += 1
+            self._cards[card['id']] = card
+            self._card_versions[card['id']] = self.version
+
+    def snapshot(self):
+        with self._lock:
+            return self.version, [dict(card) for _, card in sorted(self._cards.items())]
+
+    def changes_since(self, version):
+        """Return (current_version, changed_cards, removed_ids) after `version`."""
+        with self._lock:
+            changed, removed = [], []
+            for computer_id, card_version in self._card_versions.items():
+                if card_version <= version:
+                    continue
+                if computer_id in self._cards:
+                    changed.append(dict(self._cards[computer_id]))
+                else:
+                    removed.append(computer_id)
+            return self.version, changed, removed
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def get(path):
+    """Return the shared FloorState for a database file."""
+    with _states_lock:
+        if path not in _states:
+            _states[path] = FloorState()
+        return _states[path]
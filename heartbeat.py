@@ -0,0 +1,161 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import config
+
+# Write-behind ingestion for PC agent heartbeats. submit() only updates
+# in-memory state: the latest ping per computer and a running aggregate per
+# computer and minute. A background thread writes whatever accumulated every
+# HEARTBEAT_FLUSH_SECONDS in one transaction, so hundreds of agents pinging
+# every few seconds cost one commit per interval rather than one per ping.
+
+PRUNE_EVERY_SECONDS = 3600
+
+
+def _now():
+    # Same format as SQLite's CURRENT_TIMESTAMP, so ages can be computed in SQL
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class HeartbeatWriter:
+    def __init__(self, db, flush_seconds=None):
+        self.db = db
+        self.flush_seconds = config.HEARTBEAT_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self._lock = threading.Lock()
+        # computer_id -> (seen_at, cpu, ram, logged_in, active_at), where
+        # active_at is the last queued ping with someone logged in
+        self._latest = {}
+        # (minute, computer_id) -> [samples, cpu_sum, cpu_max, ram_sum, ram_max]
+        self._minutes = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+        self.flushed = 0
+
+    def submit(self, computer_id, cpu, ram, logged_in, seen_at=None):
+        if not 0 <= cpu <= 100 or not 0 <= ram <= 100:
+            raise ValueError('cpu and ram are percentages between 0 and 100')
+        seen_at = seen_at or _now()
+        with self._lock:
+            previous = self._latest.get(computer_id)
+            active_at = seen_at if logged_in else (previous[4] if previous else None)
+            self._latest[computer_id] = (seen_at, cpu, ram, int(bool(logged_in)), active_at)
+            self._add_sample((seen_at[:16], computer_id), [1, cpu, cpu, ram, ram])
+        if self._thread is None:
+            self.start()
+
+    def _add_sample(self, key, sample):
+        current = self._minutes.get(key)
+        if current is None:
+            self._minutes[key] = sample
+        else:
+            current[0] += sample[0]
+            current[1] += sample[1]
+            current[2] = max(current[2], sample[2])
+            current[3] += sample[3]
+            current[4] = max(current[4], sample[4])
+
+    def pending(self):
+        with self._lock:
+            return len(self._latest)
+
+    def flush(self):
+        """Write everything queued so far; returns the number of computers in the batch."""
+        with self._lock:
+            latest, self._latest = self._latest, {}
+            minutes, self._minutes = self._minutes, {}
+        if not latest and not minutes:
+            return 0
+        try:
+            with self.db.transaction() as cursor:
+                # Pings for ids that are not computers are dropped here rather
+                # than checked per request.
+                cursor.executemany('''
+                    INSERT INTO computer_heartbeats (computer_id, seen_at, cpu, ram, logged_in, active_at)
+                    SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM computers WHERE id = ?)
+                    ON CONFLICT (computer_id) DO UPDATE SET
+                        seen_at = excluded.seen_at,
+                        cpu = excluded.cpu,
+                        ram = excluded.ram,
+                        logged_in = excluded.logged_in,
+                        active_at = COALESCE(excluded.active_at, computer_heartbeats.active_at)
+                    WHERE excluded.seen_at >= computer_heartbeats.seen_at
+                ''', [(computer_id, *ping, computer_id) for computer_id, ping in latest.items()])
+                cursor.executemany('''
+                    INSERT INTO telemetry_minutes (minute, computer_id, samples, cpu_avg, cpu_max, ram_avg, ram_max)
+                    SELECT ?, ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM computers WHERE id = ?)
+                    ON CONFLICT (minute, computer_id) DO UPDATE SET
+                        cpu_avg = (cpu_avg * samples + excluded.cpu_avg * excluded.samples) / (samples + excluded.samples),
+                        ram_avg = (ram_avg * samples + excluded.ram_avg * excluded.samples) / (samples + excluded.samples),
+                        cpu_max = MAX(cpu_max, excluded.cpu_max),
+                        ram_max = MAX(ram_max, excluded.ram_max),
+                        samples = samples + excluded.samples
+                ''', [
+                    (minute, computer_id, n, cpu_sum / n, cpu_max, ram_sum / n, ram_max, computer_id)
+                    for (minute, computer_id), (n, cpu_sum, cpu_max, ram_sum, ram_max) in minutes.items()
+                ])
+        except sqlite3.Error:
+            # Put the batch back under anything that arrived meanwhile; the
+            # next flush retries it.
+            with self._lock:
+                for computer_id, ping in latest.items():
+                    newer = self._latest.get(computer_id)
+                    if newer is None or newer[0] < ping[0]:
+                        self._latest[computer_id] = ping
+                for key, sample in minutes.items():
+                    self._add_sample(key, sample)
+            raise
+        self.flushed += len(latest)
+        return len(latest)
+
+    def prune(self, days=None):
+        days = config.TELEMETRY_RETENTION_DAYS if days is None else days
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M')
+        self.db.execute('DELETE FROM telemetry_minutes WHERE minute < ?', (cutoff,))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+                if time.monotonic() - self._last_prune > PRUNE_EVERY_SECONDS:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except sqlite3.Error:
+                pass  # kept queued, retried on the next tick
+        self.flush()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='heartbeat-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after a final flush."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get(db):
+    """Return the shared writer for a Database."""
+    with _writers_lock:
+        if db.path not in _writers:
+            _writers[db.path] = HeartbeatWriter(db)
+        return _writers[db.path]
+
+
+def stop_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.stop()
@@ -0,0 +1,238 @@
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import config
+from db import Database
+
+# Timing for SQL statements, page functions and named spans inside pages.
+# Each (kind, name) pair gets a Histogram that keeps lifetime bucket counts
+# for the Prometheus export and a rolling window for the admin panel.
+# Recording only touches memory: statements are observed while their
+# transaction is still open, so the export file is written by a background
+# thread every METRICS_EXPORT_SECONDS instead.
+
+logger = logging.getLogger('cyber_cafe.instrumentation')
+
+# Bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOT_SECONDS = 60
+WINDOW_SLOTS = 15
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.rows = 0
+        # (slot start, bucket counts, sum, max, rows) per SLOT_SECONDS
+        self._slots = deque(maxlen=WINDOW_SLOTS)
+
+    def observe(self, seconds, rows=None, now=None):
+        now = time.time() if now is None else now
+        index = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+        self.buckets[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.rows += rows or 0
+
+        slot_start = now - now % SLOT_SECONDS
+        if not self._slots or self._slots[-1][0] != slot_start:
+            self._slots.append([slot_start, [0] * (len(BUCKETS) + 1), 0.0, 0.0, 0])
+        slot = self._slots[-1]
+        slot[1][index] += 1
+        slot[2] += seconds
+        slot[3] = max(slot[3], seconds)
+        slot[4] += rows or 0
+
+    def window(self, now=None):
+        """Summarise the last WINDOW_SLOTS * SLOT_SECONDS seconds."""
+        now = time.time() if now is None else now
+        oldest = now - WINDOW_SLOTS * SLOT_SECONDS
+        counts = [0] * (len(BUCKETS) + 1)
+        total = maximum = 0.0
+        rows = 0
+        for slot_start, slot_counts, slot_sum, slot_max, slot_rows in self._slots:
+            if slot_start < oldest:
+                continue
+            counts = [a + b for a, b in zip(counts, slot_counts)]
+            total += slot_sum
+            maximum = max(maximum, slot_max)
+            rows += slot_rows
+        n = sum(counts)
+        if not n:
+            return None
+
+        def percentile(q):
+            # Upper bound of the bucket holding the q-th observation
+            target, seen = q * n, 0
+            for i, c in enumerate(counts):
+                seen += c
+                if seen >= target:
+                    return min(BUCKETS[i], maximum) if i < len(BUCKETS) else maximum
+            return maximum
+
+        return {
+            'count': n,
+            'mean_ms': total / n * 1000,
+            'p50_ms': percentile(0.5) * 1000,
+            'p95_ms': percentile(0.95) * 1000,
+            'p99_ms': percentile(0.99) * 1000,
+            'max_ms': maximum * 1000,
+            'rows': rows,
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}
+slow_queries = deque(maxlen=50)
+_exporter_lock = threading.Lock()
+_exporter_stop = threading.Event()
+_exporter = None
+
+
+def _label(sql):
+    return re.sub(r'\s+', ' ', sql).strip()[:120]
+
+
+def record(kind, name, seconds, rows=None):
+    with _lock:
+        histogram = _histograms.get((kind, name))
+        if histogram is None:
+            histogram = _histograms[(kind, name)] = Histogram()
+        histogram.observe(seconds, rows)
+
+
+def _observe_query(db, conn, sql, params, seconds, rows):
+    label = _label(sql)
+    record('query', label, seconds, rows if rows is not None and rows >= 0 else None)
+    if seconds * 1000 < config.SLOW_QUERY_MS:
+        return
+    if not re.match(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', sql, re.IGNORECASE):
+        return
+    try:
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+    except Exception as e:
+        plan = [f'plan unavailable: {e}']
+    # Parameters are deliberately not kept: they can hold emails and passwords.
+    slow_queries.appendleft({
+        'at': time.time(),
+        'database': db.path,
+        'sql': label,
+        'ms': seconds * 1000,
+        'rows': rows,
+        'plan': plan,
+    })
+
+
+def install():
+    """Start timing every statement run through db.Database, and exporting to METRICS_PATH."""
+    if _observe_query not in Database.observers:
+        Database.observers.append(_observe_query)
+    start_exporter()
+
+
+@contextmanager
+def span(name):
+    """Time a block, e.g. the DataFrame build or figure creation of a page."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record('span', name, time.perf_counter() - start)
+
+
+def page(fn):
+    """Time every call of a page function."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            record('page', fn.__name__, time.perf_counter() - start)
+    return wrapper
+
+
+def summary():
+    """Rolling-window stats per (kind, name), slowest p95 first."""
+    with _lock:
+        stats = [
+            dict(kind=kind, name=name, **window)
+            for (kind, name), histogram in _histograms.items()
+            if (window := histogram.window()) is not None
+        ]
+    return sorted(stats, key=lambda s: s['p95_ms'], reverse=True)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def prometheus_text():
+    lines = []
+    with _lock:
+        items = sorted(_histograms.items())
+        for kind in ('query', 'page', 'span'):
+            metric = f'cyber_cafe_{kind}_duration_seconds'
+            lines.append(f'# HELP {metric} Duration of {kind} executions.')
+            lines.append(f'# TYPE {metric} histogram')
+            for (item_kind, name), histogram in items:
+                if item_kind != kind:
+                    continue
+                label = f'{kind}="{_escape(name)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{{label}}} {histogram.sum:.6f}')
+                lines.append(f'{metric}_count{{{label}}} {histogram.count}')
+        lines.append('# HELP cyber_cafe_query_rows_total Rows returned or changed by queries.')
+        lines.append('# TYPE cyber_cafe_query_rows_total counter')
+        for (kind, name), histogram in items:
+            if kind == 'query':
+                lines.append(f'cyber_cafe_query_rows_total{{query="{_escape(name)}"}} {histogram.rows}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Atomically write the text exposition, e.g. for node_exporter's textfile collector."""
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+def _export():
+    while not _exporter_stop.wait(config.METRICS_EXPORT_SECONDS):
+        try:
+            write_prometheus(config.METRICS_PATH)
+        except OSError:
+            logger.exception('could not write %s; retrying next interval', config.METRICS_PATH)
+
+
+def start_exporter():
+    global _exporter
+    if not config.METRICS_PATH:
+        return
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter_stop.clear()
+            _exporter = threading.Thread(target=_export, name='metrics-exporter', daemon=True)
+            _exporter.start()
+
+
+def stop_exporter():
+    global _exporter
+    with _exporter_lock:
+        thread, _exporter = _exporter, None
+    if thread is not None:
+        _exporter_stop.set()
+        thread.join()
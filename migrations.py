@@ -0,0 +1,504 @@
+import argparse
+
+import config
+from db import Database
+
+
+def _archive_dir(cursor):
+    # Callables only get a cursor: find the archive of the file being
+    # migrated from its path. Imported here: rollup and archive import this
+    # module for their CLIs.
+    import archive
+
+    path = next(row[2] for row in cursor.execute('PRAGMA database_list') if row[1] == 'main')
+    return archive.archive_dir(path) if path else None
+
+
+def _backfill_range_rollups(cursor):
+    import rollup
+
+    rollup.rebuild_range_rollups(cursor)
+    # Sessions are counted in daily_stats before they can be archived, so a
+    # database without any has no archive of its own: files left at its
+    # archive path (say, by a deleted database of the same name) are not its.
+    directory = _archive_dir(cursor)
+    if directory and cursor.execute('SELECT 1 FROM daily_stats LIMIT 1').fetchone():
+        rollup.add_archived_range_rollups(cursor, directory)
+
+
+# Schema history. The database's PRAGMA user_version records how many of
+# these have been applied; migrate() runs the rest in order. Each step is a
+# SQL string or a callable taking a cursor. Never edit a released migration,
+# append a new one instead.
+MIGRATIONS = [
+    # 1: base schema
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT DEFAULT 'user',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS computers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT DEFAULT 'available',
+            specifications TEXT,
+            last_maintenance TIMESTAMP,
+            hourly_rate REAL DEFAULT 30.0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            computer_id INTEGER,
+            start_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_time TIMESTAMP,
+            duration INTEGER,
+            cost REAL,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS maintenance_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id INTEGER,
+            maintenance_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            description TEXT,
+            technician TEXT,
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_name TEXT NOT NULL,
+            quantity INTEGER DEFAULT 0,
+            price_per_item REAL,
+            category TEXT,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ),
+    # 2: indexes for the session hot paths
+    (
+        # Open sessions of a user (End Session page)
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_open_user
+        ON sessions (user_id, computer_id, start_time)
+        WHERE end_time IS NULL
+        ''',
+        # Date-range counts and revenue (Dashboard), covering cost
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_start_time
+        ON sessions (start_time, cost)
+        ''',
+        # Open session per computer and per-computer counts. Not partial:
+        # SQLite can't use a partial index for a LEFT JOIN's ON clause, but
+        # it can seek on end_time IS NULL here.
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_computer_end
+        ON sessions (computer_id, end_time)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_computers_status
+        ON computers (status)
+        ''',
+    ),
+    # 3: dashboard rollups, backfilled from existing sessions
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS computer_stats (
+            computer_id INTEGER PRIMARY KEY,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+        ''',
+        '''
+        INSERT INTO daily_stats (day, session_count, revenue)
+        SELECT DATE(start_time), COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        GROUP BY DATE(start_time)
+        ''',
+        '''
+        INSERT INTO computer_stats (computer_id, session_count, revenue)
+        SELECT computer_id, COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        WHERE computer_id IS NOT NULL
+        GROUP BY computer_id
+        ''',
+    ),
+    # 4: at most one open session per computer
+    (
+        # Double bookings made before this index existed: keep the newest
+        # open session and close the older ones at the time it started. Their cost
+        # stays NULL for staff to bill by hand.
+        '''
+        UPDATE sessions
+        SET end_time = (
+            SELECT MAX(newer.start_time) FROM sessions newer
+            WHERE newer.computer_id = sessions.computer_id
+              AND newer.end_time IS NULL
+              AND newer.id > sessions.id
+        )
+        WHERE end_time IS NULL
+          AND EXISTS (
+            SELECT 1 FROM sessions newer
+            WHERE newer.computer_id = sessions.computer_id
+              AND newer.end_time IS NULL
+              AND newer.id > sessions.id
+        )
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_open_per_computer
+        ON sessions (computer_id)
+        WHERE end_time IS NULL
+        ''',
+    ),
+    # 5: keyset pagination of maintenance history, newest first, optionally
+    # filtered by computer or technician
+    (
+        '''
+        CREATE INDEX IF NOT EXISTS idx_maintenance_date
+        ON maintenance_logs (maintenance_date, id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_maintenance_computer_date
+        ON maintenance_logs (computer_id, maintenance_date, id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_maintenance_technician_date
+        ON maintenance_logs (technician, maintenance_date, id)
+        ''',
+    ),
+    # 6: hourly and per-computer daily rollups for range-bounded trends,
+    # backfilled from hot and archived sessions
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS hourly_stats (
+            hour TEXT PRIMARY KEY,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS computer_daily_stats (
+            computer_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (computer_id, day),
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        ) WITHOUT ROWID
+        ''',
+        _backfill_range_rollups,
+    ),
+    # 7: PC agent heartbeats: the latest ping per computer, and per-minute
+    # telemetry keyed time-first so inserts append and pruning is a range delete
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS computer_heartbeats (
+            computer_id INTEGER PRIMARY KEY,
+            seen_at TIMESTAMP NOT NULL,
+            cpu REAL,
+            ram REAL,
+            logged_in INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS telemetry_minutes (
+            minute TEXT NOT NULL,
+            computer_id INTEGER NOT NULL,
+            samples INTEGER NOT NULL,
+            cpu_avg REAL,
+            cpu_max REAL,
+            ram_avg REAL,
+            ram_max REAL,
+            PRIMARY KEY (minute, computer_id),
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        ) WITHOUT ROWID
+        ''',
+    ),
+    # 8: advance reservations; overlap checks only look at live bookings
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            computer_id INTEGER NOT NULL,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP NOT NULL,
+            status TEXT NOT NULL DEFAULT 'booked',
+            session_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CHECK (end_time > start_time),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (computer_id) REFERENCES computers (id),
+            FOREIGN KEY (session_id) REFERENCES sessions (id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reservations_booked
+        ON reservations (computer_id, start_time, end_time) WHERE status = 'booked'
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reservations_user
+        ON reservations (user_id, start_time)
+        ''',
+    ),
+    # 9: desk sales of inventory items, optionally on a session's bill, and a
+    # partial index holding only the items at or below their reorder level
+    (
+        '''
+        ALTER TABLE inventory ADD COLUMN reorder_level INTEGER NOT NULL DEFAULT 5
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sale_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            unit_price REAL NOT NULL,
+            sold_by INTEGER,
+            sold_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES sessions (id),
+            FOREIGN KEY (item_id) REFERENCES inventory (id),
+            FOREIGN KEY (sold_by) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sale_items_session
+        ON sale_items (session_id) WHERE session_id IS NOT NULL
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_inventory_low_stock
+        ON inventory (quantity) WHERE quantity <= reorder_level
+        ''',
+    ),
+    # 10: floor zones, for filtering large floors
+    (
+        '''
+        ALTER TABLE computers ADD COLUMN zone TEXT
+        ''',
+    ),
+    # 11: what the idle-session sweeper needs: the end of the time a session
+    # was booked for, why it was closed when not at the desk, and when an
+    # agent last reported someone logged in
+    (
+        '''
+        ALTER TABLE sessions ADD COLUMN booked_until TIMESTAMP
+        ''',
+        '''
+        ALTER TABLE sessions ADD COLUMN close_reason TEXT
+        ''',
+        '''
+        ALTER TABLE computer_heartbeats ADD COLUMN active_at TIMESTAMP
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_swept
+        ON sessions (end_time) WHERE close_reason IS NOT NULL
+        ''',
+    ),
+    # 12: customer search. An FTS5 index over users' names and emails that
+    # reads its text from users itself (so only the index is stored), kept in
+    # sync by triggers. The prefix indexes make any prefix of up to six
+    # characters a single lookup, where FTS5 would otherwise merge every
+    # matching term ('user*' over 50k 'userNNN@' emails). Also per-user session
+    # history, covering cost for the totals.
+    (
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            name, email,
+            content = 'users', content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '1 2 3 4 5 6'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name, email ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+            INSERT INTO users_fts (rowid, name, email) VALUES (new.id, new.name, new.email);
+        END
+        ''',
+        '''
+        INSERT INTO users_fts (users_fts) VALUES ('rebuild')
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_start
+        ON sessions (user_id, start_time, cost)
+        ''',
+    ),
+    # 13: integer epoch seconds beside the text timestamps of sessions and
+    # maintenance logs. Range filters, keyset pages and durations use the
+    # integers: smaller indexes and integer compares and arithmetic instead
+    # of parsing text per row. The text columns stay what the app writes and
+    # shows, and what exports and existing queries read; triggers derive the
+    # integers from them, so no writer can leave the two out of step. The
+    # time indexes move to the integer columns; archive files get theirs
+    # from archive.py when next opened.
+    (
+        '''
+        ALTER TABLE sessions ADD COLUMN start_at INTEGER
+        ''',
+        '''
+        ALTER TABLE sessions ADD COLUMN end_at INTEGER
+        ''',
+        '''
+        ALTER TABLE maintenance_logs ADD COLUMN maintained_at INTEGER
+        ''',
+        '''
+        UPDATE sessions
+        SET start_at = CAST(STRFTIME('%s', start_time) AS INTEGER),
+            end_at = CAST(STRFTIME('%s', end_time) AS INTEGER)
+        ''',
+        '''
+        UPDATE maintenance_logs
+        SET maintained_at = CAST(STRFTIME('%s', maintenance_date) AS INTEGER)
+        ''',
+        # Bulk loaders (seed.py) may fill the integers themselves
+        '''
+        CREATE TRIGGER IF NOT EXISTS sessions_epoch_insert AFTER INSERT ON sessions
+        WHEN new.start_at IS NULL OR (new.end_at IS NULL AND new.end_time IS NOT NULL)
+        BEGIN
+            UPDATE sessions
+            SET start_at = CAST(STRFTIME('%s', new.start_time) AS INTEGER),
+                end_at = CAST(STRFTIME('%s', new.end_time) AS INTEGER)
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS sessions_epoch_update AFTER UPDATE OF start_time, end_time ON sessions
+        BEGIN
+            UPDATE sessions
+            SET start_at = CAST(STRFTIME('%s', new.start_time) AS INTEGER),
+                end_at = CAST(STRFTIME('%s', new.end_time) AS INTEGER)
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS maintenance_epoch_insert AFTER INSERT ON maintenance_logs
+        WHEN new.maintained_at IS NULL
+        BEGIN
+            UPDATE maintenance_logs
+            SET maintained_at = CAST(STRFTIME('%s', new.maintenance_date) AS INTEGER)
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS maintenance_epoch_update AFTER UPDATE OF maintenance_date ON maintenance_logs
+        BEGIN
+            UPDATE maintenance_logs
+            SET maintained_at = CAST(STRFTIME('%s', new.maintenance_date) AS INTEGER)
+            WHERE id = new.id;
+        END
+        ''',
+        '''
+        DROP INDEX IF EXISTS idx_sessions_start_time
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_start_at
+        ON sessions (start_at, cost)
+        ''',
+        '''
+        DROP INDEX IF EXISTS idx_sessions_user_start
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_start
+        ON sessions (user_id, start_at, cost)
+        ''',
+        '''
+        DROP INDEX IF EXISTS idx_sessions_swept
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_sessions_swept
+        ON sessions (end_at) WHERE close_reason IS NOT NULL
+        ''',
+        '''
+        DROP INDEX IF EXISTS idx_maintenance_date
+        ''',
+        '''
+        DROP INDEX IF EXISTS idx_maintenance_computer_date
+        ''',
+        '''
+        DROP INDEX IF EXISTS idx_maintenance_technician_date
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_maintenance_date
+        ON maintenance_logs (maintained_at, id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_maintenance_computer_date
+        ON maintenance_logs (computer_id, maintained_at, id)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_maintenance_technician_date
+        ON maintenance_logs (technician, maintained_at, id)
+        ''',
+    ),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db):
+    return db.query_one('PRAGMA user_version')[0]
+
+
+def migrate(db):
+    """Bring the database up to SCHEMA_VERSION in place.
+
+    All pending migrations run in one write transaction, so a failure leaves
+    the file at its previous version. Returns the version found on disk.
+    """
+    with db.transaction() as cursor:
+        current = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if current > SCHEMA_VERSION:
+            raise RuntimeError(
+                f'{db.path} has schema version {current}, '
+                f'newer than this code ({SCHEMA_VERSION})'
+            )
+        for version in range(current + 1, SCHEMA_VERSION + 1):
+            for step in MIGRATIONS[version - 1]:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(f'PRAGMA user_version = {version}')
+    return current
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Upgrade a cyber cafe database schema in place.')
+    parser.add_argument('path', nargs='?', default=config.DB_PATH)
+    args = parser.parse_args()
+
+    db = Database(args.path)
+    before = migrate(db)
+    print(f'{args.path}: schema version {before} -> {SCHEMA_VERSION}')
+    db.close()
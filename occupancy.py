@@ -0,0 +1,294 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+
+import archive
+import config
+import migrations
+from db import Database
+
+# Hour-of-week occupancy: how many PCs are in use, on average, at each of the
+# 7 x 24 hours of a week, over the last OCCUPANCY_WEEKS weeks, and a forecast
+# for next week. Sessions are cut at hour boundaries and summed per week,
+# computer and hour slot with NumPy (repeat + bincount) rather than a Python
+# loop per session.
+#
+# The sums are kept between refreshes. A session is folded in once, when it
+# is first seen closed: each refresh reads only the sessions with an id above
+# the highest one seen so far, plus the ones that were still open last time.
+# Open sessions count up to the refresh time but are recomputed on every
+# refresh rather than kept. Weeks that drop out of the window are discarded.
+#
+# Times are the sessions' epoch columns, shifted by
+# OCCUPANCY_UTC_OFFSET_MINUTES so hours and weekdays are the cafe's own.
+
+HOUR = 3600
+DAY = 24 * HOUR
+SLOTS = 7 * 24
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+# 1970-01-01 was a Thursday: counting days from the Monday before it makes
+# every week start on a Monday.
+MONDAY_SHIFT = 3
+FOLD_BATCH = 100_000
+
+# (id, computer_id, start_at, end_at) with 0 for a session still open, so a
+# batch fits one integer array
+_COLUMNS = 'id, computer_id, start_at, IFNULL(end_at, 0)'
+
+
+def split_hours(starts, ends):
+    """Cut [start, end) second intervals at hour boundaries.
+
+    Returns (owner, hour, seconds) arrays with one entry per hour an interval
+    touches: the index of the interval, the hour number since the epoch and
+    how many seconds of that hour the interval covers. Every end must be
+    after its start.
+    """
+    first = starts // HOUR
+    counts = (ends - 1) // HOUR - first + 1
+    owner = np.repeat(np.arange(len(starts)), counts)
+    # 0, 1, ... counts - 1 within each interval
+    offsets = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    hours = first[owner] + offsets
+    seconds = np.minimum(ends[owner], (hours + 1) * HOUR) - np.maximum(starts[owner], hours * HOUR)
+    return owner, hours, seconds
+
+
+def _week_slot(hours):
+    """Week number and hour-of-week slot (0 = Monday 00:00) of local hour numbers."""
+    days = hours // 24 + MONDAY_SHIFT
+    return days // 7, (days % 7) * 24 + hours % 24
+
+
+def _week_start(week):
+    """Local epoch second at which a week starts."""
+    return (week * 7 - MONDAY_SHIFT) * DAY
+
+
+def _date(local_seconds):
+    return time.strftime('%Y-%m-%d', time.gmtime(local_seconds))
+
+
+class OccupancyModel:
+    def __init__(self, weeks=None, forecast_weeks=None, offset_minutes=None):
+        self.weeks = config.OCCUPANCY_WEEKS if weeks is None else weeks
+        self.forecast_weeks = min(
+            config.OCCUPANCY_FORECAST_WEEKS if forecast_weeks is None else forecast_weeks, self.weeks
+        )
+        self.offset = 60 * (config.OCCUPANCY_UTC_OFFSET_MINUTES if offset_minutes is None else offset_minutes)
+        self._lock = threading.Lock()
+        # week -> occupied seconds per (computer id, slot): closed sessions,
+        # and the open ones as of the last refresh
+        self._closed = {}
+        self._open = {}
+        self._rows = 0
+        # Every session with an id up to _max_id is in _closed, except the
+        # _pending ones, which were still open
+        self._max_id = None
+        self._pending = []
+        self._first_week = None
+        self._now = None
+        self.computers = 0
+        self.folded = 0
+        self.refreshed_at = None
+
+    def refresh(self, db, now=None):
+        """Fold in the sessions closed since the last refresh and recount the open ones."""
+        now = int(time.time()) if now is None else int(now)
+        with self._lock:
+            first_week = _week_slot((now + self.offset) // HOUR)[0] - self.weeks
+            top = db.query_one('SELECT COALESCE(MAX(id), 0) FROM sessions')[0]
+            if self._max_id is None or top < self._max_id:
+                # First refresh, or a different database under the same path
+                opened = self._load(db, first_week)
+            else:
+                self._drop_before(first_week)
+                opened = self._take(db.query(
+                    f'SELECT {_COLUMNS} FROM sessions WHERE id > ? AND computer_id IS NOT NULL',
+                    (self._max_id,),
+                ))
+                if self._pending:
+                    opened += self._take(db.query(f'''
+                        SELECT {_COLUMNS} FROM sessions
+                        WHERE id IN ({', '.join('?' * len(self._pending))})
+                    ''', self._pending))
+            self._max_id = max(self._max_id, top)
+            self._pending = [int(row[0]) for row in opened]
+            self._open = {}
+            if opened:
+                opened = np.array(opened, dtype=np.int64)
+                self._fold(self._open, opened[:, 1], opened[:, 2], np.full(len(opened), now))
+            self.computers = db.query_one('SELECT COUNT(*) FROM computers')[0]
+            self._now = now
+            self.refreshed_at = time.time()
+
+    def _load(self, db, first_week):
+        self._closed, self._open, self._rows = {}, {}, 0
+        self._max_id, self.folded = 0, 0
+        self._first_week = first_week
+        # Sessions rarely outlast SESSION_MAX_HOURS (the sweeper closes them),
+        # so starting that much before the window is enough to catch the
+        # ones running into it.
+        since = _week_start(first_week) - self.offset - int(config.SESSION_MAX_HOURS * HOUR)
+        rows = archive.iter_query(
+            db, f'SELECT {_COLUMNS} FROM {{sessions}} WHERE start_at >= ? AND computer_id IS NOT NULL',
+            (since,), start=time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(since)),
+        )
+        opened, batch = [], []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == FOLD_BATCH:
+                opened += self._take(batch)
+                batch = []
+        return opened + self._take(batch)
+
+    def _drop_before(self, first_week):
+        for week in [week for week in self._closed if week < first_week]:
+            del self._closed[week]
+        self._first_week = first_week
+
+    def _take(self, rows):
+        """Fold the closed sessions among `rows`; return the open ones."""
+        if not rows:
+            return []
+        data = np.array(rows, dtype=np.int64)
+        closed = data[:, 3] != 0
+        self._fold(self._closed, data[closed, 1], data[closed, 2], data[closed, 3])
+        self.folded += int(closed.sum())
+        self._max_id = max(self._max_id, int(data[:, 0].max()))
+        return [row for row, is_closed in zip(rows, closed) if not is_closed]
+
+    def _fold(self, target, computers, starts, ends):
+        starts = np.maximum(starts + self.offset, _week_start(self._first_week))
+        ends = ends + self.offset
+        inside = ends > starts
+        if not inside.any():
+            return
+        owner, hours, seconds = split_hours(starts[inside], ends[inside])
+        weeks, slots = _week_slot(hours)
+        rows = computers[inside][owner]
+        self._grow(int(rows.max()) + 1)
+        base = int(weeks.min())
+        span = int(weeks.max()) - base + 1
+        cells = self._rows * SLOTS
+        totals = np.bincount(
+            (weeks - base) * cells + rows * SLOTS + slots, weights=seconds, minlength=span * cells
+        ).reshape(span, self._rows, SLOTS)
+        for i in np.flatnonzero(totals.any(axis=(1, 2))):
+            week = base + int(i)
+            if week in target:
+                target[week] += totals[i]
+            else:
+                target[week] = totals[i].copy()
+
+    def _grow(self, rows):
+        # One row per computer id; a new computer widens every week
+        if rows <= self._rows:
+            return
+        for weeks in (self._closed, self._open):
+            for week, totals in weeks.items():
+                weeks[week] = np.pad(totals, ((0, rows - self._rows), (0, 0)))
+        self._rows = rows
+
+    def _seconds(self, weeks, computer_id):
+        """Occupied seconds per slot, summed over `weeks`, for one computer or all of them."""
+        total = np.zeros(SLOTS)
+        for source in (self._closed, self._open):
+            for week in weeks:
+                totals = source.get(week)
+                if totals is None:
+                    continue
+                if computer_id is None:
+                    total += totals.sum(axis=0)
+                elif computer_id < self._rows:
+                    total += totals[computer_id]
+        return total
+
+    def report(self, computer_id=None):
+        """Average and forecast occupancy per hour of the week, as of the last refresh.
+
+        `busy` is the average number of PCs in use (or, for one computer, the
+        share of the hour it was in use); `occupancy` divides that by the
+        number of computers. Grids are 7 rows, Monday first, of 24 hours.
+        """
+        with self._lock:
+            if self._now is None:
+                raise RuntimeError('refresh() the occupancy model before reporting')
+            local_now = self._now + self.offset
+            current = _week_slot(local_now // HOUR)[0]
+            capacity = max(self.computers, 1) if computer_id is None else 1
+
+            # How often each slot came round in the window, counting the current hour
+            start_hour = _week_start(self._first_week) // HOUR
+            seen = np.bincount(_week_slot(np.arange(start_hour, -(-local_now // HOUR)))[1], minlength=SLOTS)
+            busy = self._seconds(range(self._first_week, current + 1), computer_id) / HOUR / np.maximum(seen, 1)
+
+            # Next week: the same hour over the last full weeks, the most
+            # recent weighted highest
+            forecast = None
+            full = [week for week in range(current - self.forecast_weeks, current)
+                    if week >= min(self._closed, default=current)]
+            if full:
+                expected = np.average(
+                    [self._seconds([week], computer_id) / HOUR for week in full],
+                    axis=0, weights=np.arange(1, len(full) + 1),
+                )
+                forecast = {
+                    'week_of': _date(_week_start(current + 1)),
+                    'from_weeks': len(full),
+                    'busy': expected.reshape(7, 24).round(2).tolist(),
+                    'occupancy': (expected / capacity).reshape(7, 24).round(3).tolist(),
+                }
+
+            peak = int(busy.argmax())
+            return {
+                'since': _date(_week_start(self._first_week)),
+                'weeks': current - self._first_week + 1,
+                'computers': self.computers,
+                'days': list(DAYS),
+                'busy': busy.reshape(7, 24).round(2).tolist(),
+                'occupancy': (busy / capacity).reshape(7, 24).round(3).tolist(),
+                'peak': {
+                    'day': DAYS[peak // 24],
+                    'hour': peak % 24,
+                    'busy': round(float(busy[peak]), 2),
+                    'occupancy': round(float(busy[peak] / capacity), 3),
+                },
+                'forecast': forecast,
+                'open_sessions': len(self._pending),
+            }
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get(path):
+    """Return the shared OccupancyModel for a database file."""
+    with _models_lock:
+        if path not in _models:
+            _models[path] = OccupancyModel()
+        return _models[path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the busiest hour of the week and time the occupancy model.')
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--weeks', type=int, default=config.OCCUPANCY_WEEKS)
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    migrations.migrate(db)
+    model = OccupancyModel(weeks=args.weeks)
+    started = time.perf_counter()
+    model.refresh(db)
+    loaded = time.perf_counter() - started
+    started = time.perf_counter()
+    model.refresh(db)
+    refreshed = time.perf_counter() - started
+    peak = model.report()['peak']
+    print(f"{args.db}: {model.folded} sessions in {loaded:.2f}s (refresh {refreshed * 1000:.1f} ms); "
+          f"busiest {peak['day']} {peak['hour']:02d}:00, {peak['busy']:.1f} of {model.computers} PCs")
+    db.close()
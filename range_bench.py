@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import migrations
+import seed
+from bench import _time, prepare
+from db import Database
+
+# Times time-range queries written the old way (the column wrapped in DATE()
+# or julianday(), which every row has to be parsed for) against the same
+# query on the integer epoch columns with a half-open range, on seeded
+# databases shared with bench.py:
+#
+#     python range_bench.py --sizes 100k,1m --output range.json
+#
+# Both forms run on the same migrated file and must agree on the result.
+
+DEFAULT_SIZES = '100k,1m'
+
+
+def _cases():
+    """name -> (before SQL, after SQL, after params)."""
+    now = datetime.now(timezone.utc)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today = int(midnight.timestamp())
+    tomorrow = today + 86400
+    month_ago = int((midnight - timedelta(days=30)).timestamp())
+    quarter_ago = int((midnight - timedelta(days=90)).timestamp())
+    return {
+        'sessions_today': (
+            "SELECT COUNT(*), ROUND(COALESCE(SUM(cost), 0), 2) FROM sessions "
+            "WHERE DATE(start_time) = DATE('now')",
+            "SELECT COUNT(*), ROUND(COALESCE(SUM(cost), 0), 2) FROM sessions "
+            "WHERE start_at >= ? AND start_at < ?",
+            (today, tomorrow),
+        ),
+        'sessions_last_30_days': (
+            "SELECT COUNT(*), ROUND(COALESCE(SUM(cost), 0), 2) FROM sessions "
+            "WHERE DATE(start_time) >= DATE('now', '-30 days') AND DATE(start_time) < DATE('now', '+1 day')",
+            "SELECT COUNT(*), ROUND(COALESCE(SUM(cost), 0), 2) FROM sessions "
+            "WHERE start_at >= ? AND start_at < ?",
+            (month_ago, tomorrow),
+        ),
+        'hours_last_30_days': (
+            "SELECT ROUND(SUM((julianday(end_time) - julianday(start_time)) * 24), 2) FROM sessions "
+            "WHERE DATE(start_time) >= DATE('now', '-30 days') AND DATE(start_time) < DATE('now', '+1 day')",
+            "SELECT ROUND(SUM(end_at - start_at) / 3600.0, 2) FROM sessions "
+            "WHERE start_at >= ? AND start_at < ?",
+            (month_ago, tomorrow),
+        ),
+        'maintenance_last_90_days': (
+            "SELECT COUNT(*) FROM maintenance_logs "
+            "WHERE DATE(maintenance_date) >= DATE('now', '-90 days') AND DATE(maintenance_date) < DATE('now', '+1 day')",
+            "SELECT COUNT(*) FROM maintenance_logs "
+            "WHERE maintained_at >= ? AND maintained_at < ?",
+            (quarter_ago, tomorrow),
+        ),
+    }
+
+
+def benchmark_database(path, repeat):
+    db = Database(path)
+    migrations.migrate(db)
+    results = {}
+    for name, (before, after, params) in _cases().items():
+        results[name] = {
+            'before': _time(lambda: db.query(before), repeat),
+            'after': _time(lambda: db.query(after, params), repeat),
+            'results_match': db.query(before) == db.query(after, params),
+        }
+        results[name]['speedup'] = round(
+            results[name]['before']['median_ms'] / max(results[name]['after']['median_ms'], 0.001), 1
+        )
+    db.close()
+    return results
+
+
+def run(sizes, workdir, repeat, regenerate=False):
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': {},
+    }
+    for sessions in sizes:
+        path = prepare(workdir, sessions, regenerate)
+        report['results'][str(sessions)] = benchmark_database(path, repeat)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark function-wrapped against half-open epoch range queries.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'comma-separated session counts (default: {DEFAULT_SIZES})')
+    parser.add_argument('--workdir', default='bench_data')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--regenerate', action='store_true', help='rebuild cached databases')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    sizes = [seed.parse_count(size) for size in args.sizes.split(',')]
+    report = run(sizes, args.workdir, args.repeat, args.regenerate)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
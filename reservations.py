@@ -0,0 +1,91 @@
+import bisect
+import threading
+import time
+
+# In-process index of booked reservations: computer id -> its booked
+# [start, end) windows, sorted by start. create_reservation() never lets two
+# bookings on one computer overlap, so a computer's windows are disjoint and
+# only the last window starting before a query's end can clash with it: one
+# bisect answers "is this PC free then", and a free-PC search costs
+# O(log n) per computer rather than a scan of every booking. Like the floor
+# state it is loaded once and kept current by the write paths in services;
+# the database stays the authority for the conflict check itself.
+#
+# Times are 'YYYY-MM-DD HH:MM:SS' UTC strings, as stored, so they compare
+# correctly as plain strings.
+
+
+class ReservationIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # computer_id -> sorted starts, and the matching (start, end, id) windows
+        self._starts = {}
+        self._windows = {}
+        # reservation id -> (computer_id, start)
+        self._where = {}
+        self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self.loaded_at is not None
+
+    def load(self, rows):
+        """Replace the index with (reservation_id, computer_id, start, end) rows."""
+        with self._lock:
+            self._starts, self._windows, self._where = {}, {}, {}
+            for reservation_id, computer_id, start, end in sorted(rows, key=lambda row: row[2]):
+                self._starts.setdefault(computer_id, []).append(start)
+                self._windows.setdefault(computer_id, []).append((start, end, reservation_id))
+                self._where[reservation_id] = (computer_id, start)
+            self.loaded_at = time.monotonic()
+
+    def add(self, reservation_id, computer_id, start, end):
+        with self._lock:
+            starts = self._starts.setdefault(computer_id, [])
+            i = bisect.bisect_right(starts, start)
+            starts.insert(i, start)
+            self._windows.setdefault(computer_id, []).insert(i, (start, end, reservation_id))
+            self._where[reservation_id] = (computer_id, start)
+
+    def remove(self, reservation_id):
+        with self._lock:
+            if reservation_id not in self._where:
+                return
+            computer_id, start = self._where.pop(reservation_id)
+            starts, windows = self._starts[computer_id], self._windows[computer_id]
+            i = bisect.bisect_left(starts, start)
+            while windows[i][2] != reservation_id:
+                i += 1
+            del starts[i]
+            del windows[i]
+
+    def _clash(self, computer_id, start, end):
+        starts = self._starts.get(computer_id)
+        if not starts:
+            return None
+        i = bisect.bisect_left(starts, end) - 1
+        if i >= 0 and self._windows[computer_id][i][1] > start:
+            return self._windows[computer_id][i]
+        return None
+
+    def clash(self, computer_id, start, end):
+        """The (start, end, reservation_id) booking overlapping [start, end), or None."""
+        with self._lock:
+            return self._clash(computer_id, start, end)
+
+    def free(self, computer_ids, start, end):
+        """The computers among `computer_ids` with no booking overlapping [start, end)."""
+        with self._lock:
+            return [computer_id for computer_id in computer_ids if self._clash(computer_id, start, end) is None]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get(path):
+    """Return the shared ReservationIndex for a database file."""
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = ReservationIndex()
+        return _indexes[path]
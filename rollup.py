@@ -0,0 +1,197 @@
+import argparse
+
+import archive
+import config
+import migrations
+from db import Database
+
+# daily_stats and computer_stats hold pre-aggregated session counts and
+# revenue so the dashboard never scans the sessions table; hourly_stats and
+# computer_daily_stats do the same for trends over a chosen date range. Sessions are
+# counted on the day they start; revenue is added to that same day when the
+# session ends and its cost is known. Both helpers take the cursor of the
+# caller's write transaction so the rollup commits together with the session.
+
+
+def record_session_start(cursor, session_id):
+    cursor.execute('''
+        INSERT INTO daily_stats (day, session_count, revenue)
+        SELECT DATE(start_time), 1, 0 FROM sessions WHERE id = ?
+        ON CONFLICT (day) DO UPDATE SET session_count = session_count + 1
+    ''', (session_id,))
+    cursor.execute('''
+        INSERT INTO computer_stats (computer_id, session_count, revenue)
+        SELECT computer_id, 1, 0 FROM sessions WHERE id = ?
+        ON CONFLICT (computer_id) DO UPDATE SET session_count = session_count + 1
+    ''', (session_id,))
+    cursor.execute('''
+        INSERT INTO hourly_stats (hour, session_count, revenue)
+        SELECT STRFTIME('%Y-%m-%d %H:00:00', start_time), 1, 0 FROM sessions WHERE id = ?
+        ON CONFLICT (hour) DO UPDATE SET session_count = session_count + 1
+    ''', (session_id,))
+    cursor.execute('''
+        INSERT INTO computer_daily_stats (computer_id, day, session_count, revenue)
+        SELECT computer_id, DATE(start_time), 1, 0 FROM sessions
+        WHERE id = ? AND computer_id IS NOT NULL
+        ON CONFLICT (computer_id, day) DO UPDATE SET session_count = session_count + 1
+    ''', (session_id,))
+
+
+def record_session_end(cursor, session_id):
+    cursor.execute('''
+        UPDATE daily_stats
+        SET revenue = revenue + (SELECT COALESCE(cost, 0) FROM sessions WHERE id = :id)
+        WHERE day = (SELECT DATE(start_time) FROM sessions WHERE id = :id)
+    ''', {'id': session_id})
+    cursor.execute('''
+        UPDATE computer_stats
+        SET revenue = revenue + (SELECT COALESCE(cost, 0) FROM sessions WHERE id = :id)
+        WHERE computer_id = (SELECT computer_id FROM sessions WHERE id = :id)
+    ''', {'id': session_id})
+    cursor.execute('''
+        UPDATE hourly_stats
+        SET revenue = revenue + (SELECT COALESCE(cost, 0) FROM sessions WHERE id = :id)
+        WHERE hour = (SELECT STRFTIME('%Y-%m-%d %H:00:00', start_time) FROM sessions WHERE id = :id)
+    ''', {'id': session_id})
+    cursor.execute('''
+        UPDATE computer_daily_stats
+        SET revenue = revenue + (SELECT COALESCE(cost, 0) FROM sessions WHERE id = :id)
+        WHERE (computer_id, day) = (SELECT computer_id, DATE(start_time) FROM sessions WHERE id = :id)
+    ''', {'id': session_id})
+
+
+def record_sessions_end(cursor, ended):
+    """Bulk form of record_session_end for (start_time, computer_id, cost) rows."""
+    days, computers, hours, computer_days = {}, {}, {}, {}
+    for start_time, computer_id, cost in ended:
+        day, hour, cost = start_time[:10], f'{start_time[:13]}:00:00', cost or 0
+        days[day] = days.get(day, 0) + cost
+        computers[computer_id] = computers.get(computer_id, 0) + cost
+        hours[hour] = hours.get(hour, 0) + cost
+        computer_days[computer_id, day] = computer_days.get((computer_id, day), 0) + cost
+    cursor.executemany(
+        'UPDATE daily_stats SET revenue = revenue + ? WHERE day = ?',
+        [(revenue, day) for day, revenue in days.items()]
+    )
+    cursor.executemany(
+        'UPDATE computer_stats SET revenue = revenue + ? WHERE computer_id = ?',
+        [(revenue, computer_id) for computer_id, revenue in computers.items()]
+    )
+    cursor.executemany(
+        'UPDATE hourly_stats SET revenue = revenue + ? WHERE hour = ?',
+        [(revenue, hour) for hour, revenue in hours.items()]
+    )
+    cursor.executemany(
+        'UPDATE computer_daily_stats SET revenue = revenue + ? WHERE computer_id = ? AND day = ?',
+        [(revenue, computer_id, day) for (computer_id, day), revenue in computer_days.items()]
+    )
+
+
+def rebuild(cursor):
+    """Recompute all rollup tables from the sessions table."""
+    cursor.execute('DELETE FROM daily_stats')
+    cursor.execute('''
+        INSERT INTO daily_stats (day, session_count, revenue)
+        SELECT DATE(start_time), COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        GROUP BY DATE(start_time)
+    ''')
+    cursor.execute('DELETE FROM computer_stats')
+    cursor.execute('''
+        INSERT INTO computer_stats (computer_id, session_count, revenue)
+        SELECT computer_id, COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        WHERE computer_id IS NOT NULL
+        GROUP BY computer_id
+    ''')
+    rebuild_range_rollups(cursor)
+
+
+def rebuild_range_rollups(cursor):
+    cursor.execute('DELETE FROM hourly_stats')
+    cursor.execute('''
+        INSERT INTO hourly_stats (hour, session_count, revenue)
+        SELECT STRFTIME('%Y-%m-%d %H:00:00', start_time), COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        GROUP BY 1
+    ''')
+    cursor.execute('DELETE FROM computer_daily_stats')
+    cursor.execute('''
+        INSERT INTO computer_daily_stats (computer_id, day, session_count, revenue)
+        SELECT computer_id, DATE(start_time), COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        WHERE computer_id IS NOT NULL
+        GROUP BY 1, 2
+    ''')
+
+
+def add_archived_range_rollups(cursor, directory):
+    """Fold the sessions archived in `directory` into hourly_stats and computer_daily_stats.
+
+    Archive files each hold one start month, so rows are upserted straight
+    from each file without merging first.
+    """
+    cursor.executemany('''
+        INSERT INTO hourly_stats (hour, session_count, revenue) VALUES (?, ?, ?)
+        ON CONFLICT (hour) DO UPDATE SET
+            session_count = session_count + excluded.session_count,
+            revenue = revenue + excluded.revenue
+    ''', archive.scan(directory, '''
+        SELECT STRFTIME('%Y-%m-%d %H:00:00', start_time), COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        GROUP BY 1
+    '''))
+    cursor.executemany('''
+        INSERT INTO computer_daily_stats (computer_id, day, session_count, revenue) VALUES (?, ?, ?, ?)
+        ON CONFLICT (computer_id, day) DO UPDATE SET
+            session_count = session_count + excluded.session_count,
+            revenue = revenue + excluded.revenue
+    ''', archive.scan(directory, '''
+        SELECT computer_id, DATE(start_time), COUNT(*), COALESCE(SUM(cost), 0)
+        FROM sessions
+        WHERE computer_id IS NOT NULL
+        GROUP BY 1, 2
+    '''))
+
+
+def add_archived(cursor, db):
+    """Fold sessions from the monthly archive files into freshly rebuilt rollups."""
+    days = archive.merge(archive.query(db, '''
+        SELECT DATE(start_time), COUNT(*), COALESCE(SUM(cost), 0)
+        FROM {sessions}
+        GROUP BY DATE(start_time)
+    ''', include_hot=False))
+    cursor.executemany('''
+        INSERT INTO daily_stats (day, session_count, revenue) VALUES (?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            session_count = session_count + excluded.session_count,
+            revenue = revenue + excluded.revenue
+    ''', days)
+    computers = archive.merge(archive.query(db, '''
+        SELECT computer_id, COUNT(*), COALESCE(SUM(cost), 0)
+        FROM {sessions}
+        WHERE computer_id IS NOT NULL
+        GROUP BY computer_id
+    ''', include_hot=False))
+    cursor.executemany('''
+        INSERT INTO computer_stats (computer_id, session_count, revenue) VALUES (?, ?, ?)
+        ON CONFLICT (computer_id) DO UPDATE SET
+            session_count = session_count + excluded.session_count,
+            revenue = revenue + excluded.revenue
+    ''', computers)
+    add_archived_range_rollups(cursor, archive.directory_of(db))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the dashboard rollup tables from hot and archived sessions.')
+    parser.add_argument('path', nargs='?', default=config.DB_PATH)
+    args = parser.parse_args()
+
+    db = Database(args.path)
+    migrations.migrate(db)
+    with db.transaction() as cursor:
+        rebuild(cursor)
+        add_archived(cursor, db)
+    days = db.query_one('SELECT COUNT(*) FROM daily_stats')[0]
+    print(f'{args.path}: rebuilt rollups for {days} days')
+    db.close()
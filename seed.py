@@ -0,0 +1,181 @@
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+import migrations
+import rollup
+from db import Database
+
+# Seeded synthetic data for load testing. The same arguments and seed always
+# produce the same database, so benchmark runs are comparable across releases.
+
+SPECS = [
+    ('Intel i5, 16GB RAM, RTX 3060', 30.0),
+    ('Intel i7, 32GB RAM, RTX 3070', 35.0),
+    ('AMD Ryzen 7, 16GB RAM, RX 6700', 30.0),
+    ('Intel i9, 64GB RAM, RTX 4080', 50.0),
+]
+MAINTENANCE_TYPES = ["Routine Checkup", "Hardware Repair", "Software Update", "Deep Cleaning", "Other"]
+TECHNICIANS = ['Arjun', 'Meera', 'Ravi', 'Sana', 'Vikram']
+INVENTORY = [
+    ('Chips', 'Snacks', 20.0), ('Cola', 'Drinks', 40.0), ('Coffee', 'Drinks', 60.0),
+    ('Chocolate', 'Snacks', 30.0), ('Headset', 'Peripherals', 900.0), ('Mouse', 'Peripherals', 450.0),
+    ('Keyboard', 'Peripherals', 1200.0), ('USB Drive', 'Peripherals', 350.0), ('Water', 'Drinks', 20.0),
+]
+
+BATCH_SIZE = 100_000
+# Computers per floor zone
+ZONE_SIZE = 20
+
+
+def _timestamps(seconds, origin):
+    """Format epoch offsets from `origin` like SQLite's CURRENT_TIMESTAMP."""
+    stamps = np.datetime64(origin, 's') + seconds.astype('timedelta64[s]')
+    return np.char.replace(np.datetime_as_string(stamps, unit='s'), 'T', ' ')
+
+
+def _epoch(moment):
+    return int(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _insert_sessions(cursor, rng, count, users, rates, years, now):
+    span = int(years * 365 * 24 * 3600)
+    origin = now - timedelta(seconds=span)
+    # Sessions are generated in start-time order so index inserts append.
+    starts = np.sort(rng.integers(0, span - 12 * 3600, count))
+    for lo in range(0, count, BATCH_SIZE):
+        chunk = starts[lo:lo + BATCH_SIZE]
+        n = len(chunk)
+        computer_ids = rng.integers(1, len(rates) + 1, n)
+        user_ids = rng.integers(1, users + 1, n)
+        durations = np.round(rng.gamma(2.0, 0.75, n).clip(0.25, 12.0), 4)
+        costs = np.round(durations * rates[computer_ids - 1], 2)
+        ends = chunk + (durations * 3600).astype(np.int64)
+        # The epoch columns are filled here, which skips the triggers that
+        # would otherwise derive them row by row.
+        cursor.executemany('''
+            INSERT INTO sessions (user_id, computer_id, start_time, end_time, duration, cost, start_at, end_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', zip(
+            user_ids.tolist(),
+            computer_ids.tolist(),
+            _timestamps(chunk, origin).tolist(),
+            _timestamps(ends, origin).tolist(),
+            durations.tolist(),
+            costs.tolist(),
+            (chunk + _epoch(origin)).tolist(),
+            (ends + _epoch(origin)).tolist(),
+        ))
+
+
+def generate(path, users=1000, computers=50, sessions=10_000, years=2.0,
+             maintenance=500, inventory=len(INVENTORY), open_ratio=0.2, seed=42):
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+    db = Database(path)
+    migrations.migrate(db)
+    with db.connection() as conn:
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('BEGIN')
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            'INSERT INTO users (name, email, password) VALUES (?, ?, ?)',
+            ((f'User {i}', f'user{i}@example.com', 'password') for i in range(1, users + 1))
+        )
+
+        specs = [SPECS[i] for i in rng.integers(0, len(SPECS), computers)]
+        cursor.executemany('''
+            INSERT INTO computers (name, status, specifications, last_maintenance, hourly_rate, zone)
+            VALUES (?, 'available', ?, ?, ?, ?)
+        ''', ((f'PC-{i:03d}', spec, str(now), rate, f'Zone {(i - 1) // ZONE_SIZE + 1}')
+              for i, (spec, rate) in enumerate(specs, 1)))
+        rates = np.array([rate for _, rate in specs])
+
+        _insert_sessions(cursor, rng, sessions, users, rates, years, now)
+
+        # Some computers are in use right now
+        busy = rng.choice(computers, int(computers * open_ratio), replace=False) + 1
+        for computer_id in busy.tolist():
+            started = now - timedelta(minutes=int(rng.integers(5, 240)))
+            cursor.execute('''
+                INSERT INTO sessions (user_id, computer_id, start_time)
+                VALUES (?, ?, ?)
+            ''', (int(rng.integers(1, users + 1)), computer_id, str(started)))
+        cursor.executemany(
+            "UPDATE computers SET status = 'in-use' WHERE id = ?",
+            ((computer_id,) for computer_id in busy.tolist())
+        )
+
+        span = int(years * 365 * 24 * 3600)
+        log_offsets = np.sort(rng.integers(0, span, maintenance))
+        log_origin = now - timedelta(seconds=span)
+        cursor.executemany('''
+            INSERT INTO maintenance_logs (computer_id, maintenance_date, description, technician, maintained_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            (
+                int(rng.integers(1, computers + 1)),
+                date,
+                f"{MAINTENANCE_TYPES[rng.integers(len(MAINTENANCE_TYPES))]}: generated",
+                TECHNICIANS[rng.integers(len(TECHNICIANS))],
+                maintained_at,
+            )
+            for date, maintained_at in zip(
+                _timestamps(log_offsets, log_origin).tolist(),
+                (log_offsets + _epoch(log_origin)).tolist(),
+            )
+        ))
+
+        items = []
+        for i in range(inventory):
+            name, category, price = INVENTORY[i % len(INVENTORY)]
+            if i >= len(INVENTORY):
+                name = f'{name} #{i // len(INVENTORY) + 1}'
+            items.append((name, int(rng.integers(0, 200)), price, category))
+        cursor.executemany('''
+            INSERT INTO inventory (item_name, quantity, price_per_item, category)
+            VALUES (?, ?, ?, ?)
+        ''', items)
+
+        rollup.rebuild(cursor)
+        conn.commit()
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('ANALYZE')
+    db.close()
+
+
+def parse_count(text):
+    """Parse counts like 10000, 10k or 1m."""
+    text = text.strip().lower().replace('_', '')
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill a new database with synthetic cyber cafe data.')
+    parser.add_argument('path')
+    parser.add_argument('--users', type=parse_count, default=1000)
+    parser.add_argument('--computers', type=parse_count, default=50)
+    parser.add_argument('--sessions', type=parse_count, default=10_000)
+    parser.add_argument('--years', type=float, default=2.0, help='span of session history')
+    parser.add_argument('--maintenance', type=parse_count, default=500)
+    parser.add_argument('--inventory', type=parse_count, default=len(INVENTORY))
+    parser.add_argument('--open-ratio', type=float, default=0.2, help='share of computers with an open session')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help='overwrite an existing file')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            parser.error(f'{args.path} exists; pass --force to overwrite it')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+
+    generate(args.path, args.users, args.computers, args.sessions, args.years,
+             args.maintenance, args.inventory, args.open_ratio, args.seed)
+    print(f'{args.path}: {args.sessions} sessions, {args.users} users, {args.computers} computers')
@@ -0,0 +1,1128 @@
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import cache
+import config
+import floor
+import reservations
+import rollup
+
+
+class SessionConflict(Exception):
+    """Another clerk changed the computer or session first; safe to retry."""
+
+
+class SessionNotOpen(Exception):
+    """The session was already closed; retrying will not help."""
+
+
+class ReservationConflict(Exception):
+    """The computer is booked by someone else for that time; retrying will not help."""
+
+
+class OutOfStock(Exception):
+    """A sale asked for more of an item than is in stock; nothing was sold."""
+
+
+def _is_busy(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def authenticate(db, email, password):
+    user = db.query_one(
+        'SELECT id, name, email, role FROM users WHERE email = ? AND password = ?',
+        (email, password)
+    )
+    if user is None:
+        return None
+    return {'id': user[0], 'name': user[1], 'email': user[2], 'role': user[3]}
+
+
+def start_session(db, user_id, computer_id, hours=None):
+    """Book an available computer for a user and return the new session id.
+
+    The status flip is a compare-and-set inside the write transaction, and
+    the unique index on open sessions per computer backs it up, so two
+    clerks can never both book the same PC.
+
+    A PC held for a reservation (see RESERVATION_HOLD_MINUTES) can only be
+    started by the customer who booked it, which fulfils the booking;
+    anyone else gets ReservationConflict.
+
+    `hours` is how long the customer paid for; the session is booked until
+    then (or until the reservation it fulfils ends), which lets the sweeper
+    close it once that time is up. A paid window running into someone
+    else's booking is refused with ReservationConflict as well.
+    """
+    hold = config.RESERVATION_HOLD_MINUTES
+    try:
+        with db.transaction() as cursor:
+            held = cursor.execute('''
+                SELECT id, user_id, start_time, end_time FROM reservations
+                WHERE computer_id = ? AND status = 'booked'
+                  AND start_time < DATETIME('now', ?) AND start_time > DATETIME('now', ?)
+                  AND end_time > CURRENT_TIMESTAMP
+                ORDER BY start_time
+            ''', (computer_id, f'+{hold} minutes', f'-{hold} minutes')).fetchall()
+            others = [r for r in held if r[1] != user_id]
+            if others:
+                raise ReservationConflict(f'This computer is reserved from {others[0][2]} (UTC).')
+            if hours:
+                booked_until = cursor.execute(
+                    "SELECT DATETIME('now', ?)", (f'+{round(hours * 60)} minutes',)
+                ).fetchone()[0]
+                later = cursor.execute('''
+                    SELECT start_time FROM reservations
+                    WHERE computer_id = ? AND status = 'booked' AND user_id != ?
+                      AND start_time < ? AND start_time > DATETIME('now', ?)
+                    ORDER BY start_time
+                    LIMIT 1
+                ''', (computer_id, user_id, booked_until, f'-{hold} minutes')).fetchone()
+                if later:
+                    raise ReservationConflict(
+                        f'This computer is reserved from {later[0]} (UTC), before the paid time runs out.'
+                    )
+            else:
+                booked_until = held[0][3] if held else None
+
+            cursor.execute('''
+                UPDATE computers SET status = 'in-use'
+                WHERE id = ? AND status = 'available'
+            ''', (computer_id,))
+            if cursor.rowcount == 0:
+                raise SessionConflict('This computer was just taken or is no longer available.')
+
+            cursor.execute('''
+                INSERT INTO sessions (user_id, computer_id, start_time, booked_until)
+                VALUES (?, ?, CURRENT_TIMESTAMP, ?)
+            ''', (user_id, computer_id, booked_until))
+            session_id = cursor.lastrowid
+            rollup.record_session_start(cursor, session_id)
+            if held:
+                cursor.execute('''
+                    UPDATE reservations SET status = 'fulfilled', session_id = ?
+                    WHERE id = ?
+                ''', (session_id, held[0][0]))
+    except sqlite3.IntegrityError:
+        raise SessionConflict('This computer already has an open session.') from None
+    except sqlite3.OperationalError as e:
+        if _is_busy(e):
+            raise SessionConflict('The database is busy, please try again.') from None
+        raise
+
+    cache.bump()
+    _refresh_floor(db, computer_id)
+    if held:
+        reservations.get(db.path).remove(held[0][0])
+    return session_id
+
+
+def end_session(db, session_id):
+    """Close an open session and free its computer.
+
+    Returns the billed (duration_hours, cost). Raises SessionNotOpen if the
+    session was already closed by someone else.
+    """
+    try:
+        with db.transaction() as cursor:
+            session = cursor.execute('''
+                SELECT
+                    s.computer_id,
+                    c.hourly_rate,
+                    CURRENT_TIMESTAMP,
+                    (CAST(STRFTIME('%s', CURRENT_TIMESTAMP) AS INTEGER) - s.start_at) / 3600.0 AS duration
+                FROM sessions s
+                JOIN computers c ON s.computer_id = c.id
+                WHERE s.id = ? AND s.end_time IS NULL
+            ''', (session_id,)).fetchone()
+            if session is None:
+                raise SessionNotOpen('This session has already been ended.')
+
+            computer_id, hourly_rate, closed_at, duration = session
+            cost = duration * hourly_rate
+
+            cursor.execute('''
+                UPDATE sessions
+                SET end_time = ?,
+                    duration = ?,
+                    cost = ?
+                WHERE id = ? AND end_time IS NULL
+            ''', (closed_at, duration, cost, session_id))
+            rollup.record_session_end(cursor, session_id)
+
+            cursor.execute('''
+                UPDATE computers SET status = 'available'
+                WHERE id = ? AND status = 'in-use'
+            ''', (computer_id,))
+    except sqlite3.OperationalError as e:
+        if _is_busy(e):
+            raise SessionConflict('The database is busy, please try again.') from None
+        raise
+
+    cache.bump()
+    _refresh_floor(db, computer_id)
+    return duration, cost
+
+
+def end_sessions(db, session_ids=None):
+    """Close many open sessions at once, e.g. all of them at closing time.
+
+    Closes every open session, or only those in `session_ids`, in a single
+    write transaction. Durations and costs are computed in SQL against one
+    closing timestamp, and the freed computers are updated in one statement.
+    Sessions that were already closed are skipped. Returns the bill:
+    closed_at, sessions (one dict each), count, total_hours, total_cost
+    (time), total_items (desk sales put on the sessions) and total_due.
+    """
+    where, params = '', ()
+    if session_ids is not None:
+        if not session_ids:
+            return {'closed_at': None, 'sessions': [], 'count': 0, 'total_hours': 0.0,
+                    'total_cost': 0.0, 'total_items': 0.0, 'total_due': 0.0}
+        where = f"AND s.id IN ({', '.join('?' * len(session_ids))})"
+        params = tuple(session_ids)
+
+    try:
+        with db.transaction() as cursor:
+            closed_at = cursor.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0]
+            rows = cursor.execute(f'''
+                SELECT
+                    s.id,
+                    s.computer_id,
+                    c.name,
+                    u.name,
+                    s.start_time,
+                    (CAST(STRFTIME('%s', ?) AS INTEGER) - s.start_at) / 3600.0 AS duration,
+                    c.hourly_rate
+                FROM sessions s
+                JOIN computers c ON s.computer_id = c.id
+                LEFT JOIN users u ON s.user_id = u.id
+                WHERE s.end_time IS NULL {where}
+                ORDER BY c.name
+            ''', (closed_at, *params)).fetchall()
+            items = dict(cursor.execute(f'''
+                SELECT i.session_id, SUM(i.quantity * i.unit_price)
+                FROM sale_items i
+                JOIN sessions s ON s.id = i.session_id
+                WHERE s.end_time IS NULL {where}
+                GROUP BY i.session_id
+            ''', params).fetchall())
+            sessions = [
+                {
+                    'session_id': r[0],
+                    'computer_id': r[1],
+                    'computer_name': r[2],
+                    'user_name': r[3],
+                    'start_time': r[4],
+                    'end_time': closed_at,
+                    'duration': r[5],
+                    'hourly_rate': r[6],
+                    'cost': r[5] * r[6],
+                    'items_total': items.get(r[0], 0.0),
+                }
+                for r in rows
+            ]
+            _close_sessions(cursor, sessions)
+    except sqlite3.OperationalError as e:
+        if _is_busy(e):
+            raise SessionConflict('The database is busy, please try again.') from None
+        raise
+
+    if sessions:
+        _reload_floor(db)
+    return {
+        'closed_at': closed_at,
+        'sessions': sessions,
+        'count': len(sessions),
+        'total_hours': sum(b['duration'] for b in sessions),
+        'total_cost': sum(b['cost'] for b in sessions),
+        'total_items': sum(b['items_total'] for b in sessions),
+        'total_due': sum(b['cost'] + b['items_total'] for b in sessions),
+    }
+
+
+def _close_sessions(cursor, sessions):
+    """Close sessions (dicts with session_id, computer_id, start_time,
+    end_time, duration, cost and an optional close reason) inside the
+    caller's write transaction and free their computers in one statement."""
+    if not sessions:
+        return
+    cursor.executemany('''
+        UPDATE sessions
+        SET end_time = ?,
+            duration = ?,
+            cost = ?,
+            close_reason = ?
+        WHERE id = ? AND end_time IS NULL
+    ''', [(b['end_time'], b['duration'], b['cost'], b.get('reason'), b['session_id']) for b in sessions])
+    rollup.record_sessions_end(
+        cursor, [(b['start_time'], b['computer_id'], b['cost']) for b in sessions]
+    )
+    computer_ids = sorted({b['computer_id'] for b in sessions})
+    cursor.execute(f'''
+        UPDATE computers SET status = 'available'
+        WHERE status = 'in-use' AND id IN ({', '.join('?' * len(computer_ids))})
+    ''', computer_ids)
+
+
+def _reload_floor(db):
+    cache.bump()
+    state = floor.get(db.path)
+    if state.loaded:
+        state.load(computer_status(db))
+
+
+def _utc(seconds):
+    """Format epoch seconds like CURRENT_TIMESTAMP."""
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def sweep_sessions(db):
+    """Close forgotten sessions; return one dict per closed session, with its reason.
+
+    A session is closed when the first of these applies:
+
+    - idle: its PC's agent has reported nobody logged in for
+      SWEEP_IDLE_MINUTES, or went silent that long. It is billed up to the
+      last moment someone was seen logged in.
+    - overdue: its booked time ended SWEEP_GRACE_MINUTES ago. It is billed
+      up to now.
+    - max_hours: it has run SESSION_MAX_HOURS. It is billed for exactly
+      that long.
+
+    The scan reads only open sessions, through their partial index, and all
+    closes commit in one write transaction, re-checked under the write lock
+    so a session ended at the desk meanwhile is left alone.
+    """
+    try:
+        with db.transaction() as cursor:
+            now = cursor.execute("SELECT CAST(STRFTIME('%s', 'now') AS INTEGER)").fetchone()[0]
+            # Every time as epoch seconds, so the rules below are integer compares
+            rows = cursor.execute('''
+                SELECT s.id, s.computer_id, s.start_time, s.start_at, c.hourly_rate,
+                       CAST(STRFTIME('%s', s.booked_until) AS INTEGER),
+                       CAST(STRFTIME('%s', h.seen_at) AS INTEGER),
+                       CAST(STRFTIME('%s', h.active_at) AS INTEGER),
+                       c.name, u.name
+                FROM sessions s
+                JOIN computers c ON c.id = s.computer_id
+                LEFT JOIN computer_heartbeats h ON h.computer_id = s.computer_id
+                LEFT JOIN users u ON u.id = s.user_id
+                WHERE s.end_time IS NULL
+            ''').fetchall()
+            closed = []
+            for session_id, computer_id, start_time, start, rate, booked_until, seen_at, active_at, pc, user in rows:
+                due = []
+                # Only PCs whose agent has reported during this session: a
+                # broken agent must not make every session look idle.
+                if seen_at is not None and seen_at >= start and config.SWEEP_IDLE_MINUTES:
+                    last_active = max(start, active_at or start)
+                    if now - last_active >= config.SWEEP_IDLE_MINUTES * 60:
+                        due.append((last_active, 'idle'))
+                if booked_until is not None and now - booked_until >= config.SWEEP_GRACE_MINUTES * 60:
+                    due.append((now, 'overdue'))
+                if now - start >= config.SESSION_MAX_HOURS * 3600:
+                    due.append((start + round(config.SESSION_MAX_HOURS * 3600), 'max_hours'))
+                if not due:
+                    continue
+                end, reason = min(due)
+                duration = (end - start) / 3600
+                closed.append({
+                    'session_id': session_id,
+                    'computer_id': computer_id,
+                    'computer_name': pc,
+                    'user_name': user,
+                    'start_time': start_time,
+                    'end_time': _utc(end),
+                    'duration': duration,
+                    'cost': duration * rate,
+                    'reason': reason,
+                })
+            _close_sessions(cursor, closed)
+    except sqlite3.OperationalError as e:
+        if _is_busy(e):
+            return []  # the desk is writing; the next sweep picks these up
+        raise
+
+    if closed:
+        _reload_floor(db)
+    return closed
+
+
+def swept_sessions(db, limit=20):
+    """Sessions most recently closed by the sweeper, newest first."""
+    rows = db.query('''
+        SELECT s.id, c.name, u.name, s.start_time, s.end_time, s.duration, s.cost, s.close_reason
+        FROM sessions s
+        JOIN computers c ON c.id = s.computer_id
+        LEFT JOIN users u ON u.id = s.user_id
+        WHERE s.close_reason IS NOT NULL
+        ORDER BY s.end_at DESC
+        LIMIT ?
+    ''', (limit,))
+    return [
+        {'session_id': r[0], 'computer_name': r[1], 'user_name': r[2], 'start_time': r[3],
+         'end_time': r[4], 'duration': r[5], 'cost': r[6], 'reason': r[7]}
+        for r in rows
+    ]
+
+
+def available_computers(db, user_id=None):
+    """Computers a walk-in can start now; PCs held for a reservation show only to its customer."""
+    hold = config.RESERVATION_HOLD_MINUTES
+    rows = db.query('''
+        SELECT id, name, specifications, hourly_rate
+        FROM computers c
+        WHERE status = 'available'
+          AND NOT EXISTS (
+            SELECT 1 FROM reservations r
+            WHERE r.computer_id = c.id AND r.status = 'booked' AND r.user_id IS NOT ?
+              AND r.start_time < DATETIME('now', ?) AND r.start_time > DATETIME('now', ?)
+              AND r.end_time > CURRENT_TIMESTAMP
+          )
+    ''', (user_id, f'+{hold} minutes', f'-{hold} minutes'))
+    return [
+        {'id': r[0], 'name': r[1], 'specifications': r[2], 'hourly_rate': r[3]}
+        for r in rows
+    ]
+
+
+def active_sessions(db, user_id=None):
+    """Open sessions of one user, or of everyone when user_id is None."""
+    where, params = ('AND s.user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    rows = db.query(f'''
+        SELECT
+            s.id,
+            c.name,
+            s.start_time,
+            c.hourly_rate,
+            u.name,
+            (CAST(STRFTIME('%s', 'now') AS INTEGER) - s.start_at) / 3600.0
+        FROM sessions s
+        JOIN computers c ON s.computer_id = c.id
+        LEFT JOIN users u ON s.user_id = u.id
+        WHERE s.end_time IS NULL {where}
+    ''', params)
+    return [
+        {'id': r[0], 'computer_name': r[1], 'start_time': r[2], 'hourly_rate': r[3], 'user_name': r[4],
+         'duration': r[5]}
+        for r in rows
+    ]
+
+
+def computer_status(db, computer_id=None):
+    where, params = ('WHERE c.id = ?', (computer_id,)) if computer_id is not None else ('', ())
+    rows = db.query(f'''
+        SELECT
+            c.id,
+            c.name,
+            c.status,
+            c.specifications,
+            c.last_maintenance,
+            CASE
+                WHEN s.id IS NOT NULL THEN u.name
+                ELSE NULL
+            END as current_user,
+            s.start_time,
+            c.zone
+        FROM computers c
+        LEFT JOIN sessions s ON c.id = s.computer_id AND s.end_time IS NULL
+        LEFT JOIN users u ON s.user_id = u.id
+        {where}
+    ''', params)
+    return [
+        {
+            'id': r[0],
+            'name': r[1],
+            'status': r[2],
+            'specifications': r[3],
+            'last_maintenance': r[4],
+            'current_user': r[5],
+            'session_start': r[6],
+            'zone': r[7],
+        }
+        for r in rows
+    ]
+
+
+def floor_state(db):
+    """Return the live floor model, loading it on first use.
+
+    A full reload every FLOOR_RESYNC_SECONDS picks up writes made by other
+    processes, such as the HTTP API running separately.
+    """
+    state = floor.get(db.path)
+    if not state.loaded or time.monotonic() - state.loaded_at > config.FLOOR_RESYNC_SECONDS:
+        state.load(computer_status(db))
+    return state
+
+
+def _refresh_floor(db, computer_id):
+    state = floor.get(db.path)
+    if state.loaded:
+        for card in computer_status(db, computer_id):
+            state.apply(card)
+
+
+def inventory_items(db):
+    rows = db.query('''
+        SELECT id, item_name, category, quantity, price_per_item, reorder_level
+        FROM inventory
+        ORDER BY category, item_name
+    ''')
+    return [
+        {'id': r[0], 'item_name': r[1], 'category': r[2], 'quantity': r[3],
+         'price_per_item': r[4], 'reorder_level': r[5]}
+        for r in rows
+    ]
+
+
+def low_stock(db):
+    """Items at or below their reorder level, emptiest first.
+
+    Reads only the partial index idx_inventory_low_stock, which holds just
+    those items, so it stays cheap however large the catalogue grows.
+    """
+    rows = db.query('''
+        SELECT id, item_name, quantity, reorder_level
+        FROM inventory
+        WHERE quantity <= reorder_level
+        ORDER BY quantity
+    ''')
+    return [{'id': r[0], 'item_name': r[1], 'quantity': r[2], 'reorder_level': r[3]} for r in rows]
+
+
+def sell_items(db, items, session_id=None, sold_by=None):
+    """Ring up a cart of (item_id, quantity) pairs in one write transaction.
+
+    Repeated items are summed first; stock is checked, decremented and the
+    sale lines inserted at the current prices with one executemany each, so
+    a whole cart costs a single commit. With session_id the lines go on that
+    open session's bill. If any item is short nothing is sold and OutOfStock
+    names the items. Returns the cart total.
+    """
+    cart = {}
+    for item_id, quantity in items:
+        if quantity <= 0:
+            raise ValueError('quantities must be positive')
+        cart[item_id] = cart.get(item_id, 0) + quantity
+    if not cart:
+        raise ValueError('the cart is empty')
+    lines = sorted(cart.items())
+
+    try:
+        with db.transaction() as cursor:
+            if session_id is not None:
+                open_session = cursor.execute(
+                    'SELECT 1 FROM sessions WHERE id = ? AND end_time IS NULL', (session_id,)
+                ).fetchone()
+                if open_session is None:
+                    raise SessionNotOpen('This session has already been ended.')
+
+            # The write lock is already held, so stock read here cannot
+            # change before the decrement below.
+            placeholders = ', '.join('?' * len(lines))
+            stock = {r[0]: r[1:] for r in cursor.execute(f'''
+                SELECT id, item_name, quantity, price_per_item FROM inventory
+                WHERE id IN ({placeholders})
+            ''', [item_id for item_id, _ in lines]).fetchall()}
+            missing = [str(item_id) for item_id, _ in lines if item_id not in stock]
+            if missing:
+                raise ValueError(f"unknown item(s): {', '.join(missing)}")
+            short = [f'{stock[item_id][0]} ({stock[item_id][1]} left)'
+                     for item_id, quantity in lines if stock[item_id][1] < quantity]
+            if short:
+                raise OutOfStock(f"Not enough stock: {', '.join(short)}.")
+
+            cursor.executemany('''
+                UPDATE inventory
+                SET quantity = quantity - ?, last_updated = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(quantity, item_id) for item_id, quantity in lines])
+            cursor.executemany('''
+                INSERT INTO sale_items (session_id, item_id, quantity, unit_price, sold_by)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(session_id, item_id, quantity, stock[item_id][2] or 0, sold_by) for item_id, quantity in lines])
+            total = sum(quantity * (stock[item_id][2] or 0) for item_id, quantity in lines)
+    except sqlite3.OperationalError as e:
+        if _is_busy(e):
+            raise SessionConflict('The database is busy, please try again.') from None
+        raise
+
+    cache.bump()
+    return total
+
+
+def restock(db, item_id, quantity):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            UPDATE inventory
+            SET quantity = quantity + ?, last_updated = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (quantity, item_id))
+        if cursor.rowcount == 0:
+            raise ValueError(f'unknown item {item_id}')
+    cache.bump()
+
+
+def session_items(db, session_id):
+    """Items sold onto a session's bill, one row per sale line."""
+    rows = db.query('''
+        SELECT i.item_name, s.quantity, s.unit_price, s.sold_at
+        FROM sale_items s
+        JOIN inventory i ON i.id = s.item_id
+        WHERE s.session_id = ?
+        ORDER BY s.id
+    ''', (session_id,))
+    return [
+        {'item_name': r[0], 'quantity': r[1], 'unit_price': r[2], 'amount': r[1] * r[2], 'sold_at': r[3]}
+        for r in rows
+    ]
+
+
+def _timestamp(value):
+    """Normalise a datetime or ISO string to the stored 'YYYY-MM-DD HH:MM:SS' UTC form.
+
+    Naive values are taken to be UTC already, like CURRENT_TIMESTAMP.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def reservation_index(db):
+    """Return the booked-reservation index, loading it on first use.
+
+    Reloaded every FLOOR_RESYNC_SECONDS, like the floor state, to pick up
+    bookings made by other processes; bookings already over are left out.
+    """
+    index = reservations.get(db.path)
+    if not index.loaded or time.monotonic() - index.loaded_at > config.FLOOR_RESYNC_SECONDS:
+        index.load(db.query('''
+            SELECT id, computer_id, start_time, end_time FROM reservations
+            WHERE status = 'booked' AND end_time > CURRENT_TIMESTAMP
+        '''))
+    return index
+
+
+def free_computers(db, start, end):
+    """Computers with no booking overlapping [start, end), for reserving that window.
+
+    PCs under maintenance are left out; so are PCs in use right now when
+    the window starts within RESERVATION_HOLD_MINUTES, since their open
+    session has no planned end.
+    """
+    start, end = _timestamp(start), _timestamp(end)
+    if end <= start:
+        raise ValueError('end must be after start')
+    soon = db.query_one("SELECT ? < DATETIME('now', ?)",
+                        (start, f'+{config.RESERVATION_HOLD_MINUTES} minutes'))[0]
+    rows = db.query(f'''
+        SELECT id, name, specifications, hourly_rate
+        FROM computers
+        WHERE status {"= 'available'" if soon else "!= 'maintenance'"}
+        ORDER BY id
+    ''')
+    free = set(reservation_index(db).free([r[0] for r in rows], start, end))
+    return [
+        {'id': r[0], 'name': r[1], 'specifications': r[2], 'hourly_rate': r[3]}
+        for r in rows if r[0] in free
+    ]
+
+
+def create_reservation(db, user_id, computer_ids, start, end):
+    """Book one or more computers for a user over [start, end); return the new ids.
+
+    A group booking is all or nothing: if any computer is already booked for
+    an overlapping window, or is busy and the window starts within
+    RESERVATION_HOLD_MINUTES, nothing is booked and ReservationConflict
+    names the computers in the way.
+    """
+    start, end = _timestamp(start), _timestamp(end)
+    if end <= start:
+        raise ValueError('end must be after start')
+    computer_ids = sorted(set(computer_ids))
+    if not computer_ids:
+        raise ValueError('choose at least one computer')
+    hold = f'+{config.RESERVATION_HOLD_MINUTES} minutes'
+    try:
+        with db.transaction() as cursor:
+            now = cursor.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0]
+            if end <= now:
+                raise ValueError('that time is already over')
+            soon = cursor.execute("SELECT ? < DATETIME('now', ?)", (start, hold)).fetchone()[0]
+            placeholders = ', '.join('?' * len(computer_ids))
+            computers = dict(cursor.execute(f'''
+                SELECT id, name FROM computers WHERE id IN ({placeholders})
+            ''', computer_ids).fetchall())
+            missing = [str(c) for c in computer_ids if c not in computers]
+            if missing:
+                raise ValueError(f"unknown computer(s): {', '.join(missing)}")
+
+            taken = cursor.execute(f'''
+                SELECT DISTINCT computer_id FROM reservations
+                WHERE status = 'booked' AND computer_id IN ({placeholders})
+                  AND start_time < ? AND end_time > ?
+            ''', (*computer_ids, end, start)).fetchall()
+            busy = cursor.execute(f'''
+                SELECT id FROM computers
+                WHERE id IN ({placeholders}) AND status != 'available'
+            ''', computer_ids).fetchall() if soon else []
+            clashes = sorted({r[0] for r in taken} | {r[0] for r in busy})
+            if clashes:
+                names = ', '.join(computers[c] for c in clashes)
+                raise ReservationConflict(f'Already booked or in use for that time: {names}.')
+
+            ids = []
+            for computer_id in computer_ids:
+                cursor.execute('''
+                    INSERT INTO reservations (user_id, computer_id, start_time, end_time)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, computer_id, start, end))
+                ids.append(cursor.lastrowid)
+    except sqlite3.OperationalError as e:
+        if _is_busy(e):
+            raise SessionConflict('The database is busy, please try again.') from None
+        raise
+
+    index = reservations.get(db.path)
+    if index.loaded:
+        for reservation_id, computer_id in zip(ids, computer_ids):
+            index.add(reservation_id, computer_id, start, end)
+    return ids
+
+
+def cancel_reservation(db, reservation_id, user_id=None):
+    """Cancel a booked reservation; with user_id, only if it is that user's."""
+    where, params = ('AND user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    with db.transaction() as cursor:
+        cursor.execute(f'''
+            UPDATE reservations SET status = 'cancelled'
+            WHERE id = ? AND status = 'booked' {where}
+        ''', (reservation_id, *params))
+        if cursor.rowcount == 0:
+            raise ReservationConflict('This reservation was already used or cancelled.')
+    reservations.get(db.path).remove(reservation_id)
+
+
+def upcoming_reservations(db, user_id=None):
+    """Booked reservations that are not over yet, soonest first; everyone's when user_id is None."""
+    where, params = ('AND r.user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    rows = db.query(f'''
+        SELECT r.id, r.computer_id, c.name, r.user_id, u.name, r.start_time, r.end_time
+        FROM reservations r
+        JOIN computers c ON c.id = r.computer_id
+        LEFT JOIN users u ON u.id = r.user_id
+        WHERE r.status = 'booked' AND r.end_time > CURRENT_TIMESTAMP {where}
+        ORDER BY r.start_time, c.name
+    ''', params)
+    return [
+        {'id': r[0], 'computer_id': r[1], 'computer_name': r[2], 'user_id': r[3],
+         'user_name': r[4], 'start_time': r[5], 'end_time': r[6]}
+        for r in rows
+    ]
+
+
+def computer_health(db):
+    """Latest agent heartbeat per computer, keyed by computer id.
+
+    health is 'online', 'stale' or 'offline' by the age of the last ping
+    (PCs that never pinged are left out). warning flags a computer whose
+    agent disagrees with its booking, e.g. in use but nobody logged in.
+    """
+    rows = db.query('''
+        SELECT
+            h.computer_id,
+            h.seen_at,
+            (julianday('now') - julianday(h.seen_at)) * 86400 AS age,
+            h.cpu,
+            h.ram,
+            h.logged_in,
+            c.status
+        FROM computer_heartbeats h
+        JOIN computers c ON c.id = h.computer_id
+    ''')
+    health = {}
+    for computer_id, seen_at, age, cpu, ram, logged_in, status in rows:
+        if age > config.HEARTBEAT_OFFLINE_SECONDS:
+            state = 'offline'
+        elif age > config.HEARTBEAT_STALE_SECONDS:
+            state = 'stale'
+        else:
+            state = 'online'
+        warning = None
+        if state == 'online' and status == 'in-use' and not logged_in:
+            warning = 'in use but nobody is logged in'
+        elif state == 'online' and status == 'available' and logged_in:
+            warning = 'someone is logged in without a session'
+        elif state != 'online' and status == 'in-use':
+            warning = 'in use but the PC is not responding'
+        health[computer_id] = {
+            'seen_at': seen_at,
+            'age_seconds': age,
+            'health': state,
+            'cpu': cpu,
+            'ram': ram,
+            'logged_in': bool(logged_in),
+            'warning': warning,
+        }
+    return health
+
+
+def computer_telemetry(db, computer_id, minutes=60):
+    """Per-minute agent samples for one computer over the last `minutes` minutes, oldest first."""
+    rows = db.query('''
+        SELECT minute, samples, cpu_avg, cpu_max, ram_avg, ram_max
+        FROM telemetry_minutes
+        WHERE minute >= STRFTIME('%Y-%m-%d %H:%M', 'now', ?) AND computer_id = ?
+        ORDER BY minute
+    ''', (f'-{int(minutes)} minutes', computer_id))
+    return [
+        {'minute': r[0], 'samples': r[1], 'cpu_avg': r[2], 'cpu_max': r[3], 'ram_avg': r[4], 'ram_max': r[5]}
+        for r in rows
+    ]
+
+
+def get_computer(db, computer_id):
+    row = db.query_one('SELECT id, name, specifications FROM computers WHERE id = ?', (computer_id,))
+    if row is None:
+        return None
+    return {'id': row[0], 'name': row[1], 'specifications': row[2]}
+
+
+def schedule_maintenance(db, computer_id, description, technician):
+    with db.transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO maintenance_logs
+            (computer_id, description, technician)
+            VALUES (?, ?, ?)
+        ''', (computer_id, description, technician))
+        log_id = cursor.lastrowid
+
+        cursor.execute('''
+            UPDATE computers
+            SET status = 'maintenance',
+                last_maintenance = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (computer_id,))
+
+    cache.bump()
+    _refresh_floor(db, computer_id)
+    return log_id
+
+
+def _maintenance_cursor(token):
+    # Tokens are '<id>:<maintained_at>' of the last row on the previous page.
+    try:
+        log_id, maintained_at = token.split(':', 1)
+        return int(maintained_at), int(log_id)
+    except ValueError:
+        raise ValueError(f'invalid maintenance cursor {token!r}') from None
+
+
+def maintenance_page(db, limit=10, before=None, computer_id=None, technician=None,
+                     start=None, end=None):
+    """Return one page of maintenance logs, newest first.
+
+    Pages are keyed on (maintained_at, id) rather than OFFSET, so every page
+    is an index seek: pass the returned 'next' token as `before` to get the
+    following page. start and end bound maintenance_date as [start, end).
+    """
+    clauses, params = [], []
+    if computer_id is not None:
+        clauses.append('m.computer_id = ?')
+        params.append(computer_id)
+    if technician:
+        clauses.append('m.technician = ?')
+        params.append(technician)
+    if start:
+        clauses.append("m.maintained_at >= CAST(STRFTIME('%s', ?) AS INTEGER)")
+        params.append(start)
+    if end:
+        clauses.append("m.maintained_at < CAST(STRFTIME('%s', ?) AS INTEGER)")
+        params.append(end)
+    if before:
+        clauses.append('(m.maintained_at, m.id) < (?, ?)')
+        params.extend(_maintenance_cursor(before))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    rows = db.query(f'''
+        SELECT
+            m.id,
+            m.computer_id,
+            c.name,
+            m.maintenance_date,
+            m.description,
+            m.technician,
+            m.maintained_at
+        FROM maintenance_logs m
+        JOIN computers c ON m.computer_id = c.id
+        {where}
+        ORDER BY m.maintained_at DESC, m.id DESC
+        LIMIT ?
+    ''', (*params, limit + 1))
+    records = [
+        {
+            'id': r[0],
+            'computer_id': r[1],
+            'computer_name': r[2],
+            'maintenance_date': r[3],
+            'description': r[4],
+            'technician': r[5],
+        }
+        for r in rows[:limit]
+    ]
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {
+        'records': records,
+        'next': f'{last[0]}:{last[6]}' if last else None,
+    }
+
+
+def maintenance_history(db, limit=10):
+    return maintenance_page(db, limit)['records']
+
+
+def _match_query(text):
+    # Every word the user typed must prefix-match a word of the name or email:
+    # 'jo smi' -> '"jo"* "smi"*'. Quoting each word keeps FTS5 syntax typed
+    # into the box ('-', ':', 'OR', quotes) from being read as operators.
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# Matches bm25 ranks per search. Ranking every match of a one-letter prefix
+# would score most of the member base; past this many, the oldest accounts
+# matching are ranked and the user keeps typing.
+SEARCH_RANK_CANDIDATES = 200
+
+
+def search_customers(db, text, limit=20):
+    """Customers whose name or email words start with the words in `text`, best match first.
+
+    Served from the users_fts index, so a search costs about the same with
+    a thousand members or a million.
+    """
+    match = _match_query(text or '')
+    if not match:
+        return []
+    rows = db.query('''
+        SELECT
+            u.id,
+            u.name,
+            u.email,
+            u.role,
+            u.created_at,
+            (SELECT DATETIME(MAX(s.start_at), 'unixepoch') FROM sessions s WHERE s.user_id = u.id)
+        FROM (
+            SELECT rowid, rank FROM users_fts
+            WHERE users_fts MATCH ?
+            LIMIT ?
+        ) f
+        JOIN users u ON u.id = f.rowid
+        ORDER BY f.rank
+        LIMIT ?
+    ''', (match, max(limit, SEARCH_RANK_CANDIDATES), limit))
+    return [
+        {'id': r[0], 'name': r[1], 'email': r[2], 'role': r[3], 'created_at': r[4], 'last_visit': r[5]}
+        for r in rows
+    ]
+
+
+def get_user(db, user_id):
+    row = db.query_one('SELECT id, name, email, role, created_at FROM users WHERE id = ?', (user_id,))
+    if row is None:
+        return None
+    return {'id': row[0], 'name': row[1], 'email': row[2], 'role': row[3], 'created_at': row[4]}
+
+
+def _history_cursor(token):
+    # Tokens are '<id>:<start_at>' of the last row on the previous page.
+    try:
+        session_id, start_at = token.split(':', 1)
+        return int(start_at), int(session_id)
+    except ValueError:
+        raise ValueError(f'invalid history cursor {token!r}') from None
+
+
+def customer_sessions(db, user_id, limit=20, before=None):
+    """Return one page of a customer's sessions, newest first, with their totals.
+
+    Both the page and the totals read idx_sessions_user_start, which holds
+    (user_id, start_at, cost); pass the returned 'next' token as `before`
+    for the following page. Only sessions still in the hot table are listed;
+    archived months are reached through archive.query().
+    """
+    clauses, params = ['s.user_id = ?'], [user_id]
+    if before:
+        clauses.append('(s.start_at, s.id) < (?, ?)')
+        params.extend(_history_cursor(before))
+
+    rows = db.query(f'''
+        SELECT s.id, s.computer_id, c.name, s.start_time, s.end_time, s.duration, s.cost, s.close_reason,
+               s.start_at
+        FROM sessions s
+        JOIN computers c ON c.id = s.computer_id
+        WHERE {' AND '.join(clauses)}
+        ORDER BY s.start_at DESC, s.id DESC
+        LIMIT ?
+    ''', (*params, limit + 1))
+    records = [
+        {
+            'session_id': r[0],
+            'computer_id': r[1],
+            'computer_name': r[2],
+            'start_time': r[3],
+            'end_time': r[4],
+            'duration': r[5],
+            'cost': r[6],
+            'reason': r[7],
+        }
+        for r in rows[:limit]
+    ]
+    last = rows[limit - 1] if len(rows) > limit else None
+
+    count, spent, first, latest = db.query_one('''
+        SELECT COUNT(*), COALESCE(SUM(cost), 0),
+               DATETIME(MIN(start_at), 'unixepoch'), DATETIME(MAX(start_at), 'unixepoch')
+        FROM sessions
+        WHERE user_id = ?
+    ''', (user_id,))
+    return {
+        'records': records,
+        'next': f'{last[0]}:{last[8]}' if last else None,
+        'totals': {'sessions': count, 'spent': spent, 'first_visit': first, 'last_visit': latest},
+    }
+
+
+def _days(back):
+    """Half-open [first, end) ISO dates covering today (UTC) and the `back` days before it."""
+    today = datetime.now(timezone.utc).date()
+    return (today - timedelta(days=back)).isoformat(), (today + timedelta(days=1)).isoformat()
+
+
+def floor_counts(db):
+    """(available, in maintenance) computer counts; cheap enough to read live."""
+    return db.query_one('''
+        SELECT
+            COALESCE(SUM(status = 'available'), 0),
+            COALESCE(SUM(status = 'maintenance'), 0)
+        FROM computers
+    ''')
+
+
+def dashboard_metrics(db):
+    # Both windows are [first day, tomorrow) ranges over the day key, so they
+    # are index range scans on any table keyed by day.
+    today, tomorrow = _days(0)
+    today_sessions, today_revenue = db.query_one('''
+        SELECT COALESCE(SUM(session_count), 0), COALESCE(SUM(revenue), 0)
+        FROM daily_stats
+        WHERE day >= ? AND day < ?
+    ''', (today, tomorrow))
+    available, maintenance = floor_counts(db)
+
+    usage_data = db.query('''
+        SELECT
+            day as date,
+            session_count,
+            revenue as daily_revenue
+        FROM daily_stats
+        WHERE day >= ? AND day < ?
+        ORDER BY day
+    ''', _days(30))
+
+    usage_dist = db.query('''
+        SELECT
+            c.name,
+            COALESCE(cs.session_count, 0) as session_count
+        FROM computers c
+        LEFT JOIN computer_stats cs ON c.id = cs.computer_id
+    ''')
+
+    return {
+        'today_sessions': today_sessions,
+        'today_revenue': today_revenue,
+        'available_computers': available,
+        'maintenance_count': maintenance,
+        'usage_data': [list(r) for r in usage_data],
+        'usage_dist': [list(r) for r in usage_dist],
+    }
+
+
+# granularity -> (rollup table, its key column, bucket expression over it,
+# approximate bucket length in days), finest first
+TREND_BUCKETS = {
+    'hour': ('hourly_stats', 'hour', 'hour', 1 / 24),
+    'day': ('daily_stats', 'day', 'day', 1),
+    # Weeks start on Monday
+    'week': ('daily_stats', 'day', "DATE(day, '-' || ((STRFTIME('%w', day) + 6) % 7) || ' days')", 7),
+    'month': ('daily_stats', 'day', "SUBSTR(day, 1, 7) || '-01'", 30.4),
+}
+
+
+def usage_trends(db, start, end, granularity='day', max_points=None):
+    """Session counts and revenue per bucket for start times in [start, end).
+
+    Aggregated in SQL from the rollup tables, so the cost depends on the
+    number of buckets rather than sessions. A range too long for
+    `max_points` buckets at the requested granularity moves up to the next
+    coarser one (hours to days, ...); past months, every `stride`
+    neighbouring buckets are summed into one point labelled with the first.
+    Returns the granularity used, stride and points ([bucket,
+    session_count, revenue] rows).
+    """
+    if granularity not in TREND_BUCKETS:
+        raise ValueError(f'unknown granularity {granularity!r}')
+    max_points = max_points or config.TREND_MAX_POINTS
+    days = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() / 86400
+    names = list(TREND_BUCKETS)
+    for granularity in names[names.index(granularity):]:
+        if days / TREND_BUCKETS[granularity][3] <= max_points:
+            break
+    table, column, bucket, _ = TREND_BUCKETS[granularity]
+
+    rows = db.query(f'''
+        WITH buckets AS (
+            SELECT {bucket} AS bucket, SUM(session_count) AS sessions, SUM(revenue) AS revenue
+            FROM {table}
+            WHERE {column} >= ? AND {column} < ?
+            GROUP BY 1
+        ),
+        numbered AS (
+            SELECT
+                bucket,
+                sessions,
+                revenue,
+                ROW_NUMBER() OVER (ORDER BY bucket) - 1 AS n,
+                (COUNT(*) OVER () + ? - 1) / ? AS stride
+            FROM buckets
+        )
+        SELECT MIN(bucket), SUM(sessions), SUM(revenue), MAX(stride)
+        FROM numbered
+        GROUP BY n / stride
+        ORDER BY 1
+    ''', (start, end, max_points, max_points))
+    return {
+        'granularity': granularity,
+        'stride': rows[0][3] if rows else 1,
+        'points': [[r[0], r[1], r[2]] for r in rows],
+    }
+
+
+def computer_usage(db, start, end, limit=None):
+    """[name, session_count] per computer for start days in [start, end), busiest first."""
+    rows = db.query('''
+        SELECT c.name, COALESCE(SUM(s.session_count), 0) AS sessions
+        FROM computers c
+        LEFT JOIN computer_daily_stats s
+            ON s.computer_id = c.id AND s.day >= ? AND s.day < ?
+        GROUP BY c.id
+        ORDER BY sessions DESC, c.name
+        LIMIT ?
+    ''', (start, end, limit or config.TREND_MAX_POINTS))
+    return [list(r) for r in rows]
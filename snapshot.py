@@ -0,0 +1,178 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import archive
+import cache
+import config
+import migrations
+from db import Database
+
+# Read-only analytics copy of the database. The dashboard and exports read
+# this file through their own connection pool, so a long report neither
+# holds one of the primary's connections nor keeps a read transaction open
+# on it (which stalls WAL checkpoints while check-ins keep writing). A
+# background thread retakes the copy with SQLite's online backup API after
+# enough writes or once it gets too old; the new copy is written under a
+# temporary name and renamed over the old one, so readers always see a
+# complete file.
+
+CHECK_SECONDS = 1
+
+
+def snapshot_path(db_path, directory=None):
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    directory = directory or config.SNAPSHOT_DIR or os.path.dirname(os.path.abspath(db_path))
+    return os.path.join(directory, f'{name}.analytics.db')
+
+
+class Snapshot:
+    def __init__(self, db, path=None):
+        self.db = db
+        self.path = path or snapshot_path(db.path)
+        self._refresh_lock = threading.Lock()
+        self._reader = None
+        # Bumped on every new copy; cached reports use it as their key
+        self.version = 0
+        self.taken_at = None
+        self._generation = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def database(self):
+        """Return the read-only Database over the snapshot, taking the first copy if needed."""
+        if self._reader is None:
+            with self._refresh_lock:
+                if self._reader is None and not self._adopt():
+                    self._refresh()
+        if self._thread is None:
+            self.start()
+        return self._reader
+
+    def age(self):
+        """Seconds since the copy was taken, or None before the first one."""
+        return None if self.taken_at is None else time.time() - self.taken_at
+
+    def _adopt(self):
+        # Reuse a copy left by an earlier run (or another process) if it is
+        # recent enough and has the current schema.
+        if not os.path.exists(self.path):
+            return False
+        taken_at = os.path.getmtime(self.path)
+        if time.time() - taken_at > config.SNAPSHOT_MAX_AGE_SECONDS:
+            return False
+        reader = Database(self.path, read_only=True, archive_dir=archive.directory_of(self.db))
+        try:
+            if migrations.schema_version(reader) != migrations.SCHEMA_VERSION:
+                reader.close()
+                return False
+        except sqlite3.Error:
+            reader.close()
+            return False
+        self._swap(reader, taken_at, cache.generation())
+        return True
+
+    def refresh(self):
+        """Take a fresh copy now."""
+        with self._refresh_lock:
+            self._refresh()
+
+    def _refresh(self):
+        generation = cache.generation()
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            target = sqlite3.connect(tmp)
+            try:
+                with self.db.connection() as source:
+                    # All pages in one step: that is a single read transaction,
+                    # which under WAL never blocks writers. Copying in smaller
+                    # steps would restart from scratch whenever a write landed
+                    # in between.
+                    source.backup(target)
+                # A plain rollback-journal file can be opened read-only
+                # without the -wal and -shm files a WAL copy would need.
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+            os.replace(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._swap(Database(self.path, read_only=True, archive_dir=archive.directory_of(self.db)),
+                   time.time(), generation)
+
+    def _swap(self, reader, taken_at, generation):
+        # A query still running on the old copy finishes on the file it
+        # opened; its connection goes away with the old pool.
+        old, self._reader = self._reader, reader
+        self.taken_at = taken_at
+        self._generation = generation
+        self.version += 1
+        if old is not None:
+            old.close()
+
+    def stale(self):
+        """True once the copy is too old, or enough writes have landed since it was taken."""
+        age = self.age()
+        if age is None:
+            return True
+        writes = cache.generation() - self._generation
+        return (age >= config.SNAPSHOT_MAX_AGE_SECONDS
+                or (writes >= config.SNAPSHOT_REFRESH_WRITES and age >= config.SNAPSHOT_MIN_INTERVAL_SECONDS))
+
+    def _run(self):
+        while not self._stop.wait(CHECK_SECONDS):
+            if self.stale():
+                try:
+                    self.refresh()
+                except (sqlite3.Error, OSError):
+                    pass  # keep serving the previous copy; retried on the next check
+
+    def start(self):
+        with self._refresh_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='analytics-snapshot', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._refresh_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get(db):
+    """Return the shared Snapshot of a Database."""
+    with _snapshots_lock:
+        if db.path not in _snapshots:
+            _snapshots[db.path] = Snapshot(db)
+        return _snapshots[db.path]
+
+
+def stop_all():
+    with _snapshots_lock:
+        snapshots = list(_snapshots.values())
+    for snapshot in snapshots:
+        snapshot.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Take the read-only analytics copy of the database now.')
+    parser.add_argument('--db', default=config.DB_PATH)
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    migrations.migrate(db)
+    snapshot = Snapshot(db)
+    started = time.perf_counter()
+    snapshot.refresh()
+    print(f'{snapshot.path}: copied in {time.perf_counter() - started:.2f}s')
+    db.close()
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from bench import _summary
+
+# Times the Streamlit script itself rather than its queries: a cold start in
+# a fresh interpreter (what a kiosk restart costs) and warm reruns (what
+# every click costs), for the login page and the Dashboard:
+#
+#     python startup_bench.py --cold 5 --repeat 30 --output startup.json
+#
+# Each start runs in its own interpreter against a temporary copy of the
+# database, so the run never touches the original.
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+HEAVY_MODULES = ('pandas', 'plotly', 'pyarrow', 'numpy')
+ADMIN = {'id': 1, 'name': 'Bench', 'email': 'bench@example.com', 'role': 'admin'}
+
+# Run in a fresh interpreter; prints one JSON line.
+_RUN = '''
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+framework = time.perf_counter()
+preloaded = set(sys.modules)
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+if sys.argv[2] == 'dashboard':
+    at.session_state['user'] = json.loads(sys.argv[3])
+at.run()
+done = time.perf_counter()
+loaded = [m for m in json.loads(sys.argv[4]) if m in sys.modules and m not in preloaded]
+reruns = []
+for _ in range(int(sys.argv[5])):
+    before = time.perf_counter()
+    at.run()
+    reruns.append((time.perf_counter() - before) * 1000)
+print(json.dumps({
+    'framework_ms': (framework - start) * 1000,
+    'first_run_ms': (done - framework) * 1000,
+    'rerun_ms': reruns,
+    'errors': [str(e.value) for e in at.exception],
+    'modules': loaded,
+}))
+'''
+
+
+def measure(page, cold, repeat, env):
+    """Start the app `cold` times in fresh interpreters; rerun it `repeat` times in the last."""
+    first, framework, rerun, modules = [], [], [], set()
+    for i in range(cold):
+        result = subprocess.run(
+            [sys.executable, '-c', _RUN, APP, page, json.dumps(ADMIN), json.dumps(HEAVY_MODULES),
+             str(repeat if i == cold - 1 else 0)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        if run['errors']:
+            raise RuntimeError(f'{page} failed: {run["errors"]}')
+        first.append(run['first_run_ms'])
+        framework.append(run['framework_ms'])
+        rerun.extend(run['rerun_ms'])
+        modules.update(run['modules'])
+    return {
+        'framework_import': _summary(framework),
+        'first_run': _summary(first),
+        'rerun': _summary(rerun) if rerun else None,
+        # Heavy libraries the page itself pulled in on its first run
+        'heavy_modules_loaded': sorted(modules),
+    }
+
+
+def run(db_path, cold, repeat):
+    workdir = tempfile.mkdtemp(prefix='startup_bench_')
+    try:
+        db_copy = os.path.join(workdir, 'cyber_cafe.db')
+        if os.path.exists(db_path):
+            shutil.copy(db_path, db_copy)
+        env = dict(os.environ, CYBER_CAFE_DB=db_copy, CYBER_CAFE_METRICS_PATH='',
+                   CYBER_CAFE_ARCHIVE_DIR=os.path.join(workdir, 'archive'))
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cold_runs': cold,
+            'repeat': repeat,
+            'results': {},
+        }
+        for page in ('login', 'dashboard'):
+            report['results'][page] = measure(page, cold, repeat, env)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark Streamlit cold start and rerun time.')
+    parser.add_argument('--db', default='cyber_cafe.db', help='database to copy for the run')
+    parser.add_argument('--cold', type=int, default=5, help='fresh-interpreter starts per page (at least 1)')
+    parser.add_argument('--repeat', type=int, default=30, help='warm reruns per page')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    report = run(args.db, args.cold, args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,109 @@
+import argparse
+import logging
+import sqlite3
+import threading
+import time
+
+import config
+import migrations
+import services
+from db import Database
+
+# Closes forgotten sessions in the background (see services.sweep_sessions
+# for the rules). The app and the API each start one per database; running
+# both, or this module as its own process, is safe because every sweep
+# re-checks the open sessions inside its own write transaction. Each close
+# is logged, and recorded on the session as its close_reason.
+
+logger = logging.getLogger('cyber_cafe.sweeper')
+
+
+class Sweeper:
+    def __init__(self, db, interval=None):
+        self.db = db
+        self.interval = config.SWEEP_INTERVAL_SECONDS if interval is None else interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.swept = 0
+        self.last_run = None
+
+    def run_once(self):
+        closed = services.sweep_sessions(self.db)
+        for session in closed:
+            logger.info(
+                'closed session %s on %s (%s): %s, %.2f h, %.2f',
+                session['session_id'], session['computer_name'], session['user_name'] or 'unknown',
+                session['reason'], session['duration'], session['cost'],
+            )
+        self.swept += len(closed)
+        self.last_run = time.time()
+        return closed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except sqlite3.Error:
+                logger.exception('sweep failed; retrying next interval')
+
+    def start(self):
+        if not self.interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+
+_sweepers = {}
+_sweepers_lock = threading.Lock()
+
+
+def get(db):
+    """Return the shared Sweeper for a Database."""
+    with _sweepers_lock:
+        if db.path not in _sweepers:
+            _sweepers[db.path] = Sweeper(db)
+        return _sweepers[db.path]
+
+
+def stop_all():
+    with _sweepers_lock:
+        sweepers = list(_sweepers.values())
+    for sweeper in sweepers:
+        sweeper.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Close idle, overdue and overlong sessions.')
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--once', action='store_true', help='sweep once and exit')
+    parser.add_argument('--interval', type=float, default=config.SWEEP_INTERVAL_SECONDS or 60)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    db = Database(args.db)
+    migrations.migrate(db)
+    sweeper = Sweeper(db, args.interval)
+    try:
+        sweeper.run_once()
+        while not args.once:
+            time.sleep(args.interval)
+            try:
+                sweeper.run_once()
+            except sqlite3.Error:
+                logger.exception('sweep failed; retrying next interval')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f'{args.db}: closed {sweeper.swept} sessions')
+        db.close()